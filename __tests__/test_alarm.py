@@ -4,6 +4,7 @@ from time import sleep
 from datetime import datetime, timedelta
 import pytest, pytest_mock
 from move_alarm.components.alarm import Alarm
+import move_alarm.components.alarm as alarm_module
 import move_alarm.datatypes as datatype
 
 
@@ -418,6 +419,29 @@ class TestAlarm:
             delta = snoozed_time - non_snoozed_time
             assert delta.seconds == self.config.snooze_duration.seconds
 
+        @pytest.mark.usefixtures("Mock Alarm.is_set to True")
+        def test_if_sound_not_playing_the_countdown_is_postponed(self):
+            alarm = Alarm()
+            alarm._interval = alarm._remaining = 60
+
+            alarm.snooze_alarm()
+
+            assert alarm._remaining == 60 + self.config.snooze_duration.seconds
+
+        @pytest.mark.usefixtures("Mock Alarm.is_set to True")
+        def test_if_sound_not_playing_a_reschedule_keeps_the_snooze(self):
+            alarm = Alarm()
+            alarm._interval, alarm._remaining = 120, 60
+
+            alarm.snooze_alarm()
+            alarm.reschedule({"wait_duration"})
+
+            assert alarm._remaining == (
+                self.config.wait_duration.seconds
+                - 60
+                + self.config.snooze_duration.seconds
+            )
+
         @pytest.mark.usefixtures("Mock Alarm.is_set to True")
         @pytest.mark.usefixtures("Mock time.sleep")
         @pytest.mark.usefixtures("Mock sounds.play_sound to keep thread alive 1ms")
@@ -596,3 +620,121 @@ class TestAlarm:
 
             mock_stop_sound.assert_called_once()
             assert sounding_alarm_removed == "Result from stop_sound()"
+
+    @pytest.mark.usefixtures("Mock Context")
+    class TestReschedule:
+
+        @pytest.fixture
+        def pending_alarm(self, monkeypatch: pytest.MonkeyPatch):
+            monkeypatch.setattr(Alarm, "is_set", property(lambda self: True))
+
+            def _pending_alarm(interval: int, remaining: int) -> Alarm:
+                alarm = Alarm()
+                alarm._interval = interval
+                alarm._remaining = remaining
+                alarm._snoozed = False
+                return alarm
+
+            return _pending_alarm
+
+        def test_a_longer_wait_duration_extends_the_pending_alarm(self, pending_alarm):
+            # 40 of 60 seconds have passed and the mock config now waits 3 minutes
+            alarm = pending_alarm(60, 20)
+
+            alarm.reschedule({"wait_duration"})
+
+            assert alarm._interval == 180
+            assert alarm._remaining == 140
+
+        def test_a_shorter_wait_duration_never_goes_below_zero(self, pending_alarm):
+            alarm = pending_alarm(600, 100)
+
+            alarm.reschedule({"wait_duration"})
+
+            assert alarm._remaining == 0
+
+        def test_ignores_unrelated_changes(self, pending_alarm):
+            alarm = pending_alarm(60, 20)
+
+            alarm.reschedule({"reminder_text"})
+
+            assert alarm._remaining == 20
+
+        def test_the_countdown_picks_up_an_edited_config_file(
+            self,
+            monkeypatch: pytest.MonkeyPatch,
+            mocker: pytest_mock.MockerFixture,
+            wait_for_separate_threads,
+        ):
+            alarm = Alarm()
+
+            class EditedConfig(datatype.Config):
+                def reload_if_changed(self) -> bool:
+                    # As if the file now waits 0 seconds, notifying on_change
+                    self.wait_duration = timedelta(seconds=0)
+                    alarm.reschedule({"wait_duration"})
+                    return True
+
+            config = EditedConfig(**vars(alarm_module.use_context().config))
+            contexts = datatype.Contexts(datatype.OauthObject(), config)
+            monkeypatch.setattr(
+                "move_alarm.components.alarm.use_context", lambda: contexts
+            )
+            monkeypatch.setattr("time.sleep", lambda *args: sleep(0.001))
+            mock_play_sound = mocker.patch.object(Alarm._sounds, "play_sound")
+            alarm._snoozed = False
+
+            thread = threading.Thread(target=alarm.thread_alarm, args=[3600])
+            thread.name = "MoveAlarm"
+            thread.start()
+            thread.join(timeout=5)
+            wait_for_separate_threads()
+
+            mock_play_sound.assert_called_once()
+            assert alarm._interval == 0
+
+        def test_listens_for_config_changes_once(
+            self, monkeypatch: pytest.MonkeyPatch, mocker: pytest_mock.MockerFixture
+        ):
+            config = alarm_module.use_context().config
+            spy_on_change = mocker.spy(config, "on_change")
+            monkeypatch.setattr(Alarm, "is_set", property(lambda self: False))
+            mocker.patch("threading.Thread")
+            alarm = Alarm()
+
+            alarm.set_alarm()
+            alarm.set_alarm()
+            alarm.set_alarm(snooze=True)
+
+            spy_on_change.assert_called_once_with(alarm.reschedule)
+
+        def test_remove_alarm_stops_listening(
+            self, monkeypatch: pytest.MonkeyPatch, mocker: pytest_mock.MockerFixture
+        ):
+            config = alarm_module.use_context().config
+            spy_remove_listener = mocker.spy(config, "remove_listener")
+            monkeypatch.setattr(Alarm, "is_set", property(lambda self: False))
+            mocker.patch("threading.Thread")
+            alarm = Alarm()
+
+            alarm.set_alarm()
+            alarm.remove_alarm()
+
+            spy_remove_listener.assert_called_once_with(alarm.reschedule)
+
+        def test_each_alarm_has_its_own_lock(self):
+            first, second = Alarm(), Alarm()
+
+            with first._lock:
+                assert second._lock.acquire(blocking=False) is True
+                second._lock.release()
+
+        def test_updates_the_time_property(self, pending_alarm):
+            alarm = pending_alarm(60, 20)
+
+            alarm.reschedule({"wait_duration"})
+
+            expected = (datetime.now() + timedelta(seconds=140)).strftime(
+                "%d/%m/%Y %H:%M:%S"
+            )
+            assert alarm.time.strftime("%d/%m/%Y %H:%M:%S") == expected
@@ -0,0 +1,487 @@
+import hashlib, io, os, wave
+import requests
+import pytest
+from move_alarm.utils.api_calls import (
+    freesound_breaker,
+    download_sound,
+    download_sound_parallel,
+    merge_theme_results,
+    search_for_sounds,
+    search_for_sounds_by_theme,
+)
+from move_alarm.utils.bandwidth import BandwidthBudget
+from move_alarm.utils.circuit_breaker import CircuitBreaker
+from move_alarm.utils.rate_limit import TokenBucket
+import move_alarm.datatypes as datatype
+
+
+def make_wav(frames: bytes = bytes(100)) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(8000)
+        wav.writeframes(frames)
+    return buffer.getvalue()
+
+
+@pytest.fixture(autouse=True)
+def unlimited_freesound_bucket(monkeypatch: pytest.MonkeyPatch):
+    # Keeps the suite off the shared on-disk bucket that rate limits real calls
+    monkeypatch.setattr(
+        "move_alarm.utils.api_calls.freesound_bucket", TokenBucket(1000.0, 1000.0)
+    )
+
+
+@pytest.fixture(autouse=True)
+def in_memory_download_budget(monkeypatch: pytest.MonkeyPatch):
+    # Keeps the suite's downloads out of the real daily budget on disk
+    monkeypatch.setattr("move_alarm.utils.download_budget", BandwidthBudget(0))
+
+
+class TestApiCalls:
+
+    @property
+    def new_sound_path(self) -> str:
+        return os.path.join(
+            os.path.dirname(__file__)[:-9], "move_alarm", "assets", "mock_sound.wav"
+        )
+
+    @pytest.fixture(name="Remove mock_sounds.wav file", autouse=True)
+    def remove_mock_sounds_file(self):
+        for path in [self.new_sound_path, self.new_sound_path + ".part"]:
+            if os.path.exists(path):
+                os.remove(path)
+
+        yield
+
+        for path in [self.new_sound_path, self.new_sound_path + ".part"]:
+            if os.path.exists(path):
+                os.remove(path)
+
+    @pytest.fixture
+    def mock_sound_server(self, monkeypatch: pytest.MonkeyPatch):
+        """Serves body, dropping the connection after drop_after bytes on the first request"""
+
+        def _mock_sound_server(
+            body: bytes, drop_after: int | None = None, accept_ranges: bool = False
+        ):
+            requests_made: list[dict[str, str]] = []
+
+            class MockResponse:
+                def __init__(self, headers: dict[str, str]):
+                    self.start = 0
+                    if "Range" in headers:
+                        self.start = int(headers["Range"][6:-1])
+
+                @property
+                def status_code(self):
+                    return 206 if self.start > 0 else 200
+
+                @property
+                def headers(self):
+                    remaining = len(body) - self.start
+                    headers = {"Content-Length": str(remaining)}
+                    if accept_ranges:
+                        headers["Accept-Ranges"] = "bytes"
+                    if self.start > 0:
+                        headers["Content-Range"] = (
+                            f"bytes {self.start}-{len(body) - 1}/{len(body)}"
+                        )
+                    return headers
+
+                @property
+                def url(self):
+                    return "final url"
+
+                def raise_for_status(self):
+                    return None
+
+                def close(self):
+                    return None
+
+                def iter_content(self, chunk_size=1):
+                    data = body[self.start :]
+                    if drop_after is not None and len(requests_made) == 1:
+                        yield data[:drop_after]
+                        raise requests.exceptions.ChunkedEncodingError("Mock drop")
+                    yield data
+
+                def __enter__(self):
+                    return self
+
+                def __exit__(self, *args):
+                    return False
+
+            def mock_get(url, headers={}, **kwargs):
+                requests_made.append(headers)
+                return MockResponse(headers)
+
+            monkeypatch.setattr("requests.get", mock_get)
+
+            return requests_made
+
+        return _mock_sound_server
+
+    @pytest.fixture
+    def mock_range_session(self, monkeypatch: pytest.MonkeyPatch):
+        def _mock_range_session(body: bytes):
+            ranges_requested: list[str] = []
+
+            class MockResponse:
+                def __init__(self, byte_range: str):
+                    start, end = byte_range[6:].split("-")
+                    self.data = body[int(start) : int(end) + 1]
+
+                @property
+                def status_code(self):
+                    return 206
+
+                def raise_for_status(self):
+                    return None
+
+                def iter_content(self, chunk_size=1):
+                    for index in range(0, len(self.data), 1000):
+                        yield self.data[index : index + 1000]
+
+                def __enter__(self):
+                    return self
+
+                def __exit__(self, *args):
+                    return False
+
+            class MockSession:
+                def get(self, url, headers={}, **kwargs):
+                    ranges_requested.append(headers["Range"])
+                    return MockResponse(headers["Range"])
+
+            monkeypatch.setattr(
+                "move_alarm.utils.api_calls.get_session", lambda: MockSession()
+            )
+            monkeypatch.setattr("move_alarm.utils.api_calls.MIN_RANGE_SIZE", 4096)
+
+            return ranges_requested
+
+        return _mock_range_session
+
+    class TestDownloadSound:
+
+        @property
+        def new_sound_path(self) -> str:
+            return TestApiCalls.new_sound_path.fget(self)
+
+        def test_writes_the_complete_file_to_new_path(self, mock_sound_server):
+            mock_sound_server(make_wav())
+
+            download_sound("token", "url", self.new_sound_path)
+
+            with open(self.new_sound_path, "rb") as file:
+                assert file.read() == make_wav()
+            assert os.path.exists(self.new_sound_path + ".part") is False
+
+        def test_resumes_from_the_last_byte_after_a_dropped_connection(
+            self, mock_sound_server
+        ):
+            body = make_wav(bytes(range(0, 200)))
+            requests_made = mock_sound_server(body, drop_after=50)
+
+            download_sound("token", "url", self.new_sound_path)
+
+            assert len(requests_made) == 2
+            assert requests_made[1]["Range"] == "bytes=50-"
+            with open(self.new_sound_path, "rb") as file:
+                assert file.read() == body
+
+        def test_partial_file_is_never_visible_at_new_path(self, mock_sound_server):
+            mock_sound_server(make_wav(bytes(200)), drop_after=50)
+
+            with pytest.raises(requests.exceptions.ChunkedEncodingError):
+                download_sound("token", "url", self.new_sound_path, attempts=1)
+
+            assert os.path.exists(self.new_sound_path) is False
+            assert os.path.getsize(self.new_sound_path + ".part") == 50
+
+        def test_returns_the_sha256_of_the_file(self, mock_sound_server):
+            mock_sound_server(make_wav())
+
+            digest = download_sound("token", "url", self.new_sound_path)
+
+            assert digest == hashlib.sha256(make_wav()).hexdigest()
+
+        def test_resumed_downloads_hash_the_whole_file(self, mock_sound_server):
+            body = make_wav(bytes(range(0, 200)))
+            mock_sound_server(body, drop_after=50)
+
+            digest = download_sound("token", "url", self.new_sound_path)
+
+            assert digest == hashlib.sha256(body).hexdigest()
+
+        def test_aborts_an_html_error_page_on_the_first_chunk(self, mock_sound_server):
+            requests_made = mock_sound_server(
+                b"<!DOCTYPE html><html>Service Unavailable</html>" + bytes(1000)
+            )
+
+            with pytest.raises(datatype.InvalidSoundError):
+                download_sound("token", "url", self.new_sound_path)
+
+            assert len(requests_made) == 1
+            assert os.path.exists(self.new_sound_path) is False
+            assert os.path.exists(self.new_sound_path + ".part") is False
+
+        def test_rejects_a_non_pcm_wav(self, mock_sound_server):
+            body = bytearray(make_wav())
+            body[20:22] = (85).to_bytes(2, "little")
+            mock_sound_server(bytes(body))
+
+            with pytest.raises(datatype.InvalidSoundError):
+                download_sound("token", "url", self.new_sound_path)
+
+            assert os.path.exists(self.new_sound_path) is False
+
+        def test_rejects_a_body_that_ends_before_the_header(self, mock_sound_server):
+            mock_sound_server(make_wav()[:10])
+
+            with pytest.raises(datatype.InvalidSoundError):
+                download_sound("token", "url", self.new_sound_path)
+
+            assert os.path.exists(self.new_sound_path) is False
+
+        def test_counts_downloaded_bytes_against_the_budget(self, mock_sound_server):
+            mock_sound_server(make_wav())
+            budget = BandwidthBudget(1000)
+
+            download_sound("token", "url", self.new_sound_path, budget=budget)
+
+            assert budget.usage().used == len(make_wav())
+
+        def test_refuses_a_file_larger_than_the_remaining_budget(
+            self, mock_sound_server
+        ):
+            mock_sound_server(make_wav())
+            budget = BandwidthBudget(50)
+
+            with pytest.raises(datatype.BandwidthBudgetError):
+                download_sound("token", "url", self.new_sound_path, budget=budget)
+
+            assert budget.usage().used == 0
+            assert os.path.exists(self.new_sound_path) is False
+
+        def test_throttles_every_chunk(self, mock_sound_server):
+            mock_sound_server(make_wav(bytes(200)), drop_after=50)
+            taken = []
+
+            class MockThrottle:
+                def acquire(self, tokens):
+                    taken.append(tokens)
+
+            download_sound("token", "url", self.new_sound_path, throttle=MockThrottle())
+
+            assert sum(taken) == len(make_wav(bytes(200)))
+
+    class TestDownloadSoundParallel:
+
+        @property
+        def new_sound_path(self) -> str:
+            return TestApiCalls.new_sound_path.fget(self)
+
+        def test_assembles_ranges_into_the_complete_file(self, mock_range_session):
+            body = os.urandom(100_000)
+            ranges_requested = mock_range_session(body)
+            temp_path = self.new_sound_path + ".part"
+
+            download_sound_parallel("token", "url", temp_path, len(body), workers=3)
+
+            assert len(ranges_requested) > 1
+            with open(temp_path, "rb") as file:
+                assert file.read() == body
+
+        def test_is_used_by_download_sound_for_large_files(
+            self, monkeypatch: pytest.MonkeyPatch, mock_sound_server
+        ):
+            body = make_wav(bytes(56))
+            mock_sound_server(body, accept_ranges=True)
+            calls = []
+
+            def mock_download_sound_parallel(token, url, temp_path, size):
+                calls.append((url, size))
+                with open(temp_path, "wb") as file:
+                    file.write(body)
+                return True
+
+            monkeypatch.setattr(
+                "move_alarm.utils.api_calls.download_sound_parallel",
+                mock_download_sound_parallel,
+            )
+
+            download_sound("token", "url", self.new_sound_path, parallel_threshold=50)
+
+            assert calls == [("final url", 100)]
+            assert os.path.getsize(self.new_sound_path) == 100
+
+        def test_is_not_used_below_the_threshold(
+            self, monkeypatch: pytest.MonkeyPatch, mock_sound_server
+        ):
+            mock_sound_server(make_wav(bytes(56)), accept_ranges=True)
+            calls = []
+            monkeypatch.setattr(
+                "move_alarm.utils.api_calls.download_sound_parallel",
+                lambda *args: calls.append(args),
+            )
+
+            download_sound("token", "url", self.new_sound_path, parallel_threshold=500)
+
+            assert calls == []
+
+    class TestSearchForSoundsByTheme:
+
+        @pytest.fixture
+        def mock_search_for_sounds(self, monkeypatch: pytest.MonkeyPatch):
+            searched: list[list[str]] = []
+
+            def _mock_search_for_sounds(token, themes=[], session=None, filters=None):
+                searched.append(themes)
+                if themes == ["broken"]:
+                    raise ConnectionError("Mock error")
+                offset = {"piano": 0, "guitar": 100, "rain": 200}[themes[0]]
+                return [{"id": offset + index} for index in range(0, 3)]
+
+            monkeypatch.setattr(
+                "move_alarm.utils.api_calls.search_for_sounds", _mock_search_for_sounds
+            )
+
+            return searched
+
+        def test_runs_one_search_per_theme(self, mock_search_for_sounds):
+            search_for_sounds_by_theme("token", ["piano", "guitar", "rain"])
+
+            assert sorted(mock_search_for_sounds) == [["guitar"], ["piano"], ["rain"]]
+
+        def test_results_alternate_between_themes(self, mock_search_for_sounds):
+            results = search_for_sounds_by_theme("token", ["piano", "guitar"])
+
+            assert [result["id"] for result in results] == [0, 100, 1, 101, 2, 102]
+
+        def test_a_failed_theme_does_not_lose_the_others(self, mock_search_for_sounds):
+            results = search_for_sounds_by_theme("token", ["piano", "broken"])
+
+            assert [result["id"] for result in results] == [0, 1, 2]
+
+        def test_raises_if_every_theme_fails(self, mock_search_for_sounds):
+            with pytest.raises(ConnectionError):
+                search_for_sounds_by_theme("token", ["broken", "broken"])
+
+    class TestMergeThemeResults:
+
+        def test_removes_duplicate_ids(self):
+            merged = merge_theme_results(
+                [[{"id": 1}, {"id": 2}], [{"id": 2}, {"id": 3}, {"id": 4}]]
+            )
+
+            assert [result["id"] for result in merged] == [1, 3, 2, 4]
+
+        def test_gives_every_theme_an_equal_share(self):
+            merged = merge_theme_results(
+                [[{"id": index} for index in range(0, 15)], [{"id": 100}, {"id": 101}]]
+            )
+
+            assert [result["id"] for result in merged] == [0, 100, 1, 101]
+
+        def test_themes_without_results_are_left_out(self):
+            merged = merge_theme_results([[], [{"id": 1}, {"id": 2}]])
+
+            assert [result["id"] for result in merged] == [1, 2]
+
+    class TestSearchErrors:
+
+        @pytest.fixture
+        def mock_search_status(self, monkeypatch: pytest.MonkeyPatch):
+            freesound_breaker.reset()
+
+            def _mock_search_status(status: int):
+                class MockResponse:
+                    text = f"Mock {status}"
+
+                    @property
+                    def status_code(self):
+                        return status
+
+                monkeypatch.setattr(
+                    "requests.get", lambda url, **kwargs: MockResponse()
+                )
+
+            yield _mock_search_status
+
+            freesound_breaker.reset()
+
+        def test_a_refused_search_does_not_trip_the_breaker(self, mock_search_status):
+            mock_search_status(401)
+
+            for _ in range(0, freesound_breaker.failure_threshold + 1):
+                with pytest.raises(ConnectionRefusedError):
+                    search_for_sounds("expired token", ["piano"])
+
+            assert freesound_breaker.state == CircuitBreaker.CLOSED
+
+        def test_server_errors_trip_the_breaker(self, mock_search_status):
+            mock_search_status(500)
+
+            for _ in range(0, freesound_breaker.failure_threshold):
+                with pytest.raises(ConnectionError):
+                    search_for_sounds("token", ["piano"])
+
+            assert freesound_breaker.state == CircuitBreaker.OPEN
+
+    class TestSearchFilters:
+
+        @pytest.fixture
+        def mock_search_request(self, monkeypatch: pytest.MonkeyPatch):
+            urls: list[str] = []
+
+            class MockResponse:
+                @property
+                def status_code(self):
+                    return 200
+
+                def json(self):
+                    return {"count": 0, "previous": None, "next": None, "results": []}
+
+            def mock_get(url, **kwargs):
+                urls.append(url)
+                return MockResponse()
+
+            monkeypatch.setattr("requests.get", mock_get)
+
+            return urls
+
+        def test_filters_are_pushed_into_the_query(self, mock_search_request):
+            filters = datatype.SoundFilters(48000, 16, 2, 1000)
+
+            search_for_sounds("token", ["piano"], filters=filters)
+
+            url = mock_search_request[0]
+            assert "samplerate:[*%20TO%2048000]" in url
+            assert "bitdepth:[*%20TO%2016]" in url
+            assert "channels:[*%20TO%202]" in url
+            assert "filesize:[*%20TO%201000]" in url
+            assert "description:(piano)" in url
+
+        def test_filter_fields_are_requested(self, mock_search_request):
+            search_for_sounds("token", ["piano"])
+
+            fields = mock_search_request[0].split("&fields=")[1].split(",")
+            for field in ["samplerate", "bitdepth", "channels", "filesize"]:
+                assert field in fields
+
+        def test_a_zero_limit_is_not_filtered(self, mock_search_request):
+            filters = datatype.SoundFilters(max_filesize=0)
+
+            search_for_sounds("token", [], filters=filters)
+
+            assert "filesize:" not in mock_search_request[0].split("&fields=")[0]
+
+        def test_allows_rejects_sounds_over_a_limit(self):
+            filters = datatype.SoundFilters(48000, 16, 2, 1000)
+
+            assert filters.allows({"samplerate": 44100, "bitdepth": 16}) is True
+            assert filters.allows({"samplerate": 96000}) is False
+            assert filters.allows({"filesize": 1001}) is False
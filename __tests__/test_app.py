@@ -0,0 +1,154 @@
+import shutil, tempfile, threading
+import pytest
+from move_alarm import app, control
+import move_alarm.datatypes as datatype
+
+
+class TestApp:
+
+    @pytest.fixture
+    def sent(self, monkeypatch: pytest.MonkeyPatch) -> list[tuple[str, list[str]]]:
+        sent: list[tuple[str, list[str]]] = []
+
+        def mock_send_command(command, args=None, address=None, timeout=5.0):
+            sent.append((command, args))
+            return control.make_response(True, f"{command} done")
+
+        monkeypatch.setattr(control, "send_command", mock_send_command)
+        return sent
+
+    @pytest.fixture
+    def not_running(self, monkeypatch: pytest.MonkeyPatch) -> list[str]:
+        launched: list[str] = []
+        running = {"yes": False}
+
+        def mock_send_command(command, args=None, address=None, timeout=5.0):
+            if not running["yes"]:
+                raise datatype.DaemonNotRunningError("MoveAlarm isn't running")
+            return control.make_response(True, f"{command} done")
+
+        def mock_launch_daemon() -> bool:
+            launched.append("daemon")
+            running["yes"] = True
+            return True
+
+        monkeypatch.setattr(control, "send_command", mock_send_command)
+        monkeypatch.setattr(app, "launch_daemon", mock_launch_daemon)
+        return launched
+
+    class TestMain:
+
+        def test_sends_the_command_to_the_daemon(self, sent, capfd):
+            assert app.main(["snooze"]) == 0
+
+            out, err = capfd.readouterr()
+            assert sent == [("snooze", [])]
+            assert out == "snooze done\n"
+
+        def test_commands_can_be_given_as_flags(self, sent):
+            app.main(["--stop"])
+
+            assert sent == [("stop", [])]
+
+        def test_help_does_not_contact_the_daemon(self, sent, capfd):
+            assert app.main(["--help"]) == 0
+
+            out, err = capfd.readouterr()
+            assert sent == []
+            assert "snooze" in out
+
+        def test_help_for_one_command(self, sent, capfd):
+            app.main(["help", "test"])
+
+            out, err = capfd.readouterr()
+            assert out.startswith("test - ")
+
+        def test_unknown_commands_are_rejected(self, sent, capfd):
+            assert app.main(["dance"]) == 2
+
+            out, err = capfd.readouterr()
+            assert sent == []
+            assert out == "Warning: Unknown command 'dance', try help\n"
+
+        def test_start_launches_the_daemon_if_needed(self, not_running, capfd):
+            assert app.main(["start"]) == 0
+
+            out, err = capfd.readouterr()
+            assert not_running == ["daemon"]
+            assert out == "start done\n"
+
+        def test_stop_does_not_launch_the_daemon(self, not_running, capfd):
+            assert app.main(["stop"]) == 1
+
+            out, err = capfd.readouterr()
+            assert not_running == []
+            assert out == "Info: MoveAlarm isn't running, use start to set an alarm\n"
+
+    class TestDaemon:
+
+        def test_a_second_daemon_exits_with_a_distinct_code(
+            self, monkeypatch: pytest.MonkeyPatch, capfd
+        ):
+            def already_running(self):
+                raise datatype.DaemonAlreadyRunningError("locked")
+
+            monkeypatch.setattr("move_alarm.components.Daemon.serve", already_running)
+
+            assert app.main(["daemon"]) == control.ALREADY_RUNNING_EXIT_CODE
+
+            out, err = capfd.readouterr()
+            assert out == (
+                "Info: MoveAlarm is already running, commands will be sent to it\n"
+            )
+
+    class TestServe:
+
+        def test_serves_until_interrupted(self, monkeypatch: pytest.MonkeyPatch, capfd):
+            join = threading.Thread.join
+            interrupted = []
+
+            def interrupt_once(self, timeout=None):
+                if self.name == "MoveHTTP" and interrupted == []:
+                    interrupted.append(self.name)
+                    raise KeyboardInterrupt
+                join(self, timeout)
+
+            monkeypatch.setattr("threading.Thread.join", interrupt_once)
+            directory = tempfile.mkdtemp()
+
+            try:
+                assert app.main(["serve", "--port", "0", "--data", directory]) == 0
+            finally:
+                shutil.rmtree(directory, ignore_errors=True)
+
+            out, err = capfd.readouterr()
+            assert "Info: MoveAlarm service listening on http://127.0.0.1:" in out
+            assert interrupted == ["MoveHTTP"]
+            assert "MoveHTTP" not in [t.name for t in threading.enumerate()]
+            assert "MoveScheduler" not in [t.name for t in threading.enumerate()]
+
+        def test_rejects_invalid_options(self, capfd):
+            assert app.main(["serve", "--port", "http"]) == 2
+
+        def test_refuses_to_listen_beyond_this_machine(self, capfd):
+            assert app.main(["serve", "--host", "0.0.0.0", "--port", "0"]) == 2
+
+            out, err = capfd.readouterr()
+            assert out.startswith("Warning: MoveAlarm serve only listens on")
+
+    class TestRepl:
+
+        def test_runs_commands_until_exit(self, sent, monkeypatch: pytest.MonkeyPatch):
+            lines = iter(["start", "", 'help "snooze"', "status", "exit", "stop"])
+            monkeypatch.setattr("builtins.input", lambda prompt: next(lines))
+
+            assert app.main([]) == 0
+            assert sent == [("start", []), ("status", [])]
+
+        def test_exits_at_the_end_of_input(self, sent, monkeypatch: pytest.MonkeyPatch):
+            def end_of_input(prompt):
+                raise EOFError
+
+            monkeypatch.setattr("builtins.input", end_of_input)
+
+            assert app.main([]) == 0
@@ -0,0 +1,366 @@
+import asyncio, io, json, os, socket, threading, wave
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import sleep
+import pytest
+import requests
+from move_alarm import contexts
+from move_alarm.utils import api_calls, async_api_calls, async_http
+from move_alarm.utils.rate_limit import TokenBucket
+import move_alarm.datatypes as datatype
+
+
+def make_wav(frames: int = 4000) -> bytes:
+    data = io.BytesIO()
+    with wave.open(data, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(8000)
+        wav.writeframes(b"\x01\x00" * frames)
+    return data.getvalue()
+
+
+class MockFreesound(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self) -> None:
+        super().__init__(("127.0.0.1", 0), MockFreesoundHandler)
+        self.sound = make_wav()
+        self.requests: list[tuple[str, dict[str, str]]] = []
+        self.busy_responses = 0
+        self.delay = 0.0
+        self.in_flight = {"now": 0, "max": 0}
+        self.lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_port}"
+
+
+class MockFreesoundHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: MockFreesound
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        server = self.server
+        server.requests.append((self.path, dict(self.headers)))
+
+        with server.lock:
+            server.in_flight["now"] += 1
+            server.in_flight["max"] = max(
+                server.in_flight["max"], server.in_flight["now"]
+            )
+        try:
+            sleep(server.delay)
+            self.route()
+        finally:
+            with server.lock:
+                server.in_flight["now"] -= 1
+
+    def route(self) -> None:
+        server = self.server
+
+        if server.busy_responses > 0:
+            server.busy_responses -= 1
+            self.send_body(429, b"Slow down", "text/plain", {"Retry-After": "0"})
+        elif self.path.startswith("/search/text/"):
+            theme = self.path.split("description:(")[-1].split(")")[0]
+            results = [{"id": len(theme), "name": theme}]
+            self.send_body(200, json.dumps({"results": results}).encode(), "json")
+        elif self.path == "/token":
+            self.send_body(200, b'{"access_token": "mock"}', "application/json")
+        elif self.path == "/refused":
+            self.send_body(401, b"Invalid token", "text/plain")
+        elif self.path == "/sound.wav":
+            self.send_body(200, server.sound, "audio/wav")
+        elif self.path == "/chunked.wav":
+            self.send_response(200)
+            self.send_header("Content-Type", "audio/wav")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for start in range(0, len(server.sound), 1000):
+                chunk = server.sound[start : start + 1000]
+                self.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+            self.wfile.write(b"0\r\n\r\n")
+        elif self.path == "/redirect":
+            self.send_body(302, b"", "text/plain", {"Location": "/sound.wav"})
+        elif self.path == "/page.html":
+            self.send_body(200, b"<html></html>", "text/html")
+        else:
+            self.send_body(404, b"Not found", "text/plain")
+
+    def send_body(
+        self, status: int, body: bytes, content_type: str, headers: dict = {}
+    ) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class TestAsyncApiCalls:
+
+    @pytest.fixture
+    def freesound(self, monkeypatch: pytest.MonkeyPatch):
+        server = MockFreesound()
+        thread = threading.Thread(
+            target=server.serve_forever, args=(0.01,), daemon=True
+        )
+        thread.start()
+
+        monkeypatch.setattr(api_calls, "FREESOUND_API_URL", server.url)
+        monkeypatch.setattr(api_calls, "freesound_bucket", TokenBucket(1e9, 1e9))
+        monkeypatch.setattr(api_calls, "token_bucket", TokenBucket(1e9, 1e9))
+
+        yield server
+
+        server.shutdown()
+        server.server_close()
+        api_calls.freesound_breaker.reset()
+
+    @pytest.fixture
+    def restore_concurrency(self, monkeypatch: pytest.MonkeyPatch):
+        monkeypatch.setattr(
+            async_api_calls, "MAX_CONCURRENCY", async_api_calls.MAX_CONCURRENCY
+        )
+        yield
+        async_api_calls._semaphores.clear()
+
+    class TestSearchForSounds:
+
+        def test_returns_the_search_results(self, freesound):
+            results = asyncio.run(
+                async_api_calls.search_for_sounds("token", themes=["piano"])
+            )
+
+            assert results == [{"id": 5, "name": "piano"}]
+            path, headers = freesound.requests[0]
+            assert headers["Authorization"] == "Bearer token"
+
+        def test_applies_the_filters_to_the_query(self, freesound):
+            filters = datatype.SoundFilters(max_channels=1)
+
+            asyncio.run(async_api_calls.search_for_sounds("token", filters=filters))
+
+            path, _ = freesound.requests[0]
+            assert path == api_calls.search_url([], filters)[len(freesound.url) :]
+
+        def test_retries_after_a_rate_limited_response(self, freesound):
+            freesound.busy_responses = 1
+
+            results = asyncio.run(
+                async_api_calls.search_for_sounds("token", themes=["piano"])
+            )
+
+            assert results == [{"id": 5, "name": "piano"}]
+            assert len(freesound.requests) == 2
+
+        def test_a_refused_search_raises_connection_refused_error(
+            self, freesound, monkeypatch: pytest.MonkeyPatch
+        ):
+            monkeypatch.setattr(
+                api_calls,
+                "search_url",
+                lambda themes, filters: freesound.url + "/refused",
+            )
+
+            with pytest.raises(ConnectionRefusedError):
+                asyncio.run(async_api_calls.search_for_sounds("token"))
+
+        def test_searches_each_theme_at_once(self, freesound):
+            freesound.delay = 0.05
+
+            results = asyncio.run(
+                async_api_calls.search_for_sounds_by_theme(
+                    "token", ["rain", "piano", "guitar"]
+                )
+            )
+
+            assert freesound.in_flight["max"] > 1
+            assert sorted(result["name"] for result in results) == [
+                "guitar",
+                "piano",
+                "rain",
+            ]
+
+    class TestDownloadSound:
+
+        def test_streams_the_sound_to_disk(self, freesound, tmp_path):
+            new_path = str(tmp_path / "sound.wav")
+
+            digest = asyncio.run(
+                async_api_calls.download_sound(
+                    "token", freesound.url + "/sound.wav", new_path
+                )
+            )
+
+            with open(new_path, "rb") as file:
+                assert file.read() == freesound.sound
+            assert len(digest) == 64
+            assert not os.path.exists(new_path + ".part")
+
+        def test_reads_a_chunked_response(self, freesound, tmp_path):
+            new_path = str(tmp_path / "sound.wav")
+            chunks = []
+
+            asyncio.run(
+                async_api_calls.download_sound(
+                    "token",
+                    freesound.url + "/chunked.wav",
+                    new_path,
+                    on_chunk=lambda offset, chunk: chunks.append(chunk),
+                )
+            )
+
+            with open(new_path, "rb") as file:
+                assert file.read() == freesound.sound
+            assert b"".join(chunks) == freesound.sound
+
+        def test_follows_redirects(self, freesound, tmp_path):
+            new_path = str(tmp_path / "sound.wav")
+
+            asyncio.run(
+                async_api_calls.download_sound(
+                    "token", freesound.url + "/redirect", new_path
+                )
+            )
+
+            assert os.path.getsize(new_path) == len(freesound.sound)
+
+        def test_rejects_a_page_that_is_not_a_sound(self, freesound, tmp_path):
+            new_path = str(tmp_path / "sound.wav")
+
+            with pytest.raises(datatype.InvalidSoundError):
+                asyncio.run(
+                    async_api_calls.download_sound(
+                        "token", freesound.url + "/page.html", new_path
+                    )
+                )
+
+            assert not os.path.exists(new_path)
+
+        def test_errors_are_raised_to_the_caller(self, freesound, tmp_path):
+            with pytest.raises(requests.exceptions.HTTPError):
+                asyncio.run(
+                    async_api_calls.download_sound(
+                        "token", freesound.url + "/missing.wav", str(tmp_path / "a.wav")
+                    )
+                )
+
+        def test_runs_downloads_concurrently(self, freesound, tmp_path):
+            freesound.delay = 0.05
+
+            async def download_many():
+                return await asyncio.gather(
+                    *[
+                        async_api_calls.download_sound(
+                            "token",
+                            freesound.url + "/sound.wav",
+                            str(tmp_path / f"{index}.wav"),
+                        )
+                        for index in range(0, 8)
+                    ]
+                )
+
+            digests = asyncio.run(download_many())
+
+            assert freesound.in_flight["max"] > 1
+            assert len(set(digests)) == 1
+
+    class TestConcurrency:
+
+        @pytest.mark.usefixtures("restore_concurrency")
+        def test_concurrency_is_bounded(self, freesound, tmp_path):
+            freesound.delay = 0.02
+            async_api_calls.set_max_concurrency(3)
+
+            async def download_many():
+                await asyncio.gather(
+                    *[
+                        async_api_calls.download_sound(
+                            "token",
+                            freesound.url + "/sound.wav",
+                            str(tmp_path / f"{index}.wav"),
+                        )
+                        for index in range(0, 9)
+                    ]
+                )
+
+            asyncio.run(download_many())
+
+            assert freesound.in_flight["max"] <= 3
+
+        def test_concurrency_limit_must_be_positive(self):
+            with pytest.raises(ValueError):
+                async_api_calls.set_max_concurrency(0)
+            with pytest.raises(TypeError):
+                async_api_calls.set_max_concurrency("8")
+
+    class TestAsyncHttp:
+
+        def test_a_silent_server_times_out(self):
+            listener = socket.create_server(("127.0.0.1", 0))
+
+            async def request():
+                return await async_http.request(
+                    "GET",
+                    f"http://127.0.0.1:{listener.getsockname()[1]}/",
+                    timeout=(1.0, 0.05),
+                )
+
+            try:
+                with pytest.raises(TimeoutError):
+                    asyncio.run(request())
+            finally:
+                listener.close()
+
+        def test_a_refused_connection_is_an_outage(self):
+            listener = socket.create_server(("127.0.0.1", 0))
+            port = listener.getsockname()[1]
+            listener.close()
+
+            with pytest.raises(ConnectionError) as error:
+                asyncio.run(async_http.request("GET", f"http://127.0.0.1:{port}/"))
+
+            assert not isinstance(error.value, ConnectionRefusedError)
+
+    class TestGetApiToken:
+
+        def test_returns_a_response_like_the_blocking_call(self, freesound):
+            response = asyncio.run(
+                async_api_calls.get_api_token(freesound.url + "/token")
+            )
+
+            assert response.status_code == 200
+            assert response.json() == {"access_token": "mock"}
+
+    class TestGetAuthToken:
+
+        def test_keeps_the_callers_context_scope(self):
+            class MockAuth(datatype.OauthObject):
+                def get_token(self) -> str | None:
+                    return "tenant token"
+
+            tenant = datatype.Contexts(
+                MockAuth(),
+                datatype.Config(
+                    wait_duration=timedelta(minutes=1),
+                    snooze_duration=timedelta(minutes=1),
+                    reminder_text="",
+                    wav_directory="",
+                    api_enabled=True,
+                    sound_themes=[],
+                ),
+            )
+
+            async def get_token_in_scope():
+                with contexts.context_scope(tenant):
+                    return await async_api_calls.get_auth_token()
+
+            assert asyncio.run(get_token_in_scope()) == "tenant token"
@@ -0,0 +1,106 @@
+import json, os, subprocess, sys
+import pytest
+from move_alarm.utils.bandwidth import BandwidthBudget, make_throttle, FLUSH_BYTES
+import move_alarm.datatypes as datatype
+
+
+class TestBandwidth:
+
+    @property
+    def state_path(self) -> str:
+        return os.path.join(
+            os.path.dirname(__file__)[:-9], "move_alarm", ".bandwidth.test"
+        )
+
+    @pytest.fixture(autouse=True)
+    def before_each(self):
+        for path in [self.state_path, self.state_path + ".lock"]:
+            if os.path.exists(path):
+                os.remove(path)
+
+        yield
+
+        for path in [self.state_path, self.state_path + ".lock"]:
+            if os.path.exists(path):
+                os.remove(path)
+
+    class TestBandwidthBudget:
+
+        @property
+        def state_path(self) -> str:
+            return TestBandwidth.state_path.fget(self)
+
+        def test_a_budget_of_zero_never_runs_out(self):
+            budget = BandwidthBudget(0)
+
+            budget.consume(10 * FLUSH_BYTES)
+            budget.check(10 * FLUSH_BYTES)
+
+            assert budget.usage().remaining is None
+
+        def test_raises_when_the_budget_is_exceeded(self):
+            budget = BandwidthBudget(1000)
+            budget.consume(600)
+
+            with pytest.raises(datatype.BandwidthBudgetError):
+                budget.consume(600)
+
+        def test_check_refuses_a_download_that_cannot_fit(self):
+            budget = BandwidthBudget(1000)
+            budget.consume(600)
+
+            budget.check(400)
+            with pytest.raises(datatype.BandwidthBudgetError):
+                budget.check(401)
+
+        def test_reports_usage(self):
+            budget = BandwidthBudget(1000)
+            budget.consume(250)
+
+            usage = budget.usage()
+
+            assert usage.used == 250
+            assert usage.remaining == 750
+            assert usage.exhausted is False
+
+        def test_usage_is_shared_through_the_state_file(self):
+            other = BandwidthBudget(1000, self.state_path)
+            other.consume(300)
+            other.flush()
+            first = BandwidthBudget(1000, self.state_path)
+            first.consume(300)
+            first.flush()
+
+            assert BandwidthBudget(1000, self.state_path).usage().used == 600
+
+        def test_usage_resets_on_a_new_day(self):
+            with open(self.state_path, "w") as file:
+                json.dump({"day": "2000-01-01", "used": 5000}, file)
+
+            budget = BandwidthBudget(1000, self.state_path)
+
+            assert budget.usage().used == 0
+
+        def test_raises_value_error_on_a_negative_budget(self):
+            with pytest.raises(ValueError):
+                BandwidthBudget(-1)
+
+    class TestMakeThrottle:
+
+        def test_holds_at_least_one_chunk(self):
+            throttle = make_throttle(1000, chunk_size=65536)
+
+            assert throttle.try_acquire(65536) == 0
+            assert throttle.try_acquire(1000) > 0
+
+    class TestGetDownloadBudget:
+
+        def test_reads_the_limit_in_the_daemons_import_order(self):
+            # helpers is first imported while move_alarm.contexts is loading
+            statement = (
+                "import move_alarm.app, move_alarm.components\n"
+                + "from move_alarm.utils import helpers\n"
+                + "assert callable(helpers.contexts.use_context)"
+            )
+
+            subprocess.run([sys.executable, "-c", statement], check=True)
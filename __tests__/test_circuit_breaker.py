@@ -0,0 +1,120 @@
+import threading
+from time import sleep
+import requests
+import pytest
+from move_alarm.utils.circuit_breaker import CircuitBreaker, is_outage
+import move_alarm.datatypes as datatype
+
+
+class TestCircuitBreaker:
+
+    @pytest.fixture
+    def fail_times(self):
+        def _fail_times(breaker: CircuitBreaker, times: int) -> None:
+            for _ in range(0, times):
+                with pytest.raises(ConnectionError):
+                    with breaker:
+                        raise ConnectionError("Mock outage")
+
+        return _fail_times
+
+    class TestState:
+
+        def test_starts_closed(self):
+            breaker = CircuitBreaker("mock")
+
+            assert breaker.state == CircuitBreaker.CLOSED
+
+        def test_opens_after_failure_threshold(self, fail_times):
+            breaker = CircuitBreaker("mock", failure_threshold=3)
+
+            fail_times(breaker, 2)
+            assert breaker.state == CircuitBreaker.CLOSED
+
+            fail_times(breaker, 1)
+            assert breaker.state == CircuitBreaker.OPEN
+
+        def test_success_resets_the_failure_count(self, fail_times):
+            breaker = CircuitBreaker("mock", failure_threshold=2)
+
+            fail_times(breaker, 1)
+            with breaker:
+                pass
+            fail_times(breaker, 1)
+
+            assert breaker.state == CircuitBreaker.CLOSED
+
+        def test_half_opens_after_cooldown(self, fail_times):
+            breaker = CircuitBreaker("mock", failure_threshold=1, cooldown=0.01)
+
+            fail_times(breaker, 1)
+            sleep(0.02)
+
+            assert breaker.state == CircuitBreaker.HALF_OPEN
+
+        def test_force_open_keeps_it_open(self):
+            breaker = CircuitBreaker("mock")
+
+            breaker.force_open()
+            with pytest.raises(datatype.CircuitOpenError):
+                with breaker:
+                    pass
+
+            breaker.reset()
+            assert breaker.state == CircuitBreaker.CLOSED
+
+    class TestWhenOpen:
+
+        def test_raises_circuit_open_error_without_calling(self, fail_times):
+            breaker = CircuitBreaker("mock", failure_threshold=1)
+            calls = []
+
+            fail_times(breaker, 1)
+
+            with pytest.raises(datatype.CircuitOpenError):
+                breaker.protect(lambda: calls.append(None))()
+
+            assert calls == []
+
+        def test_circuit_open_error_is_a_connection_error(self):
+            assert issubclass(datatype.CircuitOpenError, ConnectionError) is True
+
+        def test_probe_closes_the_circuit_in_the_background(self, fail_times):
+            probed = threading.Event()
+
+            def probe():
+                probed.set()
+                return True
+
+            breaker = CircuitBreaker(
+                "mock", failure_threshold=1, cooldown=0.01, probe=probe
+            )
+
+            fail_times(breaker, 1)
+            probed.wait(timeout=1)
+            sleep(0.01)
+
+            assert breaker.state == CircuitBreaker.CLOSED
+
+    class TestIsOutage:
+
+        def test_refused_connections_are_not_outages(self):
+            assert is_outage(ConnectionRefusedError("429")) is False
+
+        def test_a_spent_download_budget_is_not_an_outage(self):
+            assert is_outage(datatype.BandwidthBudgetError("Budget used")) is False
+
+        def test_network_errors_are_outages(self):
+            assert is_outage(requests.exceptions.ConnectTimeout()) is True
+
+        def test_server_errors_are_outages(self):
+            response = requests.Response()
+            response.status_code = 503
+
+            assert is_outage(requests.exceptions.HTTPError(response=response)) is True
+
+        def test_client_errors_are_not_outages(self):
+            response = requests.Response()
+            response.status_code = 404
+
+            assert is_outage(requests.exceptions.HTTPError(response=response)) is False
@@ -1,6 +1,9 @@
-import os, configparser, datetime
+import os, configparser, datetime, json
+from time import sleep
 import pytest, pytest_mock
 from move_alarm.utils.config import Configuration
+import move_alarm.utils.config as config_module
+from move_alarm.utils import atomic_file
 import move_alarm.datatypes as datatype
 
 
@@ -262,6 +265,371 @@ class TestConfig:
             with pytest.raises(ValueError):
                 config.load_config_file()
 
+    class TestSoundFilters:
+        @property
+        def config_path(self) -> str:
+            return TestConfig.config_path.fget(self)
+
+        def test_filters_are_saved_and_loaded(self):
+            config = Configuration(self.config_path)
+            config.sound_filters = datatype.SoundFilters(22050, 8, 1, 5000)
+            config.set_config_file()
+
+            loaded = Configuration(self.config_path)
+
+            assert loaded.sound_filters == datatype.SoundFilters(22050, 8, 1, 5000)
+
+        def test_rejects_negative_limits(self):
+            config = Configuration(self.config_path)
+
+            with pytest.raises(ValueError):
+                config.sound_filters = datatype.SoundFilters(max_channels=-1)
+
+        def test_rejects_limits_that_are_not_ints(self):
+            config = Configuration(self.config_path)
+
+            with pytest.raises(ValueError):
+                config.sound_filters = datatype.SoundFilters(max_bitdepth=True)  # type: ignore
+            with pytest.raises(ValueError):
+                config.sound_filters = datatype.SoundFilters(max_filesize=1.5)  # type: ignore
+
+        def test_a_negative_limit_in_the_file_is_not_loaded(self):
+            config = Configuration(self.config_path)
+            config.set_config_file()
+            with open(self.config_path) as file:
+                text = file.read()
+            with open(self.config_path, "w") as file:
+                file.write(text.replace("channels = 2", "channels = -2"))
+
+            with pytest.raises(ValueError):
+                config.load_config_file()
+
+        @pytest.mark.usefixtures("Create good mock config file")
+        def test_missing_filters_section_uses_default_filters(self):
+            config = Configuration(self.config_path)
+
+            assert config.sound_filters == datatype.SoundFilters()
+
+    class TestSchema:
+        @property
+        def config_path(self) -> str:
+            return TestConfig.config_path.fget(self)
+
+        @property
+        def json_path(self) -> str:
+            return self.config_path[:-4] + ".json"
+
+        @pytest.fixture(autouse=True)
+        def remove_json_config(self):
+            yield
+            if os.path.exists(self.json_path):
+                os.remove(self.json_path)
+
+        def test_themes_survive_a_save_and_load(self):
+            config = Configuration(self.config_path)
+            config.sound_themes = ["piano", "lo-fi, chill"]
+            config.set_config_file()
+
+            loaded = Configuration(self.config_path)
+
+            assert loaded.sound_themes == ["piano", "lo-fi, chill"]
+
+        def test_login_callback_port_survives_a_save_and_load(self):
+            config = Configuration(self.config_path)
+            config.login_callback_port = 8123
+            config.set_config_file()
+
+            loaded = Configuration(self.config_path)
+
+            assert loaded.login_callback_port == 8123
+
+        def test_acquire_deadline_survives_a_save_and_load(self):
+            config = Configuration(self.config_path)
+            config.acquire_deadline = datetime.timedelta(milliseconds=1500)
+            config.set_config_file()
+
+            loaded = Configuration(self.config_path)
+
+            assert loaded.acquire_deadline == datetime.timedelta(milliseconds=1500)
+
+        def test_counts_must_not_be_bools(self):
+            config = Configuration(self.config_path)
+
+            with pytest.raises(ValueError):
+                config.prefetch_count = True
+
+        def test_acquire_deadline_must_be_positive(self):
+            config = Configuration(self.config_path)
+
+            with pytest.raises(ValueError):
+                config.acquire_deadline = datetime.timedelta(0)
+
+        def test_login_callback_port_must_be_a_port(self):
+            config = Configuration(self.config_path)
+
+            with pytest.raises(ValueError):
+                config.login_callback_port = 70000
+
+        @pytest.mark.usefixtures("Create good mock config file")
+        def test_loads_themes_saved_in_the_old_format(self):
+            config = Configuration(self.config_path)
+
+            assert config.sound_themes == ["piano", "guitar"]
+
+        def test_loads_comma_separated_themes(self):
+            config = Configuration(self.config_path)
+            parser = configparser.ConfigParser()
+            parser.read(self.config_path)
+            parser.set("Sounds", "themes", "piano, guitar")
+            with open(self.config_path, "w") as file:
+                parser.write(file)
+
+            config.load_config_file()
+
+            assert config.sound_themes == ["piano", "guitar"]
+
+        def test_assignments_are_still_checked(self):
+            config = Configuration(self.config_path)
+
+            with pytest.raises(TypeError):
+                config.wait_duration = 60
+            with pytest.raises(ValueError):
+                config.wav_directory = "/not/a/real/directory"
+
+        def test_a_failed_load_changes_nothing(self):
+            config = Configuration(self.config_path)
+            parser = configparser.ConfigParser()
+            parser.read(self.config_path)
+            parser.set("Alarm", "interval", "120")
+            parser.set("Sounds", "path", "/not/a/real/directory")
+            with open(self.config_path, "w") as file:
+                parser.write(file)
+
+            with pytest.raises(ValueError):
+                config.load_config_file()
+
+            assert config.wait_duration == datetime.timedelta(hours=1)
+
+        def test_json_config_files_are_saved_and_loaded(self):
+            config = Configuration(self.json_path)
+            config.sound_themes = ["piano", "guitar"]
+            config.sound_filters = datatype.SoundFilters(22050, 8, 1, 5000)
+            config.set_config_file()
+
+            with open(self.json_path) as file:
+                saved = json.load(file)
+            loaded = Configuration(self.json_path)
+
+            assert saved["Sounds"]["themes"] == ["piano", "guitar"]
+            assert saved["Alarm"]["interval"] == 3600
+            assert loaded.snapshot() == config.snapshot()
+
+        def test_json_values_must_have_the_right_type(self):
+            config = Configuration(self.json_path)
+            with open(self.json_path) as file:
+                saved = json.load(file)
+            saved["Alarm"]["interval"] = "3600"
+            with open(self.json_path, "w") as file:
+                json.dump(saved, file)
+
+            with pytest.raises(ValueError):
+                config.load_config_file()
+
+    class TestReloadIfChanged:
+        @property
+        def config_path(self) -> str:
+            return TestConfig.config_path.fget(self)
+
+        @pytest.fixture
+        def edit_config_file(self):
+            def _edit_config_file(section: str, key: str, value: str) -> None:
+                parser = configparser.ConfigParser()
+                parser.read(self.config_path)
+                parser.set(section, key, value)
+
+                with open(self.config_path, "w") as file:
+                    parser.write(file)
+
+                # Some filesystems only keep whole-second mtimes
+                stat = os.stat(self.config_path)
+                os.utime(
+                    self.config_path,
+                    ns=(stat.st_atime_ns, stat.st_mtime_ns + 2_000_000_000),
+                )
+
+            return _edit_config_file
+
+        def test_does_nothing_when_the_file_is_unchanged(self):
+            config = Configuration(self.config_path)
+
+            assert config.reload_if_changed(force=True) is False
+
+        def test_reloads_and_reports_the_changed_settings(self, edit_config_file):
+            config = Configuration(self.config_path)
+            changes = []
+            config.on_change(changes.append)
+
+            edit_config_file("Alarm", "interval", "120")
+
+            assert config.reload_if_changed(force=True) is True
+            assert config.wait_duration == datetime.timedelta(minutes=2)
+            assert changes == [{"wait_duration"}]
+
+        def test_a_removed_listener_is_not_notified(self, edit_config_file):
+            config = Configuration(self.config_path)
+            changes = []
+            config.on_change(changes.append)
+            config.remove_listener(changes.append)
+
+            edit_config_file("Alarm", "interval", "120")
+            config.reload_if_changed(force=True)
+
+            assert changes == []
+
+        def test_checks_the_file_at_most_once_per_interval(self, edit_config_file):
+            config = Configuration(self.config_path)
+            config.reload_if_changed(force=True)
+
+            edit_config_file("Alarm", "interval", "120")
+
+            assert config.reload_if_changed() is False
+            assert config.wait_duration == datetime.timedelta(hours=1)
+
+        def test_keeps_the_current_values_if_the_new_file_is_broken(
+            self, edit_config_file
+        ):
+            config = Configuration(self.config_path)
+
+            edit_config_file("Alarm", "interval", "sixty")
+
+            assert config.reload_if_changed(force=True) is False
+            assert config.wait_duration == datetime.timedelta(hours=1)
+
+        def test_listeners_are_only_added_once(self, edit_config_file):
+            config = Configuration(self.config_path)
+            changes = []
+            config.on_change(changes.append)
+            config.on_change(changes.append)
+
+            edit_config_file("Alarm", "snooze", "60")
+            config.reload_if_changed(force=True)
+
+            assert changes == [{"snooze_duration"}]
+
+    class TestUpdate:
+        @property
+        def config_path(self) -> str:
+            return TestConfig.config_path.fget(self)
+
+        @pytest.fixture
+        def count_writes(self, mocker: pytest_mock.MockerFixture):
+            return mocker.patch(
+                "move_alarm.utils.config.write_atomic",
+                side_effect=atomic_file.write_atomic,
+            )
+
+        def test_batches_several_changes_into_one_write(self, count_writes):
+            config = Configuration(self.config_path)
+            count_writes.reset_mock()
+
+            with config.update() as update:
+                update.wait_duration = datetime.timedelta(minutes=30)
+                update.reminder_text = "Stand up!"
+            with config.update() as update:
+                update.snooze_duration = datetime.timedelta(minutes=1)
+            config.flush()
+
+            assert count_writes.call_count == 1
+            loaded = Configuration(self.config_path)
+            assert loaded.wait_duration == datetime.timedelta(minutes=30)
+            assert loaded.reminder_text == "Stand up!"
+            assert loaded.snooze_duration == datetime.timedelta(minutes=1)
+
+        def test_writes_after_the_save_delay(self, monkeypatch: pytest.MonkeyPatch):
+            monkeypatch.setattr(Configuration, "save_delay", 0.01)
+            config = Configuration(self.config_path)
+
+            with config.update() as update:
+                update.reminder_text = "Stand up!"
+
+            for _ in range(0, 1000):
+                if not config.has_pending_save:
+                    break
+                sleep(0.001)
+
+            assert Configuration(self.config_path).reminder_text == "Stand up!"
+
+        def test_a_failed_update_changes_nothing(self, count_writes):
+            config = Configuration(self.config_path)
+            count_writes.reset_mock()
+
+            with pytest.raises(ValueError):
+                with config.update() as update:
+                    update.reminder_text = "Stand up!"
+                    update.prefetch_count = -1
+
+            assert config.reminder_text == "Time to stretch!"
+            assert config.has_pending_save is False
+            count_writes.assert_not_called()
+
+        def test_skips_the_write_if_nothing_changed(self, count_writes):
+            config = Configuration(self.config_path)
+            count_writes.reset_mock()
+
+            with config.update() as update:
+                update.reminder_text = config.reminder_text
+            config.set_config_file()
+
+            assert config.has_pending_save is False
+            count_writes.assert_not_called()
+
+        def test_notifies_listeners_once_per_update(self):
+            config = Configuration(self.config_path)
+            changes = []
+            config.on_change(changes.append)
+
+            with config.update(debounce=False) as update:
+                update.wait_duration = datetime.timedelta(minutes=30)
+                update.reminder_text = "Stand up!"
+
+            assert changes == [{"wait_duration", "reminder_text"}]
+            loaded = Configuration(self.config_path)
+            assert loaded.wait_duration == datetime.timedelta(minutes=30)
+            assert loaded.reminder_text == "Stand up!"
+
+        def test_leaves_no_temporary_files(self):
+            config = Configuration(self.config_path)
+
+            with config.update(debounce=False) as update:
+                update.reminder_text = "Stand up!"
+
+            directory = os.path.dirname(self.config_path)
+            assert not any(name.endswith(".tmp") for name in os.listdir(directory))
+            assert Configuration(self.config_path).reminder_text == "Stand up!"
+
+        def test_an_immediate_update_replaces_a_pending_save(self):
+            config = Configuration(self.config_path)
+
+            with config.update() as update:
+                update.reminder_text = "first"
+            with config.update(debounce=False) as update:
+                update.reminder_text = "second"
+
+            assert config.has_pending_save is False
+            assert Configuration(self.config_path).reminder_text == "second"
+
+        def test_pending_saves_are_flushed_at_exit(self):
+            config = Configuration(self.config_path)
+
+            with config.update() as update:
+                update.reminder_text = "Stand up!"
+            assert id(config) in config_module._pending_saves
+
+            config_module.flush_pending_saves()
+
+            assert id(config) not in config_module._pending_saves
+            assert Configuration(self.config_path).reminder_text == "Stand up!"
+
     class TestUseDefaultValues:
         @property
         def config_path(self) -> str:
@@ -0,0 +1,105 @@
+import importlib, threading, time
+import pytest
+from move_alarm import contexts
+import move_alarm.datatypes as datatype
+
+# The package re-exports the function under the module's name
+context_module = importlib.import_module("move_alarm.contexts.use_context")
+
+
+class MockConfig:
+    def __init__(self, login_callback_port: int = 0) -> None:
+        self.reloads = 0
+        self.login_callback_port = login_callback_port
+
+    def reload_if_changed(self) -> bool:
+        self.reloads += 1
+        return False
+
+
+class TestUseContext:
+    @pytest.fixture(autouse=True)
+    def empty_cache(self, monkeypatch: pytest.MonkeyPatch):
+        monkeypatch.setattr(context_module, "cache", None)
+
+    @pytest.fixture
+    def builds(self, monkeypatch: pytest.MonkeyPatch) -> list[str]:
+        builds: list[str] = []
+
+        def build_auth(callback_port: int | None = None) -> object:
+            builds.append(threading.current_thread().name)
+            time.sleep(0.05)
+            return object()
+
+        monkeypatch.setattr("move_alarm.utils.HandleAuthorisation", build_auth)
+        monkeypatch.setattr("move_alarm.utils.Configuration", lambda path: MockConfig())
+
+        return builds
+
+    def test_builds_the_default_context_once_when_threads_race(self, builds):
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(contexts.use_context()))
+            for _ in range(0, 8)
+        ]
+
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(builds) == 1
+        assert all(result is results[0] for result in results)
+
+    def test_init_context_uses_the_given_auth_and_config(self, builds):
+        auth, config = object(), MockConfig()
+
+        context = contexts.init_context(auth, config)
+
+        assert contexts.use_context() is context
+        assert context.auth is auth and context.config is config
+        assert builds == []
+
+    def test_the_login_callback_port_comes_from_the_config(
+        self, monkeypatch: pytest.MonkeyPatch
+    ):
+        ports: list[int | None] = []
+        monkeypatch.setattr(
+            "move_alarm.utils.HandleAuthorisation",
+            lambda callback_port=None: ports.append(callback_port),
+        )
+
+        contexts.init_context(config=MockConfig())  # type: ignore
+        contexts.init_context(config=MockConfig(login_callback_port=8123))  # type: ignore
+
+        assert ports == [None, 8123]
+
+    def test_checks_the_config_file_on_each_lookup(self):
+        config = MockConfig()
+        contexts.init_context(object(), config)
+
+        contexts.use_context()
+        contexts.use_context()
+
+        assert config.reloads == 2
+
+    def test_a_scope_overrides_the_default_until_it_ends(self):
+        default = contexts.init_context(object(), MockConfig())
+        scoped = datatype.Contexts(object(), MockConfig())
+
+        with contexts.context_scope(scoped):
+            assert contexts.use_context() is scoped
+
+        assert contexts.use_context() is default
+
+    def test_scopes_do_not_leak_into_other_threads(self):
+        default = contexts.init_context(object(), MockConfig())
+        scoped = datatype.Contexts(object(), MockConfig())
+        seen = []
+
+        with contexts.context_scope(scoped):
+            other = threading.Thread(target=lambda: seen.append(contexts.use_context()))
+            other.start()
+            other.join()
+
+        assert seen == [default]
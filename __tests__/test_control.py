@@ -0,0 +1,241 @@
+import io, json, os, shutil, socket, tempfile
+import pytest
+from move_alarm import control
+from move_alarm.control.server import ControlRequestHandler, ControlServer
+import move_alarm.datatypes as datatype
+
+
+def echo(command: str, args: list[str]) -> datatype.ControlResponseDict:
+    if command == "fail":
+        raise RuntimeError("broken")
+    return control.make_response(True, command, {"args": args})
+
+
+class TestControl:
+
+    @pytest.fixture
+    def directory(self):
+        # Kept short, Unix socket paths are limited to about 100 characters
+        directory = tempfile.mkdtemp(prefix="ma")
+        yield directory
+        shutil.rmtree(directory, ignore_errors=True)
+
+    @pytest.fixture
+    def unix_address(self, directory) -> datatype.ControlAddress:
+        if not control.protocol.HAS_UNIX_SOCKETS:
+            pytest.skip("Unix sockets are not available")
+        return datatype.ControlAddress(os.path.join(directory, "ctl.sock"))
+
+    @pytest.fixture
+    def tcp_address(self, directory) -> datatype.ControlAddress:
+        return datatype.ControlAddress(
+            os.path.join(directory, "ctl.port"), use_tcp=True
+        )
+
+    @pytest.fixture
+    def start_server(self):
+        servers: list[ControlServer] = []
+
+        def _start_server(address: datatype.ControlAddress) -> ControlServer:
+            server = ControlServer(echo, address)
+            server.start()
+            servers.append(server)
+            return server
+
+        yield _start_server
+
+        for server in servers:
+            server.stop()
+
+    class TestProtocol:
+
+        def test_messages_survive_a_round_trip(self):
+            message = {"command": "snooze", "args": ["5"]}
+
+            stream = io.BytesIO(control.encode_message(message))
+
+            assert control.read_message(stream) == message
+
+        def test_messages_are_a_single_line(self):
+            encoded = control.encode_message({"message": "one\ntwo"})
+
+            assert encoded.count(b"\n") == 1
+
+        def test_rejects_oversized_messages(self):
+            size = control.protocol.MAX_MESSAGE_SIZE
+            stream = io.BytesIO(b'"' + b"a" * size + b'"\n')
+
+            with pytest.raises(ValueError):
+                control.read_message(stream)
+
+        def test_rejects_messages_that_are_not_objects(self):
+            with pytest.raises(ValueError):
+                control.read_message(io.BytesIO(b"[1, 2]\n"))
+
+    class TestRuntimeDirectory:
+
+        @pytest.fixture
+        def temp_directory(self, directory, monkeypatch: pytest.MonkeyPatch) -> str:
+            if not hasattr(os, "getuid"):
+                pytest.skip("File ownership is only checked on POSIX systems")
+            monkeypatch.delenv("XDG_RUNTIME_DIR", raising=False)
+            monkeypatch.setattr("tempfile.gettempdir", lambda: directory)
+            return directory
+
+        def test_uses_xdg_runtime_dir_when_set(
+            self, directory, monkeypatch: pytest.MonkeyPatch
+        ):
+            monkeypatch.setenv("XDG_RUNTIME_DIR", directory)
+
+            assert control.protocol.runtime_directory() == directory
+
+        def test_falls_back_to_a_private_directory_in_temp(self, temp_directory):
+            runtime = control.protocol.runtime_directory()
+            status = os.stat(runtime)
+
+            assert os.path.dirname(runtime) == temp_directory
+            assert status.st_uid == os.getuid()
+            assert status.st_mode & 0o777 == 0o700
+            assert control.control_address().path.startswith(runtime + os.sep)
+
+        def test_rejects_a_directory_others_can_access(self, temp_directory):
+            runtime = os.path.join(
+                temp_directory, f"move-alarm-{control.protocol.user_id()}"
+            )
+            os.mkdir(runtime)
+            os.chmod(runtime, 0o777)
+
+            with pytest.raises(PermissionError):
+                control.protocol.runtime_directory()
+
+        def test_rejects_a_symlink_in_place_of_the_directory(self, temp_directory):
+            target = os.path.join(temp_directory, "elsewhere")
+            os.mkdir(target, mode=0o700)
+            os.symlink(
+                target,
+                os.path.join(
+                    temp_directory, f"move-alarm-{control.protocol.user_id()}"
+                ),
+            )
+
+            with pytest.raises(PermissionError):
+                control.protocol.runtime_directory()
+
+    class TestUnixSocket:
+
+        def test_sends_a_command_and_returns_the_response(
+            self, unix_address, start_server
+        ):
+            start_server(unix_address)
+
+            response = control.send_command("snooze", ["5"], unix_address)
+
+            assert response == {
+                "ok": True,
+                "message": "snooze",
+                "data": {"args": ["5"]},
+            }
+
+        def test_only_the_owner_can_use_the_socket(self, unix_address, start_server):
+            start_server(unix_address)
+
+            assert os.stat(unix_address.path).st_mode & 0o777 == 0o600
+
+        def test_handler_errors_become_failed_responses(
+            self, unix_address, start_server
+        ):
+            start_server(unix_address)
+
+            response = control.send_command("fail", address=unix_address)
+
+            assert response["ok"] is False
+            assert "broken" in response["message"]
+
+        def test_raises_when_nothing_is_listening(self, unix_address):
+            with pytest.raises(datatype.DaemonNotRunningError):
+                control.send_command("status", address=unix_address)
+
+        def test_replaces_a_socket_left_by_a_crashed_daemon(
+            self, unix_address, start_server
+        ):
+            stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            stale.bind(unix_address.path)
+            stale.close()
+
+            start_server(unix_address)
+
+            assert control.is_daemon_running(unix_address) is True
+
+        def test_refuses_to_start_twice(self, unix_address, start_server):
+            start_server(unix_address)
+
+            with pytest.raises(FileExistsError):
+                start_server(unix_address)
+
+        def test_removes_the_socket_on_stop(self, unix_address, start_server):
+            server = start_server(unix_address)
+
+            server.stop()
+
+            assert os.path.exists(unix_address.path) is False
+
+    class TestWaitForDaemon:
+
+        class MockProcess:
+            def __init__(self, exit_code: int | None) -> None:
+                self.exit_code = exit_code
+
+            def poll(self) -> int | None:
+                return self.exit_code
+
+        def test_gives_up_once_the_launched_daemon_fails(self, unix_address):
+            process = self.MockProcess(1)
+
+            assert control.wait_for_daemon(unix_address, 5, process) is False
+
+        def test_keeps_waiting_if_another_launch_won_the_race(
+            self, unix_address, start_server
+        ):
+            process = self.MockProcess(control.ALREADY_RUNNING_EXIT_CODE)
+            start_server(unix_address)
+
+            assert control.wait_for_daemon(unix_address, 5, process) is True
+
+    class TestTCPFallback:
+
+        def test_sends_a_command_and_returns_the_response(
+            self, tcp_address, start_server
+        ):
+            start_server(tcp_address)
+
+            response = control.send_command("status", address=tcp_address)
+
+            assert response["ok"] is True
+            assert response["message"] == "status"
+
+        def test_rejects_requests_without_the_token(self, tcp_address, start_server):
+            start_server(tcp_address)
+            with open(tcp_address.path) as file:
+                port = json.load(file)["port"]
+
+            with socket.create_connection(("127.0.0.1", port), timeout=5) as client:
+                client.sendall(control.encode_message({"command": "status"}))
+                response = control.read_message(client.makefile("rb"))
+
+            assert response["ok"] is False
+
+        def test_drops_a_client_that_never_sends_a_request(
+            self, tcp_address, start_server, monkeypatch: pytest.MonkeyPatch
+        ):
+            monkeypatch.setattr(ControlRequestHandler, "timeout", 0.05)
+            start_server(tcp_address)
+            with open(tcp_address.path) as file:
+                port = json.load(file)["port"]
+
+            with socket.create_connection(("127.0.0.1", port), timeout=5) as client:
+                assert client.recv(1) == b""
+
+        def test_the_port_file_is_private(self, tcp_address, start_server):
+            start_server(tcp_address)
+
+            assert os.stat(tcp_address.path).st_mode & 0o777 == 0o600
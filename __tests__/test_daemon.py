@@ -0,0 +1,306 @@
+import os, shutil, tempfile, threading
+from datetime import datetime
+import pytest
+from move_alarm import control, utils
+from move_alarm.components import Daemon
+import move_alarm.datatypes as datatype
+
+
+class MockSounds(datatype.Sounds):
+    def __init__(self) -> None:
+        self.played = threading.Event()
+
+    def play_sound(self) -> None:
+        self.played.set()
+
+
+class MockAlarm:
+    def __init__(self) -> None:
+        self.is_set = False
+        self.time = datetime.fromtimestamp(0)
+        self.sounds = MockSounds()
+
+    def set_alarm(self) -> datetime:
+        self.is_set = True
+        self.time = datetime(2025, 1, 1, 9, 30)
+        return self.time
+
+    def snooze_alarm(self) -> datetime:
+        if not self.is_set:
+            raise datatype.AlarmNotSetError("Please set the alarm first")
+        self.time = datetime(2025, 1, 1, 9, 35)
+        return self.time
+
+    def remove_alarm(self) -> bool:
+        was_set, self.is_set = self.is_set, False
+        return was_set
+
+
+class MockAuth(datatype.OauthObject):
+    def __init__(self) -> None:
+        self.refreshing = False
+        self.logged_in = False
+
+    def get_token(self) -> str | None:
+        self.logged_in = True
+        return "token"
+
+    def start_background_refresh(self) -> None:
+        self.refreshing = True
+
+    def stop_background_refresh(self) -> None:
+        self.refreshing = False
+
+
+class MockConfig:
+    def __init__(self, api_enabled: bool = False) -> None:
+        self.api_enabled = api_enabled
+
+
+class TestDaemon:
+
+    @pytest.fixture
+    def address(self):
+        directory = tempfile.mkdtemp(prefix="ma")
+        if control.protocol.HAS_UNIX_SOCKETS:
+            yield datatype.ControlAddress(os.path.join(directory, "ctl.sock"))
+        else:
+            yield datatype.ControlAddress(
+                os.path.join(directory, "ctl.port"), use_tcp=True
+            )
+        shutil.rmtree(directory, ignore_errors=True)
+
+    @pytest.fixture
+    def daemon(self, address, monkeypatch: pytest.MonkeyPatch) -> Daemon:
+        contexts = datatype.Contexts(MockAuth(), MockConfig())  # type: ignore
+        monkeypatch.setattr(
+            "move_alarm.components.daemon.use_context", lambda: contexts
+        )
+        daemon = Daemon(address)
+        daemon._alarm = MockAlarm()
+        return daemon
+
+    class TestHandle:
+
+        def test_start_sets_the_alarm(self, daemon):
+            response = daemon.handle("start", [])
+
+            assert response["ok"] is True
+            assert response["message"] == "Alarm set for 09:30"
+            assert response["data"]["set"] is True
+
+        def test_start_reports_an_alarm_that_is_already_set(self, daemon):
+            daemon.handle("start", [])
+
+            response = daemon.handle("start", [])
+
+            assert response["message"] == "The alarm is already set for 09:30"
+
+        def test_snooze_delays_the_alarm(self, daemon):
+            daemon.handle("start", [])
+
+            response = daemon.handle("snooze", [])
+
+            assert response == {
+                "ok": True,
+                "message": "Alarm snoozed until 09:35",
+                "data": daemon.describe(),
+            }
+
+        def test_snooze_fails_without_an_alarm(self, daemon):
+            response = daemon.handle("snooze", [])
+
+            assert response["ok"] is False
+
+        def test_stop_removes_the_alarm(self, daemon):
+            daemon.handle("start", [])
+
+            assert daemon.handle("stop", [])["ok"] is True
+            assert daemon.handle("stop", [])["ok"] is False
+
+        def test_test_plays_a_sound_without_waiting_for_it(self, daemon):
+            response = daemon.handle("test", [])
+
+            assert response["ok"] is True
+            assert daemon.alarm.sounds.played.wait(timeout=1) is True
+
+        def test_status_describes_the_alarm(self, daemon):
+            daemon.handle("start", [])
+
+            response = daemon.handle("status", [])
+
+            assert response["message"] == "The alarm is set for 09:30"
+            assert response["data"]["pid"] == os.getpid()
+
+        def test_unknown_commands_fail(self, daemon):
+            assert daemon.handle("dance", [])["ok"] is False
+
+    class TestServe:
+
+        def test_answers_clients_until_shut_down(self, daemon, address):
+            serving = threading.Thread(target=daemon.serve)
+            serving.start()
+
+            try:
+                assert control.wait_for_daemon(address, timeout=5) is True
+                assert control.send_command("start", address=address)["ok"] is True
+            finally:
+                control.send_command("shutdown", address=address)
+                serving.join(timeout=5)
+
+            assert serving.is_alive() is False
+            assert daemon.alarm.is_set is False
+            assert control.is_daemon_running(address) is False
+
+        def test_refreshes_the_token_in_background_while_serving(
+            self, daemon, address, monkeypatch: pytest.MonkeyPatch
+        ):
+            contexts = datatype.Contexts(
+                MockAuth(), MockConfig(api_enabled=True)  # type: ignore
+            )
+            monkeypatch.setattr(
+                "move_alarm.components.daemon.use_context", lambda: contexts
+            )
+            serving = threading.Thread(target=daemon.serve)
+            serving.start()
+
+            try:
+                control.wait_for_daemon(address, timeout=5)
+                assert contexts.auth.refreshing is True
+            finally:
+                control.send_command("shutdown", address=address)
+                serving.join(timeout=5)
+
+            assert contexts.auth.refreshing is False
+
+        def test_logs_in_before_serving_when_the_api_is_enabled(
+            self, daemon, address, monkeypatch: pytest.MonkeyPatch
+        ):
+            contexts = datatype.Contexts(
+                MockAuth(), MockConfig(api_enabled=True)  # type: ignore
+            )
+            monkeypatch.setattr(
+                "move_alarm.components.daemon.use_context", lambda: contexts
+            )
+            serving = threading.Thread(target=daemon.serve)
+            serving.start()
+
+            try:
+                control.wait_for_daemon(address, timeout=5)
+                assert contexts.auth.logged_in is True
+            finally:
+                control.send_command("shutdown", address=address)
+                serving.join(timeout=5)
+
+        def test_does_not_log_in_when_the_api_is_disabled(
+            self, daemon, address, monkeypatch: pytest.MonkeyPatch
+        ):
+            contexts = datatype.Contexts(MockAuth(), MockConfig())  # type: ignore
+            monkeypatch.setattr(
+                "move_alarm.components.daemon.use_context", lambda: contexts
+            )
+            serving = threading.Thread(target=daemon.serve)
+            serving.start()
+
+            try:
+                control.wait_for_daemon(address, timeout=5)
+            finally:
+                control.send_command("shutdown", address=address)
+                serving.join(timeout=5)
+
+            assert contexts.auth.logged_in is False
+
+        def test_stops_if_nobody_can_log_in(
+            self, daemon, address, monkeypatch: pytest.MonkeyPatch, capfd
+        ):
+            contexts = datatype.Contexts(
+                MockAuth(), MockConfig(api_enabled=True)  # type: ignore
+            )
+
+            def no_terminal() -> None:
+                raise EOFError
+
+            monkeypatch.setattr(contexts.auth, "get_token", no_terminal)
+            monkeypatch.setattr(
+                "move_alarm.components.daemon.use_context", lambda: contexts
+            )
+
+            with pytest.raises(EOFError):
+                daemon.serve()
+
+            out, err = capfd.readouterr()
+            assert "log in to Freesound" in out
+            assert control.is_daemon_running(address) is False
+            assert daemon._instance_lock.acquire(blocking=False) is True
+            daemon._instance_lock.release()
+
+        def test_serves_local_sounds_if_the_login_fails(
+            self, daemon, monkeypatch: pytest.MonkeyPatch, capfd
+        ):
+            contexts = datatype.Contexts(
+                MockAuth(), MockConfig(api_enabled=True)  # type: ignore
+            )
+
+            def offline() -> None:
+                raise ConnectionError("Freesound is unreachable")
+
+            monkeypatch.setattr(contexts.auth, "get_token", offline)
+
+            daemon.log_in(contexts)
+
+            out, err = capfd.readouterr()
+            assert "Freesound is unreachable" in out
+
+        def test_refreshing_follows_the_api_enabled_setting(self, daemon):
+            contexts = datatype.Contexts(MockAuth(), MockConfig())  # type: ignore
+
+            daemon.refresh_in_background(contexts)
+            assert contexts.auth.refreshing is False
+
+            contexts.config.api_enabled = True
+            daemon.refresh_in_background(contexts)
+            assert contexts.auth.refreshing is True
+
+    class TestSingleInstance:
+
+        @pytest.fixture
+        def contexts_built(self, monkeypatch: pytest.MonkeyPatch) -> list[None]:
+            built: list[None] = []
+            monkeypatch.setattr(
+                "move_alarm.components.daemon.use_context", lambda: built.append(None)
+            )
+            return built
+
+        @pytest.fixture
+        def serving(self, daemon, address):
+            serving = threading.Thread(target=daemon.serve)
+            serving.start()
+            control.wait_for_daemon(address, timeout=5)
+
+            yield daemon
+
+            control.send_command("shutdown", address=address)
+            serving.join(timeout=5)
+
+        def test_a_second_daemon_stops_before_building_anything(
+            self, serving, address, contexts_built
+        ):
+            second = Daemon(address)
+
+            with pytest.raises(datatype.DaemonAlreadyRunningError):
+                second.serve()
+
+            assert contexts_built == []
+            assert control.send_command("ping", address=address)["ok"] is True
+
+        def test_the_lock_is_released_on_shutdown(self, daemon, address):
+            serving = threading.Thread(target=daemon.serve)
+            serving.start()
+            control.wait_for_daemon(address, timeout=5)
+            control.send_command("shutdown", address=address)
+            serving.join(timeout=5)
+
+            lock = utils.FileLock(control.lock_path(address))
+
+            assert lock.acquire(blocking=False) is True
+            lock.release()
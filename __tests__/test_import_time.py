@@ -0,0 +1,104 @@
+import subprocess, sys, threading
+import pytest
+from move_alarm.utils.lazy_import import LazyAttribute, LazyModule
+
+# Only needed once a sound plays or Freesound is called
+HEAVY_MODULES = [
+    "requests",
+    "simpleaudio",
+    "dotenv",
+    "webbrowser",
+    "asyncio",
+    "http.server",
+]
+# Microseconds, the best of a few runs to smooth over a cold disk cache
+IMPORT_BUDGET = 100_000
+
+
+def import_times(statement: str) -> dict[str, int]:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    times: dict[str, int] = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        times[name.strip()] = int(cumulative)
+
+    return times
+
+
+class TestImportTime:
+
+    @pytest.mark.parametrize(
+        "module", ["move_alarm.app", "move_alarm.components", "move_alarm.utils"]
+    )
+    def test_heavy_modules_are_not_imported(self, module):
+        imported = import_times(f"import {module}")
+
+        assert [name for name in HEAVY_MODULES if name in imported] == []
+
+    def test_defining_alarm_does_not_build_sounds(self):
+        imported = import_times(
+            "from move_alarm.components import Alarm; Alarm(); "
+            "import sys; assert 'simpleaudio' not in sys.modules"
+        )
+
+        assert "move_alarm.components.alarm" in imported
+
+    @pytest.mark.parametrize("module", ["move_alarm.app", "move_alarm.components"])
+    def test_imports_within_budget(self, module):
+        best = min(import_times(f"import {module}")[module] for _ in range(0, 3))
+
+        assert best < IMPORT_BUDGET
+
+    def test_cli_commands_do_not_load_the_alarm(self):
+        imported = import_times("import move_alarm.app")
+
+        assert "move_alarm.components" not in imported
+
+
+class TestLazyModule:
+
+    def test_imports_on_first_attribute_access(self):
+        module = LazyModule("json")
+
+        assert module.is_loaded is False
+        assert module.dumps([1]) == "[1]"
+        assert module.is_loaded is True
+
+    def test_assignments_reach_the_real_module(self, monkeypatch: pytest.MonkeyPatch):
+        import json
+
+        module = LazyModule("json")
+        monkeypatch.setattr(module, "dumps", lambda value: "patched")
+
+        assert json.dumps([1]) == "patched"
+
+
+class TestLazyAttribute:
+
+    def test_builds_once_for_every_reader(self):
+        built = []
+
+        class Owner:
+            shared = LazyAttribute(lambda: built.append(None) or object())
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(Owner().shared))
+            for _ in range(0, 8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(built) == 1
+        assert all(result is results[0] for result in results)
+        assert Owner.shared is results[0]
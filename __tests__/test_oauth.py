@@ -1,15 +1,47 @@
-import os, re, io
+import os, re, io, threading, time, urllib.request
 from datetime import datetime
 from collections.abc import Callable
 import pytest, pytest_mock, dotenv
+from move_alarm import utils
+from move_alarm.utils.rate_limit import TokenBucket
 from move_alarm.utils.oauth import HandleAuthorisation
 
 
+@pytest.fixture(autouse=True)
+def unlimited_freesound_bucket(monkeypatch: pytest.MonkeyPatch):
+    # Keeps the suite off the shared on-disk bucket that rate limits real calls
+    monkeypatch.setattr(
+        "move_alarm.utils.api_calls.freesound_bucket", TokenBucket(1000.0, 1000.0)
+    )
+    monkeypatch.setattr(
+        "move_alarm.utils.api_calls.token_bucket", TokenBucket(1000.0, 1000.0)
+    )
+
+
+@pytest.fixture(autouse=True)
+def reset_circuit_breakers():
+    yield
+    utils.token_breaker.reset()
+
+
 @pytest.fixture(scope="class")
 def define_env_path():
     return os.path.join(os.path.dirname(__file__)[:-9], "move_alarm", ".env.test")
 
 
+@pytest.fixture(autouse=True)
+def remove_token_store_files(define_env_path):
+    for path in [define_env_path + ".token", define_env_path + ".lock"]:
+        if os.path.exists(path):
+            os.remove(path)
+
+    yield
+
+    for path in [define_env_path + ".token", define_env_path + ".lock"]:
+        if os.path.exists(path):
+            os.remove(path)
+
+
 @pytest.fixture(scope="class", autouse=True)
 def env_path(request: pytest.FixtureRequest, define_env_path):
     request.cls.pytest_fixture_env_path = define_env_path
@@ -87,7 +119,7 @@ class TestHandleAuthorisation:
                     "refresh_token": "0354489231f6a874331aer4927569297c7fea4d5",
                 }
 
-        monkeypatch.setattr("requests.get", lambda _: MockResponse())
+        monkeypatch.setattr("requests.get", lambda *args, **kwargs: MockResponse())
 
     @pytest.fixture(name="401 mock API request / response")
     def mock_401_api_request_and_response(
@@ -101,7 +133,7 @@ class TestHandleAuthorisation:
             def text(self):
                 return "The credentials you provided are invalid."
 
-        monkeypatch.setattr("requests.get", lambda _: MockResponse())
+        monkeypatch.setattr("requests.get", lambda *args, **kwargs: MockResponse())
 
     @pytest.fixture(name="404 mock API request / response")
     def mock_404_api_request_and_response(
@@ -115,7 +147,7 @@ class TestHandleAuthorisation:
             def text(self):
                 return "The information that the request is trying to access does not exist."
 
-        monkeypatch.setattr("requests.get", lambda _: MockResponse())
+        monkeypatch.setattr("requests.get", lambda *args, **kwargs: MockResponse())
 
     @pytest.fixture(name="429 mock API request / response")
     def mock_429_api_request_and_response(
@@ -126,12 +158,16 @@ class TestHandleAuthorisation:
             def status_code(self):
                 return 429
 
+            @property
+            def headers(self):
+                return {"Retry-After": "0"}
+
             def text(self):
                 return (
                     "The request was throttled because of exceeding request limit rates"
                 )
 
-        monkeypatch.setattr("requests.get", lambda _: MockResponse())
+        monkeypatch.setattr("requests.get", lambda *args, **kwargs: MockResponse())
 
     @pytest.fixture(name="Unknown bad mock API request / response")
     def mock_4xx_5xx_api_request_and_response(
@@ -145,7 +181,7 @@ class TestHandleAuthorisation:
             def text(self):
                 return "An unknown bad thing happened..."
 
-        monkeypatch.setattr("requests.get", lambda _: MockResponse())
+        monkeypatch.setattr("requests.get", lambda *args, **kwargs: MockResponse())
 
     @pytest.fixture(name="Mock time sleep")
     def mock_time_sleep(self, monkeypatch: pytest.MonkeyPatch):
@@ -431,6 +467,43 @@ class TestHandleAuthorisation:
             with pytest.raises(ValueError):
                 ha.get_user_permission()
 
+        def test_with_a_callback_port_the_code_comes_from_the_redirect(
+            self, monkeypatch: pytest.MonkeyPatch
+        ):
+            ha = HandleAuthorisation("client id", callback_port=0)
+            ha._state = "mockstate"
+
+            def mock_open_browser(url: str):
+                redirect_uri = re.search("redirect_uri=([^&]+)", url).group(1)
+                redirect_uri = redirect_uri.replace("%3A", ":").replace("%2F", "/")
+                code = "6Wc9r2zbAcatxfjnAB63hzsOElGCtlbXmn3ZHzJh"
+                urllib.request.urlopen(
+                    f"{redirect_uri}?code={code}&state=mockstate", timeout=2
+                ).close()
+
+            monkeypatch.setattr("webbrowser.open", mock_open_browser)
+
+            assert ha.get_user_permission() is True
+            assert ha.oauth_code == "6Wc9r2zbAcatxfjnAB63hzsOElGCtlbXmn3ZHzJh"
+
+        def test_never_prompts_from_a_background_thread(self, mock_input_to_terminal):
+            ha = HandleAuthorisation("client id")
+            mock_input_to_terminal("6Wc9r2zbAcatxfjnAB63hzsOElGCtlbXmn3ZHzJh")
+            errors = []
+
+            def get_user_permission():
+                try:
+                    ha.get_user_permission()
+                except PermissionError as error:
+                    errors.append(error)
+
+            thread = threading.Thread(target=get_user_permission)
+            thread.start()
+            thread.join()
+
+            assert len(errors) == 1
+            assert ha.oauth_code is None
+
     class TestRequestOauthToken:
 
         @property
@@ -535,6 +608,25 @@ class TestHandleAuthorisation:
 
             mock_get_user_permission.assert_called_once()
 
+        @pytest.mark.usefixtures("200 mock API request / response")
+        def test_does_not_hold_the_token_lock_while_the_user_logs_in(
+            self, monkeypatch: pytest.MonkeyPatch
+        ):
+            ha = HandleAuthorisation("client id")
+            locked = []
+
+            def get_user_permission():
+                locked.append(ha._store.lock.is_locked)
+                ha.oauth_code = "6Wc9r2zbAcatxfjnAB63hzsOElGCtlbXmn3ZHzJh"
+                return True
+
+            monkeypatch.setattr(ha, "get_user_permission", get_user_permission)
+
+            token = ha.get_token()
+
+            assert locked == [False]
+            assert token == "64c64660ceed813476b314f52136d9698e075622"
+
         @pytest.mark.usefixtures("200 mock API request / response")
         def test_if_env_file_missing_creates_valid_env_file(
             self, mock_input_to_terminal
@@ -602,3 +694,268 @@ class TestHandleAuthorisation:
 
             assert token == "64c64660ceed813476b314f52136d9698e075622"
             assert ha.oauth_code is None
+
+        @pytest.mark.usefixtures("200 mock API request / response")
+        def test_reuses_the_access_token_until_it_expires(
+            self, mocker: pytest_mock.MockerFixture, create_mock_env_file
+        ):
+            create_mock_env_file(self.valid_env_vars, self.env_path)
+            ha = HandleAuthorisation()
+            spy_request_oauth_token = mocker.spy(ha, "request_oauth_token")
+
+            first_token = ha.get_token()
+            second_token = ha.get_token()
+
+            assert first_token == second_token
+            spy_request_oauth_token.assert_called_once()
+            assert ha.token_expires_in > 86000
+
+        @pytest.mark.usefixtures("200 mock API request / response")
+        def test_refreshes_shortly_before_the_access_token_expires(
+            self, mocker: pytest_mock.MockerFixture, create_mock_env_file
+        ):
+            create_mock_env_file(self.valid_env_vars, self.env_path)
+            ha = HandleAuthorisation()
+            ha.cache_token("old token", ha.refresh_margin - 1)
+            spy_request_oauth_token = mocker.spy(ha, "request_oauth_token")
+
+            token = ha.get_token()
+
+            assert token == "64c64660ceed813476b314f52136d9698e075622"
+            spy_request_oauth_token.assert_called_once()
+
+        @pytest.mark.usefixtures("200 mock API request / response")
+        def test_invalidate_token_forces_a_refresh(
+            self, mocker: pytest_mock.MockerFixture, create_mock_env_file
+        ):
+            create_mock_env_file(self.valid_env_vars, self.env_path)
+            ha = HandleAuthorisation()
+            ha.get_token()
+            spy_request_oauth_token = mocker.spy(ha, "request_oauth_token")
+
+            ha.invalidate_token()
+            ha.get_token()
+
+            spy_request_oauth_token.assert_called_once()
+
+        def test_concurrent_callers_share_one_refresh(
+            self, monkeypatch: pytest.MonkeyPatch, create_mock_env_file
+        ):
+            create_mock_env_file(self.valid_env_vars, self.env_path)
+            ha = HandleAuthorisation()
+            calls = []
+
+            def slow_request_oauth_token():
+                calls.append(None)
+                time.sleep(0.05)
+                ha.cache_token("shared token", 86399)
+                return "shared token"
+
+            monkeypatch.setattr(ha, "request_oauth_token", slow_request_oauth_token)
+            tokens = []
+            threads = [
+                threading.Thread(target=lambda: tokens.append(ha.get_token()))
+                for _ in range(0, 5)
+            ]
+            [thread.start() for thread in threads]
+            [thread.join() for thread in threads]
+
+            assert len(calls) == 1
+            assert tokens == ["shared token"] * 5
+
+        def test_concurrent_callers_share_a_failed_refresh(
+            self, monkeypatch: pytest.MonkeyPatch, create_mock_env_file
+        ):
+            create_mock_env_file(self.valid_env_vars, self.env_path)
+            ha = HandleAuthorisation()
+            calls = []
+
+            def failing_request_oauth_token():
+                calls.append(None)
+                time.sleep(0.05)
+                raise ConnectionError("Mock outage")
+
+            monkeypatch.setattr(ha, "request_oauth_token", failing_request_oauth_token)
+            errors = []
+
+            def get_token():
+                try:
+                    ha.get_token()
+                except ConnectionError as error:
+                    errors.append(error)
+
+            threads = [threading.Thread(target=get_token) for _ in range(0, 3)]
+            [thread.start() for thread in threads]
+            [thread.join() for thread in threads]
+
+            assert len(errors) == 3
+            assert len(calls) < 3
+
+    class TestBackgroundRefresh:
+
+        @property
+        def env_path(self):
+            return self.pytest_fixture_env_path
+
+        @property
+        def valid_env_vars(self):
+            return self.pytest_fixture_valid_env_vars
+
+        @pytest.fixture(autouse=True)
+        def before_each(self, remove_env_file):
+            remove_env_file(self.env_path)
+
+        @pytest.fixture
+        def stop_refreshing(self):
+            handlers: list[HandleAuthorisation] = []
+
+            yield handlers.append
+
+            for handler in handlers:
+                handler.stop_background_refresh()
+            for thread in threading.enumerate():
+                if thread.name == "MoveTokenRefresh":
+                    thread.join(timeout=1)
+
+        @pytest.mark.usefixtures("200 mock API request / response")
+        def test_renews_the_token_before_it_expires(
+            self,
+            mocker: pytest_mock.MockerFixture,
+            create_mock_env_file,
+            stop_refreshing,
+        ):
+            create_mock_env_file(self.valid_env_vars, self.env_path)
+            ha = HandleAuthorisation()
+            stop_refreshing(ha)
+            ha.cache_token("old token", 2 * ha.refresh_margin)
+            spy_request_oauth_token = mocker.spy(ha, "request_oauth_token")
+
+            ha.start_background_refresh()
+            for _ in range(0, 1000):
+                if (
+                    spy_request_oauth_token.call_count > 0
+                    and ha.token_expires_in > 86000
+                ):
+                    break
+                time.sleep(0.001)
+
+            spy_request_oauth_token.assert_called_once()
+            assert ha.get_token() == "64c64660ceed813476b314f52136d9698e075622"
+
+        def test_schedules_the_next_refresh_ahead_of_expiry(self, stop_refreshing):
+            ha = HandleAuthorisation("client id")
+            stop_refreshing(ha)
+            ha.cache_token("token", 3600)
+
+            ha.start_background_refresh()
+
+            assert ha.is_refreshing_in_background is True
+            assert 3600 - 2 * ha.refresh_margin - 1 < ha.next_refresh_delay() <= 3480
+
+        def test_short_lived_tokens_are_not_refreshed_in_a_tight_loop(
+            self,
+            mocker: pytest_mock.MockerFixture,
+            create_mock_env_file,
+            stop_refreshing,
+        ):
+            create_mock_env_file(self.valid_env_vars, self.env_path)
+            ha = HandleAuthorisation()
+            stop_refreshing(ha)
+            mocker.patch.object(
+                ha,
+                "refresh_single_flight",
+                side_effect=lambda force: ha.cache_token("token", 10),
+            )
+            mock_schedule = mocker.patch.object(ha, "schedule_background_refresh")
+            ha._refresh_timer = mocker.Mock()
+
+            ha.background_refresh()
+
+            mock_schedule.assert_called_once_with(ha.background_minimum)
+
+        def test_stop_cancels_the_timer(self):
+            ha = HandleAuthorisation("client id")
+            ha.cache_token("token", 3600)
+            ha.start_background_refresh()
+
+            ha.stop_background_refresh()
+
+            assert ha.is_refreshing_in_background is False
+            for thread in threading.enumerate():
+                if thread.name == "MoveTokenRefresh":
+                    thread.join(timeout=1)
+            assert not any(
+                thread.name == "MoveTokenRefresh" for thread in threading.enumerate()
+            )
+
+        def test_never_asks_the_user_to_log_in(self, mocker: pytest_mock.MockerFixture):
+            ha = HandleAuthorisation("client id")
+            mock_get_user_permission = mocker.patch(
+                "move_alarm.utils.oauth.HandleAuthorisation.get_user_permission"
+            )
+
+            ha.background_refresh()
+
+            mock_get_user_permission.assert_not_called()
+
+    class TestTokenStore:
+
+        @property
+        def env_path(self):
+            return self.pytest_fixture_env_path
+
+        @property
+        def valid_env_vars(self):
+            return self.pytest_fixture_valid_env_vars
+
+        @pytest.fixture(autouse=True)
+        def before_each(self, remove_env_file):
+            remove_env_file(self.env_path)
+
+        @pytest.mark.usefixtures("200 mock API request / response")
+        def test_a_second_process_reuses_the_shared_access_token(
+            self, mocker: pytest_mock.MockerFixture, create_mock_env_file
+        ):
+            create_mock_env_file(self.valid_env_vars, self.env_path)
+            first = HandleAuthorisation()
+            second = HandleAuthorisation()
+            first.get_token()
+            spy_request_oauth_token = mocker.spy(second, "request_oauth_token")
+
+            token = second.get_token()
+
+            assert token == "64c64660ceed813476b314f52136d9698e075622"
+            spy_request_oauth_token.assert_not_called()
+
+        @pytest.mark.usefixtures("200 mock API request / response")
+        def test_env_file_keeps_only_its_three_keys(self, create_mock_env_file):
+            create_mock_env_file(self.valid_env_vars, self.env_path)
+            ha = HandleAuthorisation()
+
+            ha.get_token()
+
+            env_dict = dotenv.dotenv_values(self.env_path)
+            assert list(env_dict.keys()) == self.valid_env_vars
+
+        @pytest.mark.usefixtures("200 mock API request / response")
+        def test_invalidate_token_removes_the_shared_token(
+            self, mocker: pytest_mock.MockerFixture, create_mock_env_file
+        ):
+            create_mock_env_file(self.valid_env_vars, self.env_path)
+            first = HandleAuthorisation()
+            second = HandleAuthorisation()
+            first.get_token()
+            first.invalidate_token()
+            spy_request_oauth_token = mocker.spy(second, "request_oauth_token")
+
+            second.get_token()
+
+            spy_request_oauth_token.assert_called_once()
+
+        def test_writes_leave_no_temporary_files(self):
+            ha = HandleAuthorisation("client id")
+
+            ha.set_dotenv_file("refresh")
+
+            directory = os.path.dirname(self.env_path)
+            assert not any(name.endswith(".tmp") for name in os.listdir(directory))
@@ -0,0 +1,78 @@
+import threading
+import urllib.error, urllib.request
+import pytest
+from move_alarm.utils.oauth_callback import OAuthCallbackServer
+
+
+class TestOAuthCallbackServer:
+
+    @pytest.fixture
+    def callback_server(self):
+        servers: list[OAuthCallbackServer] = []
+
+        def _callback_server(state: str = "mockstate", timeout: float = 2.0):
+            server = OAuthCallbackServer(state, timeout=timeout)
+            server.start()
+            servers.append(server)
+            return server
+
+        yield _callback_server
+
+        for server in servers:
+            server.stop()
+
+    @pytest.fixture
+    def visit(self):
+        def _visit(url: str) -> int:
+            try:
+                with urllib.request.urlopen(url, timeout=2) as response:
+                    return response.status
+            except urllib.error.HTTPError as error:
+                return error.code
+
+        return _visit
+
+    def test_listens_on_the_loopback_interface_only(self, callback_server):
+        server = callback_server()
+
+        assert server.redirect_uri.startswith("http://127.0.0.1:")
+        assert server.port > 0
+
+    def test_captures_the_code_from_the_redirect(self, callback_server, visit):
+        server = callback_server()
+
+        status = visit(f"{server.redirect_uri}?code=mockcode123&state=mockstate")
+
+        assert status == 200
+        assert server.wait_for_code() == "mockcode123"
+
+    def test_ignores_a_redirect_with_the_wrong_state(self, callback_server, visit):
+        server = callback_server(timeout=0.2)
+
+        status = visit(f"{server.redirect_uri}?code=forged&state=otherstate")
+
+        assert status == 400
+        with pytest.raises(TimeoutError):
+            server.wait_for_code()
+
+    def test_raises_when_the_user_denies_access(self, callback_server, visit):
+        server = callback_server()
+
+        visit(f"{server.redirect_uri}?error=access_denied&state=mockstate")
+
+        with pytest.raises(ConnectionRefusedError):
+            server.wait_for_code()
+
+    def test_times_out_on_its_own(self, callback_server):
+        server = callback_server(timeout=0.05)
+
+        with pytest.raises(TimeoutError):
+            server.wait_for_code()
+
+    def test_stop_leaves_no_threads_behind(self):
+        with OAuthCallbackServer("mockstate"):
+            pass
+
+        assert not any(
+            thread.name == "MoveOAuthCallback" for thread in threading.enumerate()
+        )
@@ -0,0 +1,186 @@
+import contextvars, threading
+from time import sleep
+import pytest
+from move_alarm.utils.prefetch import SoundPrefetcher
+import move_alarm.datatypes as datatype
+
+
+class TestSoundPrefetcher:
+
+    @pytest.fixture
+    def mock_fetch(self):
+        calls = []
+
+        def _mock_fetch() -> datatype.PreparedSound:
+            calls.append(None)
+            return datatype.PreparedSound(f"sound_{len(calls)}.wav", None)
+
+        _mock_fetch.calls = calls
+        return _mock_fetch
+
+    @pytest.fixture
+    def wait_for_prefetch(self):
+        def _wait_for_prefetch(prefetcher: SoundPrefetcher, ready: int) -> None:
+            for _ in range(0, 1000):
+                if prefetcher.ready >= ready:
+                    return
+                sleep(0.001)
+
+        return _wait_for_prefetch
+
+    @pytest.fixture
+    def stop_prefetcher(self):
+        prefetchers: list[SoundPrefetcher] = []
+
+        yield prefetchers.append
+
+        for prefetcher in prefetchers:
+            prefetcher.stop()
+        for thread in threading.enumerate():
+            if thread.name == "MovePrefetch":
+                thread.join(timeout=1)
+
+    class TestInitialisation:
+
+        def test_nothing_is_ready_before_starting(self, mock_fetch):
+            prefetcher = SoundPrefetcher(mock_fetch, 3)
+
+            assert prefetcher.ready == 0
+            assert prefetcher.is_running is False
+
+        def test_raises_value_error_on_negative_size(self, mock_fetch):
+            with pytest.raises(ValueError):
+                SoundPrefetcher(mock_fetch, -1)
+
+    class TestStart:
+
+        def test_fills_the_queue_up_to_size(
+            self, mock_fetch, wait_for_prefetch, stop_prefetcher
+        ):
+            prefetcher = SoundPrefetcher(mock_fetch, 3)
+            stop_prefetcher(prefetcher)
+
+            prefetcher.start()
+            wait_for_prefetch(prefetcher, 3)
+            sleep(0.01)
+
+            assert prefetcher.ready == 3
+            assert len(mock_fetch.calls) == 3
+
+        def test_fetches_in_the_context_that_started_it(
+            self, stop_prefetcher, wait_for_prefetch
+        ):
+            user = contextvars.ContextVar("user", default="nobody")
+            seen = []
+
+            def fetch() -> datatype.PreparedSound:
+                seen.append(user.get())
+                return datatype.PreparedSound("sound.wav", None)
+
+            prefetcher = SoundPrefetcher(fetch, 1)
+            stop_prefetcher(prefetcher)
+
+            token = user.set("alice")
+            prefetcher.start()
+            user.reset(token)
+            wait_for_prefetch(prefetcher, 1)
+
+            assert seen == ["alice"]
+
+        def test_runs_in_a_separate_named_thread(self, mock_fetch, stop_prefetcher):
+            prefetcher = SoundPrefetcher(mock_fetch, 1)
+            stop_prefetcher(prefetcher)
+
+            prefetcher.start()
+
+            thread_names = [thread.name for thread in threading.enumerate()]
+            assert "MovePrefetch" in thread_names
+
+    class TestGet:
+
+        def test_returns_none_when_the_queue_is_empty(self, mock_fetch):
+            prefetcher = SoundPrefetcher(mock_fetch, 3)
+
+            assert prefetcher.get() is None
+
+        def test_returns_prepared_sounds_in_order(
+            self, mock_fetch, wait_for_prefetch, stop_prefetcher
+        ):
+            prefetcher = SoundPrefetcher(mock_fetch, 2)
+            stop_prefetcher(prefetcher)
+
+            prefetcher.start()
+            wait_for_prefetch(prefetcher, 2)
+
+            assert prefetcher.get().path == "sound_1.wav"
+            assert prefetcher.get().path == "sound_2.wav"
+
+        def test_refills_in_the_background_after_each_get(
+            self, mock_fetch, wait_for_prefetch, stop_prefetcher
+        ):
+            prefetcher = SoundPrefetcher(mock_fetch, 2)
+            stop_prefetcher(prefetcher)
+
+            prefetcher.start()
+            wait_for_prefetch(prefetcher, 2)
+            prefetcher.get()
+            wait_for_prefetch(prefetcher, 2)
+
+            assert prefetcher.ready == 2
+            assert len(mock_fetch.calls) == 3
+
+    class TestIsFetching:
+
+        def test_is_fetching_while_the_fetch_runs(self, stop_prefetcher):
+            release = threading.Event()
+
+            def slow_fetch() -> datatype.PreparedSound:
+                release.wait(1)
+                return datatype.PreparedSound("sound.wav", None)
+
+            prefetcher = SoundPrefetcher(slow_fetch, 1)
+            stop_prefetcher(prefetcher)
+
+            prefetcher.start()
+            fetching = prefetcher.is_fetching
+            release.set()
+
+            assert fetching is True
+
+        def test_is_not_fetching_once_the_queue_is_full(
+            self, mock_fetch, wait_for_prefetch, stop_prefetcher
+        ):
+            prefetcher = SoundPrefetcher(mock_fetch, 1)
+            stop_prefetcher(prefetcher)
+
+            prefetcher.start()
+            wait_for_prefetch(prefetcher, 1)
+            sleep(0.01)
+
+            assert prefetcher.is_fetching is False
+
+    class TestFetchErrors:
+
+        def test_keeps_running_and_records_the_error(self, stop_prefetcher):
+            def failing_fetch():
+                raise ConnectionError("offline")
+
+            prefetcher = SoundPrefetcher(failing_fetch, 1, retry_interval=0.001)
+            stop_prefetcher(prefetcher)
+
+            prefetcher.start()
+            sleep(0.01)
+
+            assert prefetcher.is_running is True
+            assert prefetcher.ready == 0
+            assert isinstance(prefetcher.last_error, ConnectionError) is True
+
+    class TestClear:
+
+        def test_removes_all_queued_sounds(self, mock_fetch):
+            prefetcher = SoundPrefetcher(mock_fetch, 0)
+            prefetcher._queue.put(datatype.PreparedSound("a.wav", None))
+            prefetcher._queue.put(datatype.PreparedSound("b.wav", None))
+
+            assert prefetcher.clear() == 2
+            assert prefetcher.ready == 0
@@ -0,0 +1,178 @@
+import os, sys
+import pytest
+import move_alarm
+from move_alarm.utils import rate_limit
+from move_alarm.utils.bandwidth import BANDWIDTH_PATH
+from move_alarm.utils.state_directory import state_directory
+from move_alarm.utils.rate_limit import (
+    TokenBucket,
+    back_off,
+    get_retry_after,
+    request_with_backoff,
+)
+
+
+class TestRateLimit:
+
+    @property
+    def state_path(self) -> str:
+        return os.path.join(
+            os.path.dirname(__file__)[:-9], "move_alarm", ".ratelimit.test"
+        )
+
+    @pytest.fixture(autouse=True)
+    def before_each(self):
+        for path in [self.state_path, self.state_path + ".lock"]:
+            if os.path.exists(path):
+                os.remove(path)
+
+    @pytest.fixture
+    def mock_response(self):
+        class MockResponse:
+            def __init__(self, status_code: int, headers: dict[str, str] = {}):
+                self.status_code = status_code
+                self.headers = headers
+
+        return MockResponse
+
+    class TestTokenBucket:
+
+        @property
+        def state_path(self) -> str:
+            return TestRateLimit.state_path.fget(self)
+
+        def test_allows_a_burst_up_to_capacity(self):
+            bucket = TokenBucket(1, 5)
+
+            waits = [bucket.try_acquire() for _ in range(0, 5)]
+
+            assert waits == [0, 0, 0, 0, 0]
+
+        def test_returns_seconds_to_wait_when_empty(self):
+            bucket = TokenBucket(2, 1)
+
+            bucket.try_acquire()
+            wait = bucket.try_acquire()
+
+            assert 0 < wait <= 0.5
+
+        def test_block_for_makes_callers_wait(self):
+            bucket = TokenBucket(1, 5)
+
+            bucket.block_for(10)
+
+            assert bucket.try_acquire() > 9
+
+        def test_state_is_shared_through_the_state_file(self):
+            first = TokenBucket(1, 2, self.state_path)
+            second = TokenBucket(1, 2, self.state_path)
+
+            first.try_acquire()
+            first.try_acquire()
+
+            assert second.try_acquire() > 0
+
+        def test_raises_value_error_on_zero_rate(self):
+            with pytest.raises(ValueError):
+                TokenBucket(0, 1)
+
+        def test_makes_a_missing_state_directory(self, tmp_path):
+            state_path = str(tmp_path / "state" / "ratelimit")
+            bucket = TokenBucket(1, 2, state_path)
+
+            bucket.try_acquire()
+
+            assert os.path.exists(state_path)
+
+    class TestStateDirectory:
+
+        def test_state_files_are_kept_outside_the_package(self):
+            package = os.path.dirname(move_alarm.__file__)
+
+            for path in [
+                rate_limit.RATE_LIMIT_PATH,
+                rate_limit.TOKEN_RATE_LIMIT_PATH,
+                BANDWIDTH_PATH,
+            ]:
+                assert os.path.dirname(path) == state_directory()
+                assert not path.startswith(package)
+
+        @pytest.mark.skipif(
+            sys.platform in ("win32", "darwin"), reason="XDG is for Linux and BSD"
+        )
+        def test_follows_xdg_state_home(self, monkeypatch: pytest.MonkeyPatch):
+            monkeypatch.setenv("XDG_STATE_HOME", "/mock/state")
+
+            assert state_directory() == os.path.join("/mock/state", "move-alarm")
+
+    class TestGetRetryAfter:
+
+        def test_reads_seconds(self, mock_response):
+            assert get_retry_after(mock_response(429, {"Retry-After": "3"})) == 3
+
+        def test_returns_none_without_header(self, mock_response):
+            assert get_retry_after(mock_response(429)) is None
+
+        def test_reads_http_dates_in_the_past_as_zero(self, mock_response):
+            response = mock_response(
+                429, {"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"}
+            )
+
+            assert get_retry_after(response) == 0
+
+    class TestRequestWithBackoff:
+
+        def test_retries_429_until_success(self, mock_response):
+            responses = [
+                mock_response(429, {"Retry-After": "0"}),
+                mock_response(429, {"Retry-After": "0"}),
+                mock_response(200),
+            ]
+
+            response = request_with_backoff(lambda: responses.pop(0), TokenBucket(1, 5))
+
+            assert response.status_code == 200
+            assert len(responses) == 0
+
+        def test_returns_last_response_after_all_attempts(self, mock_response):
+            sent = []
+
+            def send():
+                sent.append(None)
+                return mock_response(429, {"Retry-After": "0"})
+
+            response = request_with_backoff(send, TokenBucket(1, 5), attempts=3)
+
+            assert response.status_code == 429
+            assert len(sent) == 3
+
+        def test_does_not_retry_other_errors(self, mock_response):
+            sent = []
+
+            def send():
+                sent.append(None)
+                return mock_response(500)
+
+            response = request_with_backoff(send, TokenBucket(1, 5))
+
+            assert response.status_code == 500
+            assert len(sent) == 1
+
+    class TestBackOff:
+
+        def test_caps_a_long_retry_after(self, mock_response):
+            bucket = TokenBucket(1, 5)
+
+            delay = back_off(
+                mock_response(429, {"Retry-After": "86400"}), bucket, max_delay=30
+            )
+
+            assert delay == 30
+            assert 0 < bucket.try_acquire() <= 30
+
+        def test_keeps_a_short_retry_after(self, mock_response):
+            delay = back_off(
+                mock_response(429, {"Retry-After": "2"}), TokenBucket(1, 5)
+            )
+
+            assert delay == 2
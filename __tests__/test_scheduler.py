@@ -0,0 +1,208 @@
+import os, shutil, tempfile, threading, time
+import pytest
+from move_alarm import utils
+
+
+class TestAlarmScheduler:
+
+    @pytest.fixture
+    def fired(self) -> list[str]:
+        return []
+
+    @pytest.fixture
+    def scheduler(self, fired):
+        scheduler = utils.AlarmScheduler(fired.append)
+        yield scheduler
+        scheduler.stop()
+
+    def test_schedule_returns_the_wall_clock_due_time(self, scheduler):
+        due = scheduler.schedule("ada", 60)
+
+        assert due == pytest.approx(time.time() + 60, abs=1)
+        assert scheduler.due_at("ada") == pytest.approx(due, abs=0.01)
+        assert len(scheduler) == 1
+
+    def test_pop_due_returns_keys_in_due_order(self, scheduler):
+        scheduler.schedule("late", 0.02)
+        scheduler.schedule("early", 0)
+        scheduler.schedule("later", 60)
+        time.sleep(0.03)
+
+        assert scheduler.pop_due() == ["early", "late"]
+        assert scheduler.due_at("early") is None
+        assert len(scheduler) == 1
+
+    def test_rescheduling_replaces_the_previous_due_time(self, scheduler):
+        scheduler.schedule("ada", 0)
+        scheduler.schedule("ada", 60)
+
+        assert scheduler.pop_due() == []
+        assert len(scheduler) == 1
+
+    def test_cancel_removes_the_alarm(self, scheduler):
+        scheduler.schedule("ada", 0)
+
+        assert scheduler.cancel("ada") is True
+        assert scheduler.cancel("ada") is False
+        assert scheduler.pop_due() == []
+        assert scheduler.next_wait() is None
+
+    def test_postpone_adds_to_the_remaining_time(self, scheduler):
+        due = scheduler.schedule("ada", 60)
+
+        assert scheduler.postpone("ada", 30) == pytest.approx(due + 30, abs=0.1)
+        assert scheduler.postpone("bob", 30) is None
+
+    def test_heap_stays_in_line_with_the_live_alarms(self, scheduler):
+        for _ in range(1000):
+            scheduler.schedule("ada", 60)
+            scheduler.schedule("bob", 60)
+
+        assert len(scheduler) == 2
+        assert len(scheduler._heap) <= 2 * len(scheduler) + 64 + 1
+
+    class TestThread:
+
+        def test_calls_on_due_when_an_alarm_is_due(self):
+            rang = threading.Event()
+            scheduler = utils.AlarmScheduler(lambda key: rang.set())
+            scheduler.start()
+
+            try:
+                scheduler.schedule("ada", 0.05)
+                assert rang.wait(timeout=2)
+                assert len(scheduler) == 0
+            finally:
+                scheduler.stop()
+
+        def test_an_earlier_alarm_wakes_the_thread(self):
+            rang: list[str] = []
+            done = threading.Event()
+
+            def on_due(key: str) -> None:
+                rang.append(key)
+                done.set()
+
+            scheduler = utils.AlarmScheduler(on_due)
+            scheduler.start()
+
+            try:
+                scheduler.schedule("later", 60)
+                time.sleep(0.02)
+                scheduler.schedule("sooner", 0.01)
+                assert done.wait(timeout=2)
+                assert rang == ["sooner"]
+            finally:
+                scheduler.stop()
+
+        def test_on_due_may_schedule_the_next_alarm(self):
+            count = threading.Semaphore(0)
+            scheduler = utils.AlarmScheduler(lambda key: None)
+
+            def on_due(key: str) -> None:
+                count.release()
+                scheduler.schedule(key, 0.01)
+
+            scheduler._on_due = on_due
+            scheduler.start()
+
+            try:
+                scheduler.schedule("ada", 0)
+                for _ in range(3):
+                    assert count.acquire(timeout=2)
+            finally:
+                scheduler.stop()
+
+        def test_a_failing_callback_does_not_stop_the_thread(self, capsys):
+            rang = threading.Event()
+
+            def on_due(key: str) -> None:
+                if key == "bad":
+                    raise RuntimeError("no speaker")
+                rang.set()
+
+            scheduler = utils.AlarmScheduler(on_due)
+            scheduler.start()
+
+            try:
+                scheduler.schedule("bad", 0)
+                scheduler.schedule("good", 0.02)
+                assert rang.wait(timeout=2)
+            finally:
+                scheduler.stop()
+
+            assert "Alarm bad could not ring" in capsys.readouterr().out
+
+        def test_stop_ends_the_thread(self):
+            scheduler = utils.AlarmScheduler(lambda key: None)
+            scheduler.start()
+            assert scheduler.is_running
+
+            scheduler.stop()
+
+            assert not scheduler.is_running
+            assert "MoveScheduler" not in [t.name for t in threading.enumerate()]
+
+
+class TestSoundLibrary:
+
+    @pytest.fixture
+    def directory(self):
+        directory = tempfile.mkdtemp()
+        for name in ["b.wav", "a.wav", "notes.txt"]:
+            open(os.path.join(directory, name), "w").close()
+        yield directory
+        shutil.rmtree(directory, ignore_errors=True)
+
+    def test_lists_only_wav_files(self, directory):
+        library = utils.SoundLibrary()
+
+        assert library.sounds(directory) == (
+            os.path.join(directory, "a.wav"),
+            os.path.join(directory, "b.wav"),
+        )
+
+    def test_reuses_the_listing_until_the_directory_changes(
+        self, directory, monkeypatch: pytest.MonkeyPatch
+    ):
+        library = utils.SoundLibrary()
+        library.sounds(directory)
+
+        listed = []
+        listdir = os.listdir
+        monkeypatch.setattr(
+            "move_alarm.utils.sound_library.os.listdir",
+            lambda path: listed.append(path) or listdir(path),
+        )
+        library.sounds(directory)
+        assert listed == []
+
+        open(os.path.join(directory, "c.wav"), "w").close()
+        stat = os.stat(directory)
+        os.utime(directory, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+        assert len(library.sounds(directory)) == 3
+        assert listed == [directory]
+
+    def test_forgets_the_least_recently_used_directory(self, directory):
+        library = utils.SoundLibrary(max_directories=1)
+        other = tempfile.mkdtemp()
+
+        try:
+            library.sounds(directory)
+            library.sounds(other)
+
+            assert len(library) == 1
+            assert other in library._listings
+        finally:
+            shutil.rmtree(other, ignore_errors=True)
+
+    def test_pick_returns_none_for_an_empty_directory(self, directory):
+        library = utils.SoundLibrary()
+        empty = tempfile.mkdtemp()
+
+        try:
+            assert library.pick(empty) is None
+            assert library.pick(directory) in library.sounds(directory)
+        finally:
+            shutil.rmtree(empty, ignore_errors=True)
@@ -0,0 +1,340 @@
+import http.client, json, os, shutil, tempfile, threading, time
+import pytest
+from move_alarm import utils
+from move_alarm.components import AlarmService
+from move_alarm.control import http_api
+import move_alarm.datatypes as datatype
+
+
+class MockAuth(datatype.OauthObject):
+    def get_token(self) -> str | None:
+        return "token"
+
+
+class TestAlarmService:
+
+    @pytest.fixture
+    def data_directory(self):
+        directory = tempfile.mkdtemp()
+        yield directory
+        shutil.rmtree(directory, ignore_errors=True)
+
+    @pytest.fixture
+    def service(self, data_directory):
+        service = AlarmService(data_directory)
+        yield service
+        service.stop()
+
+    class TestAlarms:
+
+        def test_set_alarm_schedules_the_user(self, service):
+            status = service.set_alarm("ada")
+
+            assert status["user"] == "ada"
+            assert status["set"] is True
+            assert status["ringing"] is False
+            assert status["message"] == "Time to stretch!"
+            assert len(service.scheduler) == 1
+
+        def test_status_of_an_unknown_user_is_not_set(self, service):
+            status = service.status("bob")
+
+            assert status["set"] is False
+            assert status["time"] is None
+            assert service.user_count == 0
+
+        def test_snooze_alarm_requires_an_alarm(self, service):
+            with pytest.raises(datatype.AlarmNotSetError):
+                service.snooze_alarm("ada")
+
+        def test_snooze_alarm_delays_the_alarm(self, service):
+            service.set_alarm("ada")
+            before = service.scheduler.due_at("ada")
+
+            service.snooze_alarm("ada")
+
+            assert service.scheduler.due_at("ada") == pytest.approx(
+                before + 5 * 60, abs=1
+            )
+
+        def test_remove_alarm_forgets_users_on_the_default_settings(self, service):
+            service.set_alarm("ada")
+
+            assert service.remove_alarm("ada") is True
+            assert service.remove_alarm("ada") is False
+            assert service.user_count == 0
+            assert len(service.scheduler) == 0
+
+        def test_invalid_user_names_are_rejected(self, service):
+            with pytest.raises(ValueError):
+                service.set_alarm("../ada")
+
+    class TestRing:
+
+        def test_ring_marks_the_user_ringing_and_starts_the_next_cycle(self, service):
+            service.set_alarm("ada")
+            service.scheduler.cancel("ada")
+
+            service.ring("ada")
+            status = service.status("ada")
+
+            assert status["ringing"] is True
+            assert status["sound"] in service.library.sounds(
+                service.default_config.wav_directory
+            )
+            assert status["set"] is True
+
+        def test_ring_ignores_removed_users(self, service):
+            service.ring("ada")
+
+            assert service.user_count == 0
+            assert len(service.scheduler) == 0
+
+        def test_scheduler_rings_due_alarms(self, service, monkeypatch):
+            rang = threading.Event()
+            ring = service.ring
+
+            def mock_ring(user: str) -> None:
+                ring(user)
+                rang.set()
+
+            monkeypatch.setattr(service.scheduler, "_on_due", mock_ring)
+            service.start()
+            service.require_tenant("ada")
+            service.scheduler.schedule("ada", 0)
+
+            assert rang.wait(timeout=2)
+            assert service.status("ada")["ringing"] is True
+
+    class TestConfig:
+
+        def test_users_share_the_default_config(self, service):
+            service.set_alarm("ada")
+
+            assert service.get_config("ada") == service.get_config("bob")
+            assert not os.path.exists(service.config_path("ada"))
+
+        def test_update_config_saves_the_users_own_file(self, service):
+            config = service.update_config("ada", {"Alarm": {"interval": 600}})
+
+            assert config["Alarm"]["interval"] == 600
+            assert service.get_config("bob")["Alarm"]["interval"] == 3600
+
+            with open(service.config_path("ada"), "r") as file:
+                assert json.load(file)["Alarm"]["interval"] == 600
+
+        def test_set_alarm_uses_the_users_interval(self, service):
+            service.update_config("ada", {"Alarm": {"interval": 600}})
+            service.set_alarm("ada")
+            service.set_alarm("bob")
+
+            ada = service.scheduler.due_at("ada")
+            bob = service.scheduler.due_at("bob")
+
+            assert bob - ada == pytest.approx(3000, abs=1)
+
+        def test_update_config_rejects_invalid_values(self, service):
+            with pytest.raises(ValueError):
+                service.update_config("ada", {"Alarm": {"interval": "soon"}})
+
+            assert not os.path.exists(service.config_path("ada"))
+
+        def test_sound_directories_inside_the_sounds_directory_are_allowed(
+            self, service
+        ):
+            directory = os.path.join(service.sounds_directory, "ada")
+            os.mkdir(directory)
+
+            config = service.update_config("ada", {"Sounds": {"path": directory}})
+
+            assert config["Sounds"]["path"] == directory
+
+        def test_sound_directories_elsewhere_on_the_server_are_rejected(self, service):
+            with pytest.raises(ValueError):
+                service.update_config("ada", {"Sounds": {"path": os.path.sep}})
+
+            assert not os.path.exists(service.config_path("ada"))
+
+        def test_symlinks_out_of_the_sounds_directory_are_rejected(self, service):
+            link = os.path.join(service.sounds_directory, "escape")
+            os.symlink(os.path.dirname(service.sounds_directory), link)
+
+            with pytest.raises(ValueError):
+                service.update_config("ada", {"Sounds": {"path": link}})
+
+        def test_saved_configs_are_loaded_by_a_new_service(
+            self, service, data_directory
+        ):
+            service.update_config("ada", {"Alarm": {"message": "Walk!"}})
+
+            restarted = AlarmService(data_directory)
+
+            assert restarted.status("ada")["message"] == "Walk!"
+
+    class TestFreesound:
+
+        @pytest.fixture
+        def searches(self, service, monkeypatch: pytest.MonkeyPatch):
+            searches: list[list[str]] = []
+            downloads: list[str] = []
+
+            def mock_search_for_sounds(token, themes=[], session=None, filters=None):
+                searches.append(themes)
+                return [{"id": 7, "download": "https://freesound/7"}]
+
+            def mock_download_sound(token, url, new_path, **kwargs):
+                downloads.append(url)
+                shutil.copy(
+                    service.library.pick(service.default_config.wav_directory), new_path
+                )
+                return "digest"
+
+            monkeypatch.setattr(
+                "move_alarm.utils.api_calls.search_for_sounds", mock_search_for_sounds
+            )
+            monkeypatch.setattr(
+                "move_alarm.utils.api_calls.download_sound", mock_download_sound
+            )
+            monkeypatch.setattr(
+                "move_alarm.utils.download_budget", utils.BandwidthBudget(0)
+            )
+
+            service.default_config.api_enabled = True
+            service.enable_freesound(MockAuth())
+
+            yield searches, downloads
+
+            utils.freesound_breaker.reset()
+
+        def wait_for_fetches(self, service) -> None:
+            for _ in range(0, 1000):
+                if len(service.freesound._pending) == 0:
+                    return
+                time.sleep(0.001)
+
+        def test_set_alarm_fetches_a_sound_for_the_first_ring(self, service, searches):
+            service.set_alarm("ada")
+            self.wait_for_fetches(service)
+            service.scheduler.cancel("ada")
+
+            service.ring("ada")
+
+            sound = service.status("ada")["sound"]
+            assert sound == os.path.join(service.sounds_directory, "freesound", "7.wav")
+
+        def test_users_share_downloaded_sounds(self, service, searches):
+            service.set_alarm("ada")
+            self.wait_for_fetches(service)
+            service.update_config("bob", {"Sounds": {"themes": ["piano", "guitar"]}})
+            service.set_alarm("bob")
+            self.wait_for_fetches(service)
+
+            searched, downloaded = searches
+            assert len(searched) == 2
+            assert downloaded == ["https://freesound/7"]
+
+        def test_users_without_freesound_hear_local_sounds(self, service, searches):
+            service.update_config("ada", {"Sounds": {"freesound": False}})
+            service.set_alarm("ada")
+            service.ring("ada")
+            self.wait_for_fetches(service)
+
+            assert searches == ([], [])
+            assert service.status("ada")["sound"] in service.library.sounds(
+                service.default_config.wav_directory
+            )
+
+        def test_a_failed_search_falls_back_to_local_sounds(
+            self, service, searches, monkeypatch: pytest.MonkeyPatch, capfd
+        ):
+            def broken_search(token, themes=[], session=None, filters=None):
+                raise ConnectionError("Freesound is unreachable")
+
+            monkeypatch.setattr(
+                "move_alarm.utils.api_calls.search_for_sounds", broken_search
+            )
+
+            service.set_alarm("ada")
+            self.wait_for_fetches(service)
+            service.ring("ada")
+            self.wait_for_fetches(service)
+
+            out, err = capfd.readouterr()
+            assert "Freesound is unreachable" in out
+            assert service.status("ada")["sound"] in service.library.sounds(
+                service.default_config.wav_directory
+            )
+
+    class TestHTTP:
+
+        @pytest.fixture
+        def connection(self, service):
+            server, thread = http_api.start_http_api(service, "127.0.0.1", 0)
+            connection = http.client.HTTPConnection(*server.server_address)
+            yield connection
+            connection.close()
+            server.shutdown()
+            server.server_close()
+            thread.join()
+
+        def request(self, connection, method: str, path: str, body=None):
+            data = None if body is None else json.dumps(body)
+            connection.request(method, path, body=data)
+            response = connection.getresponse()
+            return response.status, json.loads(response.read())
+
+        def test_alarm_round_trip(self, connection):
+            status, body = self.request(connection, "PUT", "/users/ada/alarm")
+            assert status == 200
+            assert body["set"] is True
+
+            status, body = self.request(connection, "POST", "/users/ada/alarm/snooze")
+            assert status == 200
+
+            status, body = self.request(connection, "GET", "/health")
+            assert body == {"users": 1, "scheduled": 1}
+
+            status, body = self.request(connection, "DELETE", "/users/ada/alarm")
+            assert body == {"removed": True}
+
+            status, body = self.request(connection, "GET", "/users/ada/alarm")
+            assert body["set"] is False
+
+        def test_config_round_trip(self, connection):
+            status, body = self.request(
+                connection, "PATCH", "/users/ada/config", {"Alarm": {"snooze": 60}}
+            )
+
+            assert status == 200
+            assert body["Alarm"]["snooze"] == 60
+            assert self.request(connection, "GET", "/users/ada/config")[1] == body
+
+        def test_errors_are_mapped_to_status_codes(self, connection):
+            assert self.request(connection, "POST", "/users/ada/alarm/snooze")[0] == 409
+            assert self.request(connection, "PUT", "/users/a%20b/alarm")[0] == 400
+            assert self.request(connection, "GET", "/alarms")[0] == 404
+            assert self.request(connection, "POST", "/users/ada/alarm")[0] == 405
+            assert (
+                self.request(connection, "PATCH", "/users/ada/config", ["Alarm"])[0]
+                == 400
+            )
+
+        def test_an_oversized_body_closes_the_connection(self, connection):
+            body = b"{" + b" " * http_api.MAX_BODY_SIZE + b"}"
+            connection.putrequest("PATCH", "/users/ada/config")
+            connection.putheader("Content-Length", str(len(body)))
+            connection.endheaders()
+            response = connection.getresponse()
+
+            assert response.status == 400
+            assert response.getheader("Connection") == "close"
+            response.read()
+
+        @pytest.mark.parametrize("host", ["0.0.0.0", "", "192.0.2.1"])
+        def test_refuses_non_loopback_hosts(self, service, host):
+            with pytest.raises(ValueError):
+                http_api.ServiceHTTPServer(service, host, 0)
+
+        def test_accepts_localhost(self):
+            assert http_api.is_loopback("localhost") is True
+            assert http_api.is_loopback("127.0.0.1") is True
@@ -1,12 +1,48 @@
-import os, json
+import io, os, json, random, threading, wave
 import requests
 import pytest, pytest_mock
+from time import sleep
 from datetime import timedelta
 from move_alarm.components.sounds import Sounds
+import move_alarm.components.sounds as sounds_module
 from collections.abc import Callable
+from move_alarm import utils
+from move_alarm.utils.bandwidth import BandwidthBudget
+from move_alarm.utils.rate_limit import TokenBucket
 import move_alarm.datatypes as datatype
 
 
+def make_wav(frames: bytes = bytes(100)) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(8000)
+        wav.writeframes(frames)
+    return buffer.getvalue()
+
+
+@pytest.fixture(autouse=True)
+def unlimited_freesound_bucket(monkeypatch: pytest.MonkeyPatch):
+    # Keeps the suite off the shared on-disk bucket that rate limits real calls
+    monkeypatch.setattr(
+        "move_alarm.utils.api_calls.freesound_bucket", TokenBucket(1000.0, 1000.0)
+    )
+
+
+@pytest.fixture(autouse=True)
+def in_memory_download_budget(monkeypatch: pytest.MonkeyPatch):
+    # Keeps the suite's downloads out of the real daily budget on disk
+    monkeypatch.setattr("move_alarm.utils.download_budget", BandwidthBudget(0))
+
+
+@pytest.fixture(autouse=True)
+def reset_circuit_breakers():
+    yield
+    utils.freesound_breaker.reset()
+    utils.token_breaker.reset()
+
+
 class TestSounds:
 
     @property
@@ -46,9 +82,7 @@ class TestSounds:
             "move_alarm.components.sounds.use_context", lambda: mock_contexts
         )
 
-        monkeypatch.setattr(
-            "move_alarm.utils.helpers.use_context", lambda: mock_contexts
-        )
+        monkeypatch.setattr("move_alarm.contexts.use_context", lambda: mock_contexts)
 
     @pytest.fixture(name="Mock Context api_enabled false")
     def mock_context_api_diabled(self, monkeypatch: pytest.MonkeyPatch):
@@ -65,14 +99,20 @@ class TestSounds:
             "move_alarm.components.sounds.use_context", lambda: mock_contexts
         )
 
-        monkeypatch.setattr(
-            "move_alarm.utils.helpers.use_context", lambda: mock_contexts
-        )
+        monkeypatch.setattr("move_alarm.contexts.use_context", lambda: mock_contexts)
 
     @pytest.fixture(name="Remove mock_sounds.wav file", autouse=True)
     def remove_mock_sounds_file(self):
-        if os.path.exists(self.new_sound_path):
-            os.remove(self.new_sound_path)
+        digests_path = os.path.join(self.wav_directory, sounds_module.DIGESTS_FILE)
+
+        for path in [self.new_sound_path, digests_path]:
+            if os.path.exists(path):
+                os.remove(path)
+
+        yield
+
+        if os.path.exists(digests_path):
+            os.remove(digests_path)
 
     @pytest.fixture
     def mock_api_search_result(self) -> Callable[[], list[datatype.SoundResult]]:
@@ -137,11 +177,19 @@ class TestSounds:
     @pytest.fixture(name="200 mock api sound download")
     def mock_200_sound_download(self, monkeypatch: pytest.MonkeyPatch):
         class MockResponse:
+            @property
+            def status_code(self):
+                return 200
+
+            @property
+            def headers(self):
+                return {}
+
             def raise_for_status(self):
                 return None
 
-            def iter_content(chunk_size=1):
-                return []
+            def iter_content(self, chunk_size=1):
+                return [make_wav()]
 
         class MockWith:
             def __enter__(self):
@@ -323,6 +371,38 @@ class TestSounds:
 
             assert result is None
 
+        def test_each_theme_is_equally_likely_when_searching_per_theme(
+            self, monkeypatch: pytest.MonkeyPatch
+        ):
+            config = sounds_module.use_context().config
+            config.search_per_theme = True
+            config.sound_themes = ["piano", "rain"]
+
+            def mock_search_for_sounds(token, themes=[], session=None, filters=None):
+                offset, count = {"piano": (0, 15), "rain": (100, 2)}[themes[0]]
+                return [
+                    {
+                        "id": offset + index,
+                        "url": "url",
+                        "name": f"{themes[0]}.wav",
+                        "description": "",
+                        "download": "download",
+                        "license": "",
+                    }
+                    for index in range(0, count)
+                ]
+
+            monkeypatch.setattr(
+                "move_alarm.utils.api_calls.search_for_sounds", mock_search_for_sounds
+            )
+            random.seed(0)
+            sound = Sounds()
+
+            picks = [sound.search_freesound(config.sound_themes) for _ in range(500)]
+            rain = len([pick for pick in picks if pick.id >= 100])
+
+            assert 0.4 < rain / len(picks) < 0.6
+
         @pytest.mark.usefixtures("500 mock api unexpected error")
         def test_raises_error_on_non_200_response(self):
             sound = Sounds()
@@ -376,6 +456,51 @@ class TestSounds:
 
             assert isinstance(new_file_path, str) is True
 
+        @pytest.mark.usefixtures("200 mock api sound download")
+        def test_reuses_an_identical_sound_already_downloaded(self):
+            sound = Sounds()
+            copy_path = self.new_sound_path[:-4] + "_copy.wav"
+
+            try:
+                first_path = sound.download_from_freesound("url", self.new_sound_path)
+                second_path = sound.download_from_freesound("url", copy_path)
+
+                assert second_path == first_path
+                assert os.path.exists(copy_path) is False
+            finally:
+                if os.path.exists(copy_path):
+                    os.remove(copy_path)
+
+        @pytest.mark.usefixtures("200 mock api sound download")
+        def test_remembers_downloaded_sounds_after_a_restart(self):
+            copy_path = self.new_sound_path[:-4] + "_copy.wav"
+
+            try:
+                first_path = Sounds().download_from_freesound(
+                    "url", self.new_sound_path
+                )
+                second_path = Sounds().download_from_freesound("url", copy_path)
+
+                assert second_path == first_path
+                assert os.path.exists(copy_path) is False
+            finally:
+                if os.path.exists(copy_path):
+                    os.remove(copy_path)
+
+        @pytest.mark.usefixtures("200 mock api sound download")
+        def test_forgets_saved_sounds_that_were_deleted(self):
+            copy_path = self.new_sound_path[:-4] + "_copy.wav"
+
+            try:
+                Sounds().download_from_freesound("url", self.new_sound_path)
+                os.remove(self.new_sound_path)
+                second_path = Sounds().download_from_freesound("url", copy_path)
+
+                assert second_path == copy_path
+            finally:
+                if os.path.exists(copy_path):
+                    os.remove(copy_path)
+
     @pytest.mark.usefixtures("Mock Context")
     @pytest.mark.usefixtures("Remove mock_sounds.wav file")
     class TestGetFreesound:
@@ -487,6 +612,24 @@ class TestSounds:
 
             mock_get_freesound.assert_called_once()
 
+        @pytest.mark.usefixtures("Mock Context")
+        def test_prefetched_sound_is_used_before_searching_freesound(
+            self, mocker: pytest_mock.MockerFixture
+        ):
+            mocker.patch(
+                "move_alarm.components.sounds.Sounds.get_prefetched_sound",
+                return_value=self.new_sound_path,
+            )
+            mock_get_freesound = mocker.patch(
+                "move_alarm.components.sounds.Sounds.get_freesound"
+            )
+
+            sound = Sounds()
+            sound_path = sound.get_sound()
+
+            assert sound_path == self.new_sound_path
+            mock_get_freesound.assert_not_called()
+
         @pytest.mark.usefixtures("Mock Context")
         @pytest.mark.usefixtures("Mock search_freesound")
         @pytest.mark.usefixtures("200 mock api sound download")
@@ -517,6 +660,178 @@ class TestSounds:
             mock_print.assert_called_once()
             mock_get_local_file.assert_called_once()
 
+        @pytest.mark.usefixtures("Mock Context")
+        def test_if_freesound_circuit_is_open_skips_get_freesound(
+            self, mocker: pytest_mock.MockerFixture
+        ):
+            utils.freesound_breaker.force_open()
+            mock_get_freesound = mocker.patch(
+                "move_alarm.components.sounds.Sounds.get_freesound"
+            )
+            mock_get_local_file = mocker.patch(
+                "move_alarm.components.sounds.Sounds.get_local_file",
+                return_value=self.new_sound_path,
+            )
+
+            sound = Sounds()
+            sound_path = sound.get_sound()
+
+            assert sound_path == self.new_sound_path
+            mock_get_freesound.assert_not_called()
+            mock_get_local_file.assert_called_once()
+
+        @pytest.mark.usefixtures("Mock Context")
+        def test_if_freesound_misses_the_deadline_invokes_get_local_file(
+            self, monkeypatch: pytest.MonkeyPatch, mocker: pytest_mock.MockerFixture
+        ):
+            monkeypatch.setattr(
+                sounds_module.use_context().config,
+                "acquire_deadline",
+                timedelta(milliseconds=10),
+            )
+            mocker.patch(
+                "move_alarm.components.sounds.Sounds.get_freesound",
+                side_effect=lambda: sleep(0.1),
+            )
+            mock_get_local_file = mocker.patch(
+                "move_alarm.components.sounds.Sounds.get_local_file",
+                return_value=self.new_sound_path,
+            )
+
+            sound = Sounds()
+            sound_path = sound.get_sound()
+
+            assert sound_path == self.new_sound_path
+            mock_get_local_file.assert_called_once_with(self.wav_directory)
+
+        @pytest.mark.usefixtures("Mock Context")
+        def test_if_a_prefetch_is_in_flight_skips_get_freesound(
+            self, mocker: pytest_mock.MockerFixture
+        ):
+            fetching = threading.Event()
+            mocker.patch(
+                "move_alarm.components.sounds.Sounds.get_prefetched_sound",
+                return_value=None,
+            )
+            mock_get_freesound = mocker.patch(
+                "move_alarm.components.sounds.Sounds.get_freesound"
+            )
+            mock_get_local_file = mocker.patch(
+                "move_alarm.components.sounds.Sounds.get_local_file",
+                return_value=self.new_sound_path,
+            )
+
+            sound = Sounds()
+            sound._prefetcher = utils.SoundPrefetcher(
+                lambda: fetching.wait(1) and None, 1
+            )
+            sound._prefetcher.start()
+
+            try:
+                sound_path = sound.get_sound()
+            finally:
+                sound._prefetcher.stop()
+                fetching.set()
+
+            assert sound_path == self.new_sound_path
+            mock_get_freesound.assert_not_called()
+            mock_get_local_file.assert_called_once_with(self.wav_directory)
+
+        @pytest.mark.usefixtures("Mock Context")
+        def test_if_freesound_raises_an_error_invokes_get_local_file(
+            self, mocker: pytest_mock.MockerFixture
+        ):
+            mocker.patch(
+                "move_alarm.components.sounds.Sounds.get_freesound",
+                side_effect=ConnectionError("Mock outage"),
+            )
+            mock_get_local_file = mocker.patch(
+                "move_alarm.components.sounds.Sounds.get_local_file",
+                return_value=self.new_sound_path,
+            )
+
+            sound = Sounds()
+            sound_path = sound.get_sound()
+
+            assert sound_path == self.new_sound_path
+            mock_get_local_file.assert_called_once()
+
+        @pytest.mark.usefixtures("Mock Context")
+        def test_if_the_download_budget_is_used_up_invokes_get_local_file(
+            self, monkeypatch: pytest.MonkeyPatch, mocker: pytest_mock.MockerFixture
+        ):
+            monkeypatch.setattr(
+                utils,
+                "get_download_usage",
+                lambda: datatype.BandwidthUsage("2024-01-01", 1000, 1000),
+            )
+            mock_get_freesound = mocker.patch(
+                "move_alarm.components.sounds.Sounds.get_freesound",
+            )
+            mock_get_local_file = mocker.patch(
+                "move_alarm.components.sounds.Sounds.get_local_file",
+                return_value=self.new_sound_path,
+            )
+
+            sound = Sounds()
+            sound_path = sound.get_sound()
+
+            assert sound_path == self.new_sound_path
+            mock_get_freesound.assert_not_called()
+            mock_get_local_file.assert_called_once()
+
+        @pytest.mark.usefixtures("Mock Context")
+        def test_if_the_download_budget_cannot_be_read_invokes_get_local_file(
+            self, monkeypatch: pytest.MonkeyPatch, mocker: pytest_mock.MockerFixture
+        ):
+            def unreadable_budget():
+                raise TypeError("Mock budget error")
+
+            monkeypatch.setattr(utils, "get_download_usage", unreadable_budget)
+            mock_get_freesound = mocker.patch(
+                "move_alarm.components.sounds.Sounds.get_freesound",
+            )
+            mock_get_local_file = mocker.patch(
+                "move_alarm.components.sounds.Sounds.get_local_file",
+                return_value=self.new_sound_path,
+            )
+
+            sound = Sounds()
+            sound_path = sound.get_sound()
+
+            assert sound_path == self.new_sound_path
+            mock_get_freesound.assert_not_called()
+            mock_get_local_file.assert_called_once()
+
+    class TestInvalidateCaches:
+
+        @pytest.fixture
+        def sound_with_caches(self, mocker: pytest_mock.MockerFixture):
+            sound = Sounds()
+            sound._prefetcher = mocker.MagicMock()
+            sound._prepared["old.wav"] = None
+            sound._digests["digest"] = "old.wav"
+            return sound
+
+        def test_theme_changes_clear_the_prefetched_sounds(self, sound_with_caches):
+            sound_with_caches.invalidate_caches({"sound_themes"})
+
+            sound_with_caches.prefetcher.clear.assert_called_once()
+            assert sound_with_caches._prepared == {}
+            assert sound_with_caches._digests == {"digest": "old.wav"}
+
+        def test_wav_directory_changes_also_forget_known_files(self, sound_with_caches):
+            sound_with_caches.invalidate_caches({"wav_directory"})
+
+            sound_with_caches.prefetcher.clear.assert_called_once()
+            assert sound_with_caches._digests == {}
+
+        def test_other_changes_keep_the_caches(self, sound_with_caches):
+            sound_with_caches.invalidate_caches({"wait_duration"})
+
+            sound_with_caches.prefetcher.clear.assert_not_called()
+            assert sound_with_caches._prepared == {"old.wav": None}
+
     @pytest.mark.usefixtures("Mock Context api_enabled false")
     @pytest.mark.usefixtures("Mock WaveObject")
     class TestPlaySound:
@@ -561,6 +876,48 @@ class TestSounds:
 
             mock_stop_sound.assert_called_once()
 
+        @pytest.mark.usefixtures("200 mock api sound download")
+        @pytest.mark.usefixtures("Mock search_freesound")
+        def test_streams_a_new_freesound_while_it_downloads(
+            self, monkeypatch: pytest.MonkeyPatch, mocker: pytest_mock.MockerFixture
+        ):
+            class MockAuth:
+                def get_token(self):
+                    return "mock token"
+
+            class MockPlayObject:
+                def wait_done(self):
+                    return None
+
+            new_sound_path = TestSounds().new_sound_path
+            config = TestSounds().mock_config
+            config.stream_playback = True
+            mock_contexts = datatype.Contexts(MockAuth(), config)
+            monkeypatch.setattr(
+                "move_alarm.components.sounds.use_context", lambda: mock_contexts
+            )
+            monkeypatch.setattr(
+                "move_alarm.contexts.use_context", lambda: mock_contexts
+            )
+            played = []
+            monkeypatch.setattr(
+                "move_alarm.utils.streaming.sa.play_buffer",
+                lambda audio, *args: played.append(audio) or MockPlayObject(),
+            )
+            mock_get_sound = mocker.patch(
+                "move_alarm.components.sounds.Sounds.get_sound",
+            )
+
+            try:
+                sound = Sounds()
+                sound.play_sound()
+            finally:
+                if os.path.exists(new_sound_path):
+                    os.remove(new_sound_path)
+
+            assert b"".join(played) == bytes(100)
+            mock_get_sound.assert_not_called()
+
     class TestStopSound:
 
         def test_return_bool_false_if_no_sound_is_playing(self):
@@ -0,0 +1,175 @@
+import io, threading, time, wave
+import pytest
+from move_alarm.utils.streaming import StreamingPlayback, parse_wav_header
+import move_alarm.datatypes as datatype
+
+
+def make_wav(frames: bytes, channels: int = 1, framerate: int = 8000) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(2)
+        wav.setframerate(framerate)
+        wav.writeframes(frames)
+    return buffer.getvalue()
+
+
+class TestStreamingPlayback:
+
+    @pytest.fixture
+    def mock_play_buffer(self, monkeypatch: pytest.MonkeyPatch):
+        segments: list[bytes] = []
+
+        class MockPlayObject:
+            def is_playing(self):
+                return False
+
+            def wait_done(self):
+                return None
+
+            def stop(self):
+                return None
+
+        def _mock_play_buffer(audio_data, num_channels, bytes_per_sample, sample_rate):
+            segments.append(audio_data)
+            return MockPlayObject()
+
+        monkeypatch.setattr(
+            "move_alarm.utils.streaming.sa.play_buffer", _mock_play_buffer
+        )
+        # Queue each segment at once rather than as the last one would run out
+        monkeypatch.setattr(StreamingPlayback, "queue_ahead", 3600.0)
+
+        return segments
+
+    @pytest.fixture
+    def feed_in_chunks(self):
+        def _feed_in_chunks(playback: StreamingPlayback, body: bytes, size: int):
+            for offset in range(0, len(body), size):
+                playback.feed(offset, body[offset : offset + size])
+
+        return _feed_in_chunks
+
+    class TestParseWavHeader:
+
+        def test_finds_the_format_and_data_offset(self):
+            wav_format, data_offset, data_size = parse_wav_header(
+                make_wav(bytes(400), channels=2, framerate=22050)
+            )
+
+            assert wav_format == datatype.WavFormat(2, 2, 22050)
+            assert data_offset == 44
+            assert data_size == 400
+
+        def test_returns_none_until_the_data_chunk_arrives(self):
+            assert parse_wav_header(make_wav(bytes(400))[:30]) is None
+
+        def test_raises_invalid_sound_error_for_other_files(self):
+            with pytest.raises(datatype.InvalidSoundError):
+                parse_wav_header(b"<!DOCTYPE html><html></html>")
+
+    class TestFeed:
+
+        def test_starts_playing_before_the_download_finishes(
+            self, mock_play_buffer, feed_in_chunks
+        ):
+            body = make_wav(bytes(range(0, 256)) * 100)
+            playback = StreamingPlayback(initial_buffer=0.25)
+
+            feed_in_chunks(playback, body[:8000], 1000)
+
+            assert playback.wait_started(timeout=1) is True
+
+            feed_in_chunks(playback, body, 1000)
+            playback.finish()
+            playback.wait_done()
+
+        def test_plays_every_frame_exactly_once(self, mock_play_buffer, feed_in_chunks):
+            frames = bytes(range(0, 256)) * 100
+            playback = StreamingPlayback(initial_buffer=0.1)
+
+            feed_in_chunks(playback, make_wav(frames), 777)
+            playback.finish()
+            playback.wait_done()
+
+            assert b"".join(mock_play_buffer) == frames
+
+        def test_ignores_bytes_sent_again_after_a_restart(
+            self, mock_play_buffer, feed_in_chunks
+        ):
+            frames = bytes(range(0, 256)) * 20
+            body = make_wav(frames)
+            playback = StreamingPlayback(initial_buffer=0.1)
+
+            feed_in_chunks(playback, body[:3000], 1000)
+            feed_in_chunks(playback, body, 1000)
+            playback.finish()
+            playback.wait_done()
+
+            assert b"".join(mock_play_buffer) == frames
+
+        def test_never_starts_for_an_invalid_body(self, mock_play_buffer):
+            playback = StreamingPlayback()
+
+            playback.feed(0, b"<!DOCTYPE html><html>Not found</html>")
+
+            assert playback.wait_started(timeout=1) is False
+            assert isinstance(playback.error, datatype.InvalidSoundError)
+            assert mock_play_buffer == []
+
+    class TestGapless:
+
+        def test_queues_the_next_segment_before_the_last_one_ends(
+            self, monkeypatch: pytest.MonkeyPatch, feed_in_chunks
+        ):
+            queued_at: list[float] = []
+
+            class PollingPlayObject:
+                # Like simpleaudio, whose wait_done only notices the end every 50ms
+                def __init__(self, seconds: float) -> None:
+                    self.ends_at = time.monotonic() + seconds
+
+                def is_playing(self):
+                    return time.monotonic() < self.ends_at
+
+                def wait_done(self):
+                    while self.is_playing():
+                        time.sleep(0.05)
+
+                def stop(self):
+                    self.ends_at = 0
+
+            def mock_play_buffer(audio_data, num_channels, bytes_per_sample, rate):
+                queued_at.append(time.monotonic())
+                return PollingPlayObject(len(audio_data) / (bytes_per_sample * rate))
+
+            monkeypatch.setattr(
+                "move_alarm.utils.streaming.sa.play_buffer", mock_play_buffer
+            )
+            body = make_wav(bytes(16000))
+            playback = StreamingPlayback(initial_buffer=0.2)
+
+            # 0.2 seconds plays first, the rest arrives while it does
+            feed_in_chunks(playback, body[:3244], 1000)
+            playback.wait_started(timeout=1)
+            feed_in_chunks(playback, body, 1000)
+            playback.finish()
+            playback.wait_done()
+
+            assert len(queued_at) == 2
+            assert queued_at[1] - queued_at[0] < 0.2
+
+    class TestStop:
+
+        def test_stops_playback_and_ends_wait_done(self, mock_play_buffer):
+            playback = StreamingPlayback(initial_buffer=0.1)
+            playback.feed(0, make_wav(bytes(8000)))
+            playback.wait_started(timeout=1)
+
+            playback.stop()
+            playback.wait_done()
+
+            assert playback.is_playing() is False
+            assert not any(
+                thread.name == "MoveStream" for thread in threading.enumerate()
+            )
@@ -0,0 +1,145 @@
+"""Run full alarm sound-acquisition cycles against the local stand-in server.
+
+Each cycle is what happens when an alarm fires: token refresh, search,
+download (or dequeue from the prefetch queue) and fall back to a local sound
+when the deadline is missed. Reports throughput and latency percentiles.
+
+Usage: poetry run python benchmarks/alarm_cycles.py --cycles 50 --latency 0.05
+"""
+
+import argparse, importlib, os, shutil, statistics, tempfile, time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from standin_server import StandinConfig, StandinServer
+from move_alarm import utils
+from move_alarm.components import Sounds
+from move_alarm.utils import api_calls
+from move_alarm.utils.oauth import HandleAuthorisation
+import move_alarm.datatypes as datatype
+
+# The package re-exports the function under the module's name
+context_module = importlib.import_module("move_alarm.contexts.use_context")
+
+
+class StandinAuth(HandleAuthorisation):
+    # The real refresh path and token cache, minus the .env file and browser
+    def __init__(self) -> None:
+        super().__init__("benchmark")
+        self.oauth_token = "standin-refresh"
+
+    def set_dotenv_file(self, client_token: str) -> bool:
+        self.oauth_token = client_token
+        return True
+
+    def get_token(self) -> str | None:
+        if self.has_valid_token():
+            return self._access_token
+
+        return self.request_oauth_token()
+
+
+def percentile(samples: list[float], percent: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run_cycle(sounds: Sounds) -> tuple[float, bool]:
+    started = time.perf_counter()
+    path = sounds.get_sound()
+    elapsed = time.perf_counter() - started
+
+    remote = os.path.basename(path).startswith("standin_")
+    if remote and os.path.exists(path):
+        os.remove(path)
+
+    return elapsed, remote
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cycles", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--bandwidth", type=int, default=0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--sound-size", type=int, default=512 * 1024)
+    parser.add_argument("--prefetch", type=int, default=0)
+    parser.add_argument("--deadline", type=int, default=3000, help="milliseconds")
+    parser.add_argument(
+        "--rate-limit",
+        action="store_true",
+        help="keep the shared 60 requests/minute client limiter",
+    )
+    args = parser.parse_args()
+
+    config = StandinConfig(
+        latency=args.latency,
+        bandwidth=args.bandwidth,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        sound_size=args.sound_size,
+    )
+
+    with StandinServer(config) as server, tempfile.TemporaryDirectory() as wav_dir:
+        api_calls.FREESOUND_API_URL = server.api_url
+        api_calls.TOKEN_URL = server.token_url
+        if not args.rate_limit:
+            api_calls.freesound_bucket = utils.TokenBucket(1e9, 1e9)
+            api_calls.token_bucket = utils.TokenBucket(1e9, 1e9)
+        # In memory, a benchmark's downloads shouldn't count towards the user's day
+        utils.download_budget = utils.BandwidthBudget(0)
+
+        local_sound = os.path.join(os.path.dirname(api_calls.__file__)[:-5], "assets")
+        for file in os.listdir(local_sound):
+            shutil.copy(os.path.join(local_sound, file), wav_dir)
+
+        context_module.cache = datatype.Contexts(
+            StandinAuth(),
+            datatype.Config(
+                wait_duration=timedelta(minutes=60),
+                snooze_duration=timedelta(minutes=5),
+                reminder_text="Benchmark",
+                wav_directory=wav_dir,
+                api_enabled=True,
+                sound_themes=["piano", "guitar"],
+                prefetch_count=args.prefetch,
+                acquire_deadline=timedelta(milliseconds=args.deadline),
+            ),
+        )
+
+        sounds = Sounds()
+        if args.prefetch > 0:
+            sounds.start_prefetch(args.prefetch)
+            time.sleep(1)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            results = list(
+                executor.map(lambda _: run_cycle(sounds), range(0, args.cycles))
+            )
+        wall = time.perf_counter() - started
+
+        if sounds.prefetcher is not None:
+            sounds.prefetcher.stop()
+
+        latencies = [elapsed * 1000 for elapsed, _ in results]
+        remote = sum(1 for _, was_remote in results if was_remote)
+
+        print(f"cycles:      {args.cycles} ({args.workers} worker(s)) in {wall:.2f} s")
+        print(f"throughput:  {args.cycles / wall:.1f} cycles/s")
+        print(f"freesound:   {remote}, local fallback: {args.cycles - remote}")
+        print(
+            f"latency ms:  mean {statistics.mean(latencies):.1f}"
+            + f"  p50 {percentile(latencies, 50):.1f}"
+            + f"  p90 {percentile(latencies, 90):.1f}"
+            + f"  p99 {percentile(latencies, 99):.1f}"
+            + f"  max {max(latencies):.1f}"
+        )
+        print(f"requests:    {server.requests}")
+        print(f"api status:  {utils.get_api_status()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""Compare single-stream and parallel ranged downloads against a local server.
+
+Each connection to the stand-in server is capped at --connection-rate bytes
+per second to stand in for a per-connection bottleneck on a real link.
+
+Usage: poetry run python benchmarks/download_benchmark.py [--size-mb 64]
+"""
+
+import argparse, os, tempfile, time
+from standin_server import StandinConfig, StandinServer
+from move_alarm.utils import api_calls
+
+
+def time_download(url: str, new_path: str, parallel_threshold: int) -> float:
+    started = time.perf_counter()
+    api_calls.download_sound(
+        "token", url, new_path, parallel_threshold=parallel_threshold
+    )
+    elapsed = time.perf_counter() - started
+
+    os.remove(new_path)
+    return elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size-mb", type=int, default=64)
+    parser.add_argument("--connection-rate", type=int, default=16 * 1024 * 1024)
+    args = parser.parse_args()
+
+    size = args.size_mb * 1024 * 1024
+    config = StandinConfig(bandwidth=args.connection_rate, sound_size=size)
+
+    with StandinServer(config) as server, tempfile.TemporaryDirectory() as directory:
+        url = f"{server.api_url}/sounds/1/download/"
+        new_path = os.path.join(directory, "sound.wav")
+
+        single = time_download(url, new_path, parallel_threshold=size + 1)
+        parallel = time_download(url, new_path, parallel_threshold=0)
+
+    print(f"{args.size_mb} MB, {args.connection_rate // 1024} KB/s per connection")
+    print(f"single stream: {single:6.2f} s  ({args.size_mb / single:6.1f} MB/s)")
+    print(f"parallel:      {parallel:6.2f} s  ({args.size_mb / parallel:6.1f} MB/s)")
+
+
+if __name__ == "__main__":
+    main()
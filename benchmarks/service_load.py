@@ -0,0 +1,139 @@
+"""Load the multi-user HTTP service with many users' alarms at once.
+
+Starts the service in this process on a free port, then each worker keeps one
+keep-alive connection and sets, checks, snoozes and removes alarms for its
+share of the users. Reports throughput, latency percentiles and the memory
+each user costs the service.
+
+Usage: poetry run python benchmarks/service_load.py --users 5000 --workers 8
+"""
+
+import argparse, gc, http.client, json, random, shutil, tempfile, time, tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from move_alarm.components import AlarmService
+from move_alarm.control import http_api
+
+# Most requests are status checks, like a kiosk polling who needs to stretch
+MIX = [("GET", "")] * 6 + [("POST", "/snooze")] * 2 + [("PUT", "")]
+
+
+def percentile(samples: list[float], percent: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def request(connection: http.client.HTTPConnection, method: str, path: str) -> float:
+    started = time.perf_counter()
+    connection.request(method, path)
+    response = connection.getresponse()
+    body = response.read()
+    elapsed = time.perf_counter() - started
+
+    if response.status != 200:
+        raise RuntimeError(f"{method} {path}: {response.status} {body!r}")
+
+    return elapsed
+
+
+def run_worker(
+    address: tuple[str, int], users: list[str], requests_per_user: int, remove: bool
+) -> list[float]:
+    connection = http.client.HTTPConnection(*address)
+    latencies: list[float] = []
+
+    try:
+        for user in users:
+            latencies.append(request(connection, "PUT", f"/users/{user}/alarm"))
+
+        for _ in range(requests_per_user):
+            for user in users:
+                method, suffix = random.choice(MIX)
+                path = f"/users/{user}/alarm{suffix}"
+                latencies.append(request(connection, method, path))
+
+        if remove:
+            for user in users:
+                latencies.append(request(connection, "DELETE", f"/users/{user}/alarm"))
+    finally:
+        connection.close()
+
+    return latencies
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--requests-per-user", type=int, default=2)
+    parser.add_argument(
+        "--custom",
+        type=float,
+        default=0.0,
+        help="fraction of users given their own config before the run",
+    )
+    parser.add_argument(
+        "--keep",
+        action="store_true",
+        help="leave the alarms set, so memory is measured with every user live",
+    )
+    args = parser.parse_args()
+
+    data_directory = tempfile.mkdtemp()
+    users = [f"user{index:06}" for index in range(args.users)]
+
+    gc.collect()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+
+    service = AlarmService(data_directory)
+    service.start()
+    server, thread = http_api.start_http_api(service, "127.0.0.1", 0)
+
+    try:
+        for user in users[: int(args.users * args.custom)]:
+            service.update_config(user, {"Alarm": {"message": f"Stretch, {user}!"}})
+
+        shares = [users[worker :: args.workers] for worker in range(args.workers)]
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            results = executor.map(
+                lambda share: run_worker(
+                    server.server_address[:2],
+                    share,
+                    args.requests_per_user,
+                    not args.keep,
+                ),
+                shares,
+            )
+            latencies = [sample for worker in results for sample in worker]
+        elapsed = time.perf_counter() - started
+
+        gc.collect()
+        current, peak = tracemalloc.get_traced_memory()
+        health = json.dumps(
+            {"users": service.user_count, "scheduled": len(service.scheduler)}
+        )
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+        service.stop()
+        tracemalloc.stop()
+        shutil.rmtree(data_directory, ignore_errors=True)
+
+    print(f"users:       {args.users} ({args.custom:.0%} with their own config)")
+    print(f"workers:     {args.workers}")
+    print(f"requests:    {len(latencies)} in {elapsed:.2f}s")
+    print(f"throughput:  {len(latencies) / elapsed:.0f} requests/s")
+    for percent in [50, 90, 99]:
+        print(f"p{percent}:         {percentile(latencies, percent) * 1000:.2f} ms")
+    print(f"max:         {max(latencies) * 1000:.2f} ms")
+    print(f"after run:   {health}")
+    print(f"memory:      {(current - baseline) / 1024:.0f} KiB retained")
+    print(f"per user:    {(current - baseline) / args.users:.0f} bytes retained")
+    print(f"peak:        {(peak - baseline) / 1024:.0f} KiB")
+
+
+if __name__ == "__main__":
+    main()
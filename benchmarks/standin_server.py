@@ -0,0 +1,316 @@
+"""Local stand-in for the Freesound API and the move-alarm token function.
+
+Implements /apiv2/search/text/ (paginated), /apiv2/sounds/<id>/download/
+(with Range support) and /.netlify/functions/move-alarm, with configurable
+latency, per-connection bandwidth, 5xx error rate and 429 injection.
+
+Usage: poetry run python benchmarks/standin_server.py --port 8000 --latency 0.05
+"""
+
+import argparse, json, random, re, struct, threading, time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+@dataclass
+class StandinConfig:
+    latency: float = 0.0
+    bandwidth: int = 0
+    error_rate: float = 0.0
+    throttle_rate: float = 0.0
+    retry_after: int = 1
+    sound_count: int = 200
+    sound_size: int = 512 * 1024
+    page_size: int = 15
+    samplerate: int = 44100
+    bitdepth: int = 16
+    channels: int = 1
+
+
+def make_wav(
+    size: int, samplerate: int = 44100, bitdepth: int = 16, channels: int = 1
+) -> bytes:
+    data_size = max(0, size - 44)
+    block_align = channels * bitdepth // 8
+
+    header = (
+        b"RIFF"
+        + struct.pack("<I", 36 + data_size)
+        + b"WAVEfmt "
+        + struct.pack(
+            "<IHHIIHH",
+            16,
+            1,
+            channels,
+            samplerate,
+            samplerate * block_align,
+            block_align,
+            bitdepth,
+        )
+        + b"data"
+        + struct.pack("<I", data_size)
+    )
+
+    return header + bytes(data_size)
+
+
+class StandinServer:
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    @property
+    def api_url(self) -> str:
+        return f"{self.url}/apiv2"
+
+    @property
+    def token_url(self) -> str:
+        return f"{self.url}/.netlify/functions/move-alarm"
+
+    def __init__(self, config: StandinConfig | None = None, port: int = 0) -> None:
+        self.config = config if config is not None else StandinConfig()
+        self.body = make_wav(
+            self.config.sound_size,
+            self.config.samplerate,
+            self.config.bitdepth,
+            self.config.channels,
+        )
+        self.requests: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self.make_handler())
+        self._server.daemon_threads = True
+        self.port = self._server.server_port
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> "StandinServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "StandinServer":
+        return self.start()
+
+    def __exit__(self, *args) -> None:
+        self.stop()
+
+    def count(self, kind: str) -> None:
+        with self._lock:
+            self.requests[kind] = self.requests.get(kind, 0) + 1
+
+    def sound(self, id: int) -> dict[str, str | int]:
+        return {
+            "id": id,
+            "url": f"{self.url}/people/standin/sounds/{id}/",
+            "name": f"standin_{id}.wav",
+            "description": f"Stand-in sound {id}",
+            "download": f"{self.api_url}/sounds/{id}/download/",
+            "license": "http://creativecommons.org/publicdomain/zero/1.0/",
+            "samplerate": self.config.samplerate,
+            "bitdepth": self.config.bitdepth,
+            "channels": self.config.channels,
+            "filesize": len(self.body),
+            "type": "wav",
+        }
+
+    def search(self, query: dict[str, list[str]]) -> dict:
+        page = int(query.get("page", ["1"])[0])
+        page_size = int(query.get("page_size", [str(self.config.page_size)])[0])
+        count = self.config.sound_count
+        first = (page - 1) * page_size + 1
+        last = min(count, first + page_size - 1)
+
+        def page_url(number: int) -> str | None:
+            if number < 1 or (number - 1) * page_size >= count:
+                return None
+            return f"{self.api_url}/search/text/?page={number}&page_size={page_size}"
+
+        return {
+            "count": count,
+            "previous": page_url(page - 1),
+            "next": page_url(page + 1),
+            "results": [self.sound(id) for id in range(first, last + 1)],
+        }
+
+    def make_handler(self) -> type[BaseHTTPRequestHandler]:
+        server = self
+
+        class StandinHandler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args) -> None:
+                pass
+
+            def send_json(self, status: int, data: dict) -> None:
+                body = json.dumps(data).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def send_text(self, status: int, text: str, headers: dict = {}) -> None:
+                body = text.encode()
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "text/plain")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def inject_failure(self) -> bool:
+                config = server.config
+                roll = random.random()
+
+                if roll < config.throttle_rate:
+                    server.count("429")
+                    self.send_text(
+                        429,
+                        "Request was throttled",
+                        {"Retry-After": str(config.retry_after)},
+                    )
+                    return True
+
+                if roll < config.throttle_rate + config.error_rate:
+                    server.count("500")
+                    self.send_text(500, "Injected server error")
+                    return True
+
+                return False
+
+            def is_authorised(self) -> bool:
+                if self.headers.get("Authorization", "").startswith("Bearer "):
+                    return True
+
+                self.send_text(401, "The credentials you provided are invalid.")
+                return False
+
+            def do_HEAD(self) -> None:
+                self.send_response(200)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def do_GET(self) -> None:
+                if server.config.latency > 0:
+                    time.sleep(server.config.latency)
+
+                url = urlparse(self.path)
+                query = parse_qs(url.query)
+
+                if url.path == "/.netlify/functions/move-alarm":
+                    server.count("token")
+                    if not self.inject_failure():
+                        self.send_token(query)
+                elif url.path == "/apiv2/search/text/":
+                    server.count("search")
+                    if not self.inject_failure() and self.is_authorised():
+                        self.send_json(200, server.search(query))
+                elif match := re.fullmatch(r"/apiv2/sounds/(\d+)/download/", url.path):
+                    server.count("download")
+                    if not self.inject_failure() and self.is_authorised():
+                        self.send_sound()
+                else:
+                    self.send_text(404, "Not found")
+
+            def send_token(self, query: dict[str, list[str]]) -> None:
+                if "code" not in query and "token" not in query:
+                    self.send_text(401, "The credentials you provided are invalid.")
+                    return
+
+                self.send_json(
+                    200,
+                    {
+                        "access_token": f"standin-access-{random.getrandbits(64):x}",
+                        "scope": "read write read+write",
+                        "expires_in": 86399,
+                        "refresh_token": f"standin-refresh-{random.getrandbits(64):x}",
+                    },
+                )
+
+            def send_sound(self) -> None:
+                body = server.body
+                start, end = 0, len(body) - 1
+                requested = self.headers.get("Range", "")
+                match = re.fullmatch(r"bytes=(\d+)-(\d*)", requested)
+
+                if match is not None:
+                    start = int(match.group(1))
+                    end = min(end, int(match.group(2))) if match.group(2) else end
+
+                    if start > end:
+                        self.send_text(416, "Range not satisfiable")
+                        return
+
+                    self.send_response(206)
+                    self.send_header(
+                        "Content-Range", f"bytes {start}-{end}/{len(body)}"
+                    )
+                else:
+                    self.send_response(200)
+
+                self.send_header("Content-Type", "audio/wav")
+                self.send_header("Accept-Ranges", "bytes")
+                self.send_header("Content-Length", str(end + 1 - start))
+                self.end_headers()
+
+                try:
+                    self.write_paced(body, start, end + 1)
+                except (BrokenPipeError, ConnectionResetError):
+                    self.close_connection = True
+
+            def write_paced(self, body: bytes, start: int, stop: int) -> None:
+                bandwidth = server.config.bandwidth
+
+                if bandwidth <= 0:
+                    self.wfile.write(body[start:stop])
+                    return
+
+                # 20 writes a second, each a twentieth of the bandwidth
+                block = max(1, bandwidth // 20)
+                for offset in range(start, stop, block):
+                    self.wfile.write(body[offset : min(offset + block, stop)])
+                    time.sleep(0.05)
+
+        return StandinHandler
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="seconds per request"
+    )
+    parser.add_argument(
+        "--bandwidth", type=int, default=0, help="bytes/s per connection"
+    )
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--sound-size", type=int, default=512 * 1024)
+    args = parser.parse_args()
+
+    config = StandinConfig(
+        latency=args.latency,
+        bandwidth=args.bandwidth,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        sound_size=args.sound_size,
+    )
+    server = StandinServer(config, args.port)
+
+    print(f"Freesound stand-in: {server.api_url}")
+    print(f"Token function:     {server.token_url}")
+
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+import os, shlex, sys
+from typing import TYPE_CHECKING
+from move_alarm import control
+import move_alarm.datatypes as datatype
+
+if TYPE_CHECKING:
+    from move_alarm.components import AlarmService
+
+COMMANDS = {
+    "help": "View all available commands.",
+    "exit": "Exit the REPL, the alarm keeps running in the background.",
+    "start": "Begin the reminder cycle.",
+    "snooze": "Delay the current reminder cycle by the snooze duration.",
+    "stop": "Halt the reminders, or the sound that is playing.",
+    "test": "Test the sound notifications by playing a sound now.",
+    "status": "Show whether an alarm is set and when it will sound.",
+    "shutdown": "Stop the background MoveAlarm process.",
+    "daemon": "Run the background MoveAlarm process in this terminal.",
+    "serve": "Run the multi-user HTTP service, e.g. serve --port 8765 --data DIR.",
+}
+
+# These need the background process, so it is launched if it isn't running
+STARTING_COMMANDS = ["start", "test"]
+
+
+def print_help(args: list[str]) -> None:
+    if len(args) > 0 and args[0] in COMMANDS:
+        print(f"{args[0]} - {COMMANDS[args[0]]}")
+        return
+
+    print("Commands (also accepted as flags, e.g. move-alarm --start):")
+    for command, description in COMMANDS.items():
+        print(f"  {command:<9} {description}")
+
+
+def run_daemon() -> int:
+    # Deferred so the other commands never load the audio and HTTP stacks
+    from move_alarm.components import Daemon
+
+    try:
+        Daemon().serve()
+    except datatype.DaemonAlreadyRunningError:
+        # Nothing to build, commands from here on go to the running one
+        print("Info: MoveAlarm is already running, commands will be sent to it")
+        return control.ALREADY_RUNNING_EXIT_CODE
+
+    return 0
+
+
+def run_service(args: list[str]) -> int:
+    # Deferred so the other commands never load the HTTP server
+    import argparse
+    from move_alarm.components import AlarmService
+    from move_alarm.control import http_api
+
+    parser = argparse.ArgumentParser(prog="move-alarm serve")
+    parser.add_argument("--host", default=http_api.DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=http_api.DEFAULT_PORT)
+    parser.add_argument("--data", default=os.path.join(os.getcwd(), "move-alarm"))
+
+    try:
+        options = parser.parse_args(args)
+    except SystemExit as error:
+        return 0 if error.code == 0 else 2
+
+    if not http_api.is_loopback(options.host):
+        print(
+            f"Warning: MoveAlarm serve only listens on this machine, not {options.host}"
+        )
+        return 2
+
+    service = AlarmService(options.data)
+
+    if service.default_config.api_enabled and not enable_freesound(service):
+        return 1
+
+    service.start()
+    server, thread = http_api.start_http_api(service, options.host, options.port)
+    host, port = options.host, server.server_port
+    print(f"Info: MoveAlarm service listening on http://{host}:{port}")
+
+    try:
+        thread.join()
+    except KeyboardInterrupt:
+        print()
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+        service.stop()
+
+    return 0
+
+
+def enable_freesound(service: "AlarmService") -> bool:
+    from move_alarm import utils
+
+    port = service.default_config.login_callback_port
+
+    # Logging in asks the operator, so it happens before any alarm can ring
+    try:
+        auth = utils.HandleAuthorisation(callback_port=port if port > 0 else None)
+
+        try:
+            auth.get_token()
+        except EOFError:
+            raise
+        except Exception as error:
+            print(
+                f"Warning: {Warning(error)}\n"
+                + "Local sounds will be used until Freesound can be reached..."
+            )
+    except EOFError:
+        print(
+            "Warning: Freesound is enabled in default.json, run 'move-alarm serve' "
+            + "in a terminal once to log in"
+        )
+        return False
+
+    service.enable_freesound(auth)
+    return True
+
+
+def launch_daemon() -> bool:
+    address = control.control_address()
+    process = control.spawn_daemon(address)
+
+    if control.wait_for_daemon(address, process=process):
+        return True
+
+    print(f"Warning: MoveAlarm didn't start, see {control.log_path(address)}")
+    return False
+
+
+def send(command: str, args: list[str]) -> int:
+    try:
+        response = control.send_command(command, args)
+    except datatype.DaemonNotRunningError:
+        if command not in STARTING_COMMANDS:
+            print("Info: MoveAlarm isn't running, use start to set an alarm")
+            return 1
+        if not launch_daemon():
+            return 1
+        response = control.send_command(command, args)
+
+    print(response["message"])
+    return 0 if response["ok"] else 1
+
+
+def run_command(command: str, args: list[str]) -> int:
+    command = command.removeprefix("--")
+
+    if command == "help":
+        print_help(args)
+        return 0
+
+    if command == "daemon":
+        return run_daemon()
+
+    if command == "serve":
+        return run_service(args)
+
+    if command not in COMMANDS or command == "exit":
+        print(f"Warning: Unknown command '{command}', try help")
+        return 2
+
+    return send(command, args)
+
+
+def repl() -> int:
+    while True:
+        try:
+            line = input("MoveAlarm> ")
+        except (EOFError, KeyboardInterrupt):
+            print()
+            return 0
+
+        try:
+            words = shlex.split(line)
+        except ValueError as error:
+            print(f"Warning: {Warning(error)}")
+            continue
+
+        if len(words) == 0:
+            continue
+
+        if words[0] == "exit":
+            return 0
+
+        run_command(words[0], words[1:])
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = sys.argv[1:] if argv is None else argv
+
+    if len(args) == 0:
+        return repl()
+
+    return run_command(args[0], args[1:])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
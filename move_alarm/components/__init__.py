@@ -1,2 +1,4 @@
 from move_alarm.components.sounds import Sounds
 from move_alarm.components.alarm import Alarm
+from move_alarm.components.daemon import Daemon
+from move_alarm.components.service import AlarmService
@@ -1,16 +1,14 @@
-import threading
+import contextvars, threading
 import time
-from datetime import datetime
+from datetime import datetime, timedelta
 from move_alarm.contexts import use_context
 from move_alarm import components
+from move_alarm.utils.lazy_import import LazyAttribute
 import move_alarm.datatypes as datatype
 
 
 class Alarm:
-    _sounds: datatype.Sounds = components.Sounds()
-    _stop_alarm: bool = False
-    _time: datetime = datetime.fromtimestamp(0)
-    _lock = threading.Lock()
+    _sounds: LazyAttribute[datatype.Sounds] = LazyAttribute(lambda: components.Sounds())
 
     @property
     def is_set(self) -> bool:
@@ -28,17 +26,48 @@ class Alarm:
     def sounds(self) -> datatype.Sounds:
         return self._sounds
 
+    def __init__(self) -> None:
+        self._stop_alarm = False
+        self._time = datetime.fromtimestamp(0)
+        self._lock = threading.Lock()
+        # Seconds the pending alarm counts down from, and how many are left
+        self._interval = 0
+        self._remaining = 0
+        self._snoozed = False
+        self._config: datatype.Config | None = None
+
+    def watch(self, config: datatype.Config) -> None:
+        # Built before any context exists, so it attaches on the first set_alarm
+        if config is self._config:
+            return
+
+        self.unwatch()
+        config.on_change(self.reschedule)
+        self._config = config
+
+    def unwatch(self) -> None:
+        if self._config is not None:
+            self._config.remove_listener(self.reschedule)
+            self._config = None
+
     def set_alarm(self, snooze: bool = False) -> datetime:
         if self.is_set and not snooze:
             return self._time
 
         config = use_context().config
+        self.watch(config)
 
         interval = (
             config.snooze_duration.seconds if snooze else config.wait_duration.seconds
         )
 
-        set_alarm = threading.Thread(target=self.thread_alarm, args=[interval])
+        with self._lock:
+            self._snoozed = snooze
+
+        # New threads start with an empty context, this keeps any context_scope
+        set_alarm = threading.Thread(
+            target=contextvars.copy_context().run, args=[self.thread_alarm, interval]
+        )
         set_alarm.name = "MoveAlarm"
         set_alarm.start()
 
@@ -47,7 +76,13 @@ class Alarm:
         return self._time
 
     def thread_alarm(self, interval) -> None:
-        for _ in range(0, interval):
+        config = use_context().config
+
+        with self._lock:
+            self._interval = interval
+            self._remaining = interval
+
+        while True:
             with self._lock:
                 if self._stop_alarm:
                     self._stop_alarm = False
@@ -55,10 +90,35 @@ class Alarm:
                     print("Alarm removed")
                     return
 
+                if self._remaining <= 0:
+                    break
+
+                # Counted as ticks so a config reload can move the finish line
+                self._remaining -= 1
+
             time.sleep(1)
 
+            # Nothing else may use the context while the alarm waits, an edited
+            # config file is picked up here and reschedules through on_change
+            config.reload_if_changed()
+
         self.sounds.play_sound()
 
+    def reschedule(self, changed: set[str]) -> None:
+        config = use_context().config
+        key = "snooze_duration" if self._snoozed else "wait_duration"
+
+        if key not in changed or not self.is_set:
+            return
+
+        with self._lock:
+            interval = getattr(config, key).seconds
+            elapsed = self._interval - self._remaining
+
+            self._interval = interval
+            self._remaining = max(0, interval - elapsed)
+            self._time = datetime.now() + timedelta(seconds=self._remaining)
+
     def snooze_alarm(self) -> datetime:
         if not self.is_set:
             raise datatype.AlarmNotSetError(
@@ -68,7 +128,10 @@ class Alarm:
         config = use_context().config
 
         if self.sounds.is_playing is False:
-            self._time = self._time + config.snooze_duration
+            # Left out of the interval, so a reschedule keeps the snooze too
+            with self._lock:
+                self._remaining += config.snooze_duration.seconds
+                self._time = self._time + config.snooze_duration
         else:
             self.sounds.stop_sound()
             self.set_alarm(snooze=True)
@@ -76,6 +139,8 @@ class Alarm:
         return self.time
 
     def remove_alarm(self) -> bool:
+        self.unwatch()
+
         if self.sounds.is_playing:
             return self.sounds.stop_sound()
 
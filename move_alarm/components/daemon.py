@@ -0,0 +1,197 @@
+import contextvars, os, threading
+from collections.abc import Callable
+from move_alarm.contexts import use_context
+from move_alarm import components, control, utils
+from move_alarm.control.server import ControlServer
+import move_alarm.datatypes as datatype
+
+HELP_URL = "https://github.com/DevDolphin7/move-alarm"
+
+
+class Daemon:
+    # Seconds stop waits for the alarm thread to finish its current tick
+    stop_timeout: float = 2.0
+
+    @property
+    def alarm(self) -> components.Alarm:
+        return self._alarm
+
+    @property
+    def server(self) -> ControlServer:
+        return self._server
+
+    def __init__(self, address: datatype.ControlAddress | None = None) -> None:
+        address = address if address is not None else control.control_address()
+
+        self._alarm = components.Alarm()
+        self._server = ControlServer(self.handle, address)
+        self._instance_lock = utils.FileLock(control.lock_path(address))
+        self._stopped = threading.Event()
+        self.commands: dict[
+            str, Callable[[list[str]], datatype.ControlResponseDict]
+        ] = {
+            "ping": self.ping,
+            "start": self.start_alarm,
+            "snooze": self.snooze_alarm,
+            "stop": self.stop_alarm,
+            "test": self.test_sound,
+            "status": self.status,
+            "shutdown": self.shutdown,
+        }
+
+    def handle(self, command: str, args: list[str]) -> datatype.ControlResponseDict:
+        action = self.commands.get(command)
+
+        if action is None:
+            return control.make_response(False, f"Unknown command: {command}")
+
+        return action(args)
+
+    def serve(self) -> None:
+        # Taken before anything is built, so a second launch costs almost nothing.
+        # The OS releases it if this process dies, it can never go stale.
+        if not self._instance_lock.acquire(blocking=False):
+            raise datatype.DaemonAlreadyRunningError(
+                f"MoveAlarm is already running, {self._instance_lock.path} is locked"
+            )
+
+        contexts: datatype.Contexts | None = None
+        try:
+            # Anything that needs to ask the user happens now, in the foreground
+            try:
+                contexts = use_context()
+            except EOFError:
+                print(
+                    "Warning: MoveAlarm needs a client_id before it can run in the "
+                    + "background, run 'move-alarm daemon' in a terminal once"
+                )
+                raise
+
+            if contexts.config.api_enabled:
+                self.log_in(contexts)
+
+            self.refresh_in_background(contexts)
+            if isinstance(contexts.config, utils.Configuration):
+                contexts.config.on_change(
+                    lambda changed: self.refresh_in_background(contexts)
+                )
+
+            self.server.start()
+            print(f"Info: MoveAlarm is listening on {self.server.address.path}")
+
+            while not self._stopped.wait(timeout=1):
+                pass
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.server.stop()
+            self.alarm.remove_alarm()
+            if contexts is not None:
+                contexts.auth.stop_background_refresh()
+            self._instance_lock.release()
+
+    def log_in(self, contexts: datatype.Contexts) -> None:
+        # An alarm thread can't ask the user to log in, so it must happen here
+        try:
+            contexts.auth.get_token()
+        except EOFError:
+            print(
+                "Warning: MoveAlarm needs you to log in to Freesound before it can "
+                + "run in the background, run 'move-alarm daemon' in a terminal once"
+            )
+            raise
+        except Exception as error:
+            print(
+                f"Warning: {Warning(error)}\n"
+                + "Local sounds will be used until Freesound can be reached..."
+            )
+
+    def refresh_in_background(self, contexts: datatype.Contexts) -> None:
+        # Keeps the access token fresh, so an alarm never waits on a login
+        if contexts.config.api_enabled:
+            contexts.auth.start_background_refresh()
+        else:
+            contexts.auth.stop_background_refresh()
+
+    def ping(self, args: list[str]) -> datatype.ControlResponseDict:
+        return control.make_response(True, "pong", {"pid": os.getpid()})
+
+    def start_alarm(self, args: list[str]) -> datatype.ControlResponseDict:
+        already_set = self.alarm.is_set
+        time = self.alarm.set_alarm()
+
+        if already_set:
+            return control.make_response(
+                True, f"The alarm is already set for {time:%H:%M}", self.describe()
+            )
+        return control.make_response(
+            True, f"Alarm set for {time:%H:%M}", self.describe()
+        )
+
+    def snooze_alarm(self, args: list[str]) -> datatype.ControlResponseDict:
+        try:
+            time = self.alarm.snooze_alarm()
+        except datatype.AlarmNotSetError:
+            return control.make_response(
+                False, "No alarm is set, use start to set one", self.describe()
+            )
+
+        return control.make_response(
+            True, f"Alarm snoozed until {time:%H:%M}", self.describe()
+        )
+
+    def stop_alarm(self, args: list[str]) -> datatype.ControlResponseDict:
+        if self.alarm.remove_alarm():
+            # The alarm thread notices on its next tick, status should agree
+            for thread in threading.enumerate():
+                if thread.name == "MoveAlarm":
+                    thread.join(timeout=self.stop_timeout)
+
+            return control.make_response(True, "Alarm stopped", self.describe())
+
+        return control.make_response(False, "No alarm is set", self.describe())
+
+    def test_sound(self, args: list[str]) -> datatype.ControlResponseDict:
+        # play_sound blocks until the sound ends, the client shouldn't wait
+        player = threading.Thread(
+            target=contextvars.copy_context().run,
+            args=[self.alarm.sounds.play_sound],
+            daemon=True,
+        )
+        player.name = "MoveTest"
+        player.start()
+
+        return control.make_response(
+            True,
+            "Playing a sound now, it will stop by itself or with stop. "
+            + f"If you can't hear anything, see {HELP_URL}",
+            self.describe(),
+        )
+
+    def status(self, args: list[str]) -> datatype.ControlResponseDict:
+        data = self.describe()
+
+        if data["set"]:
+            message = f"The alarm is set for {self.alarm.time:%H:%M}"
+        else:
+            message = "No alarm is set"
+
+        if data["playing"]:
+            message += ", a sound is playing"
+
+        return control.make_response(True, message, data)
+
+    def shutdown(self, args: list[str]) -> datatype.ControlResponseDict:
+        self._stopped.set()
+
+        return control.make_response(True, "MoveAlarm is shutting down")
+
+    def describe(self) -> dict[str, object]:
+        is_set = self.alarm.is_set
+
+        return {
+            "set": is_set,
+            "time": self.alarm.time.isoformat() if is_set else None,
+            "playing": self.alarm.sounds.is_playing,
+            "pid": os.getpid(),
+        }
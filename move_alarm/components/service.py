@@ -0,0 +1,236 @@
+import os, re, threading, time
+from datetime import datetime
+from typing import Any
+from move_alarm import utils
+from move_alarm.utils import config_schema
+from move_alarm.utils.atomic_file import write_atomic
+import move_alarm.datatypes as datatype
+
+# Also the config file name, so nothing that could leave the users directory
+USER_PATTERN = re.compile(r"[A-Za-z0-9_.-]{1,64}")
+
+
+class Tenant:
+    # Slots keep each user to a couple of hundred bytes until they customise
+    __slots__ = ("user", "config", "ringing", "sound", "rang_at")
+
+    def __init__(self, user: str, config: utils.Configuration | None) -> None:
+        self.user = user
+        # None until the user changes a setting, the service default applies
+        self.config = config
+        self.ringing = False
+        self.sound: str | None = None
+        self.rang_at: float | None = None
+
+
+class AlarmService:
+
+    @property
+    def scheduler(self) -> utils.AlarmScheduler:
+        return self._scheduler
+
+    @property
+    def library(self) -> utils.SoundLibrary:
+        return self._library
+
+    @property
+    def default_config(self) -> utils.Configuration:
+        return self._default_config
+
+    @property
+    def user_count(self) -> int:
+        return len(self._tenants)
+
+    def __init__(
+        self, data_directory: str, library: utils.SoundLibrary | None = None
+    ) -> None:
+        self.users_directory = os.path.join(data_directory, "users")
+        self.sounds_directory = os.path.join(data_directory, "sounds")
+        os.makedirs(self.users_directory, exist_ok=True)
+        os.makedirs(self.sounds_directory, exist_ok=True)
+
+        self._default_config = utils.Configuration(
+            os.path.join(data_directory, "default.json")
+        )
+        self._tenants: dict[str, Tenant] = {}
+        self._lock = threading.RLock()
+        self._scheduler = utils.AlarmScheduler(self.ring)
+        self._library = library if library is not None else utils.SoundLibrary()
+        self._freesound: utils.FreesoundCache | None = None
+
+    @property
+    def freesound(self) -> utils.FreesoundCache | None:
+        return self._freesound
+
+    def enable_freesound(self, auth: datatype.OauthObject) -> utils.FreesoundCache:
+        # Everyone's searches go through the operator's login and one download folder
+        budget = utils.download_budget
+        budget.daily_bytes = self.default_config.daily_download_limit
+
+        self._freesound = utils.FreesoundCache(
+            os.path.join(self.sounds_directory, "freesound"), auth.get_token, budget
+        )
+        return self._freesound
+
+    def start(self) -> None:
+        self.scheduler.start()
+
+    def stop(self) -> None:
+        self.scheduler.stop()
+        if self.freesound is not None:
+            self.freesound.stop()
+        self.default_config.flush()
+
+    def config_path(self, user: str) -> str:
+        return os.path.join(self.users_directory, f"{user}.json")
+
+    def tenant(self, user: str, create: bool = True) -> Tenant | None:
+        if not USER_PATTERN.fullmatch(user):
+            raise ValueError("A user name of letters, digits, '_', '.' or '-' required")
+
+        with self._lock:
+            tenant = self._tenants.get(user)
+            if tenant is not None:
+                return tenant
+
+            # Users with their own settings are loaded again after a restart
+            path = self.config_path(user)
+            config = utils.Configuration(path) if os.path.exists(path) else None
+            if config is None and not create:
+                return None
+
+            tenant = self._tenants[user] = Tenant(user, config)
+
+            return tenant
+
+    def sound_roots(self) -> list[str]:
+        return [self.sounds_directory, self.default_config.wav_directory]
+
+    def check_sound_directory(self, directory: str) -> None:
+        # Any other directory would let a user list the server's files
+        path = os.path.realpath(directory)
+
+        for root in map(os.path.realpath, self.sound_roots()):
+            try:
+                if os.path.commonpath([root, path]) == root:
+                    return
+            except ValueError:
+                continue
+
+        raise ValueError(f"A wav_directory inside {self.sounds_directory} required")
+
+    def require_tenant(self, user: str) -> Tenant:
+        tenant = self.tenant(user)
+        assert tenant is not None
+        return tenant
+
+    def config_for(self, tenant: Tenant | None) -> utils.Configuration:
+        if tenant is None or tenant.config is None:
+            return self.default_config
+        return tenant.config
+
+    def set_alarm(self, user: str) -> datatype.AlarmStatusDict:
+        tenant = self.require_tenant(user)
+        config = self.config_for(tenant)
+        wait = config.wait_duration.total_seconds()
+
+        if self.freesound is not None and config.api_enabled:
+            # Downloaded while the alarm waits, so the first ring can use it
+            self.freesound.refill(config.sound_themes, config.sound_filters)
+
+        with self._lock:
+            self.scheduler.schedule(user, wait)
+            tenant.ringing = False
+
+        return self.status(user)
+
+    def snooze_alarm(self, user: str) -> datatype.AlarmStatusDict:
+        tenant = self.tenant(user, create=False)
+        snooze = self.config_for(tenant).snooze_duration.total_seconds()
+
+        with self._lock:
+            if tenant is None or self.scheduler.postpone(user, snooze) is None:
+                raise datatype.AlarmNotSetError(f"No alarm is set for {user}")
+            tenant.ringing = False
+
+        return self.status(user)
+
+    def remove_alarm(self, user: str) -> bool:
+        tenant = self.tenant(user, create=False)
+
+        with self._lock:
+            removed = self.scheduler.cancel(user)
+
+            # Nothing left to remember for a user on the default settings
+            if tenant is not None and tenant.config is None:
+                del self._tenants[user]
+            elif tenant is not None:
+                tenant.ringing = False
+
+        return removed
+
+    def status(self, user: str) -> datatype.AlarmStatusDict:
+        tenant = self.tenant(user, create=False)
+        due = self.scheduler.due_at(user)
+
+        return datatype.AlarmStatusDict(
+            user=user,
+            set=due is not None,
+            time=None if due is None else datetime.fromtimestamp(due).isoformat(),
+            ringing=tenant is not None and tenant.ringing,
+            sound=None if tenant is None else tenant.sound,
+            message=self.config_for(tenant).reminder_text,
+        )
+
+    def ring(self, user: str) -> None:
+        tenant = self.tenant(user, create=False)
+        if tenant is None:
+            return
+
+        config = self.config_for(tenant)
+        sound = None
+        if self.freesound is not None and config.api_enabled:
+            sound = self.freesound.pick(config.sound_themes, config.sound_filters)
+        if sound is None:
+            sound = self.library.pick(config.wav_directory)
+
+        with self._lock:
+            tenant.ringing = True
+            tenant.sound = sound
+            tenant.rang_at = time.time()
+            # Each ring starts the next cycle, like start does
+            self.scheduler.schedule(user, config.wait_duration.total_seconds())
+
+    def get_config(self, user: str) -> dict[str, Any]:
+        config = self.config_for(self.tenant(user, create=False))
+        return config_schema.encode(config.snapshot(), json_format=True)
+
+    def update_config(self, user: str, changes: dict[str, Any]) -> dict[str, Any]:
+        tenant = self.require_tenant(user)
+
+        if not isinstance(changes, dict):
+            raise ValueError("A JSON object of sections required")
+
+        with self._lock:
+            sections = self.get_config(user)
+            for section, values in changes.items():
+                if not isinstance(values, dict):
+                    raise ValueError(f"A JSON object required for [{section}]")
+                sections.setdefault(section, {}).update(values)
+
+            values = config_schema.decode(sections, json_format=True)
+            config_schema.validate(values)
+            self.check_sound_directory(values["wav_directory"])
+
+            if tenant.config is None:
+                # Written first so the Configuration loads it rather than
+                # warning about a missing file and saving the defaults
+                path = self.config_path(user)
+                write_atomic(path, config_schema.serialise(values, json_format=True))
+                tenant.config = utils.Configuration(path)
+
+            with tenant.config.update(debounce=False) as config:
+                for name, value in values.items():
+                    setattr(config, name, value)
+
+        return self.get_config(user)
@@ -1,9 +1,21 @@
-import os, random
-import simpleaudio as sa  # type: ignore
+from __future__ import annotations
+import contextvars, json, os, random, threading
+from collections.abc import Callable
+from typing import TYPE_CHECKING
 from move_alarm.contexts import use_context
 from move_alarm import utils
+from move_alarm.utils.atomic_file import write_atomic
+from move_alarm.utils.lazy_import import lazy_import
 import move_alarm.datatypes as datatype
 
+if TYPE_CHECKING:
+    import simpleaudio as sa  # type: ignore
+else:
+    sa = lazy_import("simpleaudio")
+
+# Kept beside the downloads, so a restart still knows which sounds it has
+DIGESTS_FILE = ".move-alarm-digests.json"
+
 
 class Sounds(datatype.Sounds):
 
@@ -11,8 +23,18 @@ class Sounds(datatype.Sounds):
     def is_playing(self) -> bool:
         return len(self._play_objects) != 0
 
+    @property
+    def prefetcher(self) -> utils.SoundPrefetcher | None:
+        return self._prefetcher
+
     def __init__(self) -> None:
-        self._play_objects: list[sa.PlayObject] = []
+        self._play_objects: list[sa.PlayObject | utils.StreamingPlayback] = []
+        self._prefetcher: utils.SoundPrefetcher | None = None
+        self._prepared: dict[str, sa.WaveObject] = {}
+        self._digests: dict[str, str] = {}
+        self._digests_path: str | None = None
+        self._digests_lock = threading.Lock()
+        self._throttle: utils.TokenBucket | None = None
 
     def get_local_file(self, dir_path: str) -> str:
         files = [
@@ -26,9 +48,18 @@ class Sounds(datatype.Sounds):
         return os.path.join(dir_path, files[index])
 
     def search_freesound(self, themes: list[str]) -> datatype.SoundResult | None:
+        config = use_context().config
         token = utils.get_auth_token()
 
-        sounds = utils.search_for_sounds(token, themes=themes)
+        filters = config.sound_filters
+
+        if config.search_per_theme:
+            sounds = utils.search_for_sounds_by_theme(token, themes, filters)
+        else:
+            sounds = utils.search_for_sounds(token, themes=themes, filters=filters)
+
+        # In case the server could not apply a filter, never fetch those files
+        sounds = [sound for sound in sounds if filters.allows(sound)]
 
         if len(sounds) == 0:
             return None
@@ -45,18 +76,86 @@ class Sounds(datatype.Sounds):
 
         return datatype.SoundResult(id, url, name, description, download, license)
 
-    def download_from_freesound(self, url: str, new_path: str) -> str:
+    def download_from_freesound(
+        self,
+        url: str,
+        new_path: str,
+        on_chunk: Callable[[int, bytes], None] | None = None,
+        background: bool = False,
+    ) -> str:
         token = utils.get_auth_token()
 
-        utils.download_sound(token, url, new_path)
+        options: dict = {"budget": utils.get_download_budget()}
+        if on_chunk is not None:
+            options["on_chunk"] = on_chunk
+        if background:
+            options["throttle"] = self.get_throttle()
+
+        digest = utils.download_sound(token, url, new_path, **options)
 
         if os.path.exists(new_path):
-            return new_path
+            return self.deduplicate(digest, new_path)
         raise FileNotFoundError(
             f"Sound file should exist but could not be found: {new_path}"
         )
 
-    def get_freesound(self) -> str | None:
+    def get_throttle(self) -> utils.TokenBucket | None:
+        rate = use_context().config.background_download_rate
+
+        if rate <= 0:
+            return None
+
+        if self._throttle is None or self._throttle.rate != rate:
+            self._throttle = utils.make_throttle(rate)
+
+        return self._throttle
+
+    def load_digests(self) -> dict[str, str]:
+        path = os.path.join(use_context().config.wav_directory, DIGESTS_FILE)
+
+        if path != self._digests_path:
+            self._digests_path = path
+            try:
+                with open(path) as file:
+                    saved = json.load(file)
+                self._digests = {
+                    str(digest): str(sound_path)
+                    for digest, sound_path in dict(saved).items()
+                    if os.path.exists(str(sound_path))
+                }
+            except (OSError, ValueError, TypeError):
+                self._digests = {}
+
+        return self._digests
+
+    def save_digests(self) -> None:
+        if self._digests_path is None:
+            return
+
+        try:
+            write_atomic(self._digests_path, json.dumps(self._digests))
+        except OSError as error:
+            print(f"Warning: {Warning(error)}\nDuplicate sounds may be downloaded...")
+
+    def deduplicate(self, digest: str, new_path: str) -> str:
+        with self._digests_lock:
+            digests = self.load_digests()
+            existing_path = digests.get(digest)
+
+            if (
+                existing_path is not None
+                and existing_path != new_path
+                and os.path.exists(existing_path)
+            ):
+                # Same audio under a different name, keep the copy we already had
+                os.remove(new_path)
+                return existing_path
+
+            digests[digest] = new_path
+            self.save_digests()
+            return new_path
+
+    def get_freesound(self, background: bool = False) -> str | None:
         config = use_context().config
 
         search_result = self.search_freesound(config.sound_themes)
@@ -64,33 +163,214 @@ class Sounds(datatype.Sounds):
         if isinstance(search_result, datatype.SoundResult):
             new_path = os.path.join(config.wav_directory, search_result.name)
 
-            return self.download_from_freesound(search_result.download, new_path)
+            return self.download_from_freesound(
+                search_result.download, new_path, background=background
+            )
 
         return None
 
+    def prepare_freesound(self) -> datatype.PreparedSound | None:
+        sound_path = self.get_freesound(background=True)
+
+        if sound_path is None:
+            return None
+
+        wave_obj = sa.WaveObject.from_wave_file(sound_path)
+
+        return datatype.PreparedSound(sound_path, wave_obj)
+
+    def invalidate_caches(self, changed: set[str]) -> None:
+        # Sounds fetched for the old settings should not play under the new ones
+        if len(changed & {"wav_directory", "sound_themes", "sound_filters"}) == 0:
+            return
+
+        if self._prefetcher is not None:
+            self._prefetcher.clear()
+
+        self._prepared.clear()
+
+        if "wav_directory" in changed:
+            with self._digests_lock:
+                # The new directory's own file is read on the next download
+                self._digests = {}
+                self._digests_path = None
+
+    def start_prefetch(self, size: int) -> utils.SoundPrefetcher:
+        use_context().config.on_change(self.invalidate_caches)
+
+        if self._prefetcher is None:
+            self._prefetcher = utils.SoundPrefetcher(self.prepare_freesound, size)
+        else:
+            self._prefetcher.size = size
+
+        self._prefetcher.start()
+
+        return self._prefetcher
+
+    def get_prefetched_sound(self) -> str | None:
+        config = use_context().config
+
+        if config.prefetch_count <= 0:
+            return None
+
+        prepared = self.start_prefetch(config.prefetch_count).get()
+
+        if prepared is None:
+            return None
+
+        self._prepared[prepared.path] = prepared.wave_object
+        return prepared.path
+
+    def get_freesound_before_deadline(self) -> tuple[bool, str | None]:
+        config = use_context().config
+        outcome: dict[str, str | None | Exception] = {}
+
+        def fetch() -> None:
+            try:
+                outcome["sound"] = self.get_freesound()
+            except Exception as error:
+                outcome["error"] = error
+
+        # Left running after the deadline, so the download still lands in
+        # wav_directory for get_local_file to pick up next time
+        fetch_thread = threading.Thread(
+            target=contextvars.copy_context().run, args=(fetch,), daemon=True
+        )
+        fetch_thread.name = "MoveFetch"
+        fetch_thread.start()
+        fetch_thread.join(timeout=config.acquire_deadline.total_seconds())
+
+        if fetch_thread.is_alive():
+            print("Info: Freesound is taking too long, playing a local sound")
+            return False, None
+
+        error = outcome.get("error")
+        if isinstance(error, Exception):
+            print(f"Warning: {Warning(error)}\nPlaying a local sound...")
+            return False, None
+
+        sound = outcome.get("sound")
+        return True, sound if isinstance(sound, str) else None
+
+    def stream_freesound(self, playback: utils.StreamingPlayback) -> None:
+        try:
+            config = use_context().config
+            search_result = self.search_freesound(config.sound_themes)
+
+            if search_result is None:
+                playback.fail(LookupError(config.sound_themes))
+                return
+
+            new_path = os.path.join(config.wav_directory, search_result.name)
+            self.download_from_freesound(
+                search_result.download, new_path, on_chunk=playback.feed
+            )
+            playback.finish()
+        except Exception as error:
+            playback.fail(error)
+
+    def get_streamed_sound(self) -> tuple[bool, utils.StreamingPlayback | None]:
+        config = use_context().config
+
+        prefetcher = self._prefetcher
+        if (
+            not (config.api_enabled and config.stream_playback)
+            or (prefetcher is not None and prefetcher.ready > 0)
+            or utils.is_api_offline()
+        ):
+            return False, None
+
+        try:
+            if utils.is_download_budget_exhausted():
+                return False, None
+        except Exception:
+            # get_sound reports it as it falls back to a local sound
+            return False, None
+
+        playback = utils.StreamingPlayback()
+
+        # Keeps going once playback starts, the whole file still lands on disk
+        stream_thread = threading.Thread(
+            target=contextvars.copy_context().run,
+            args=(self.stream_freesound, playback),
+            daemon=True,
+        )
+        stream_thread.name = "MoveFetch"
+        stream_thread.start()
+
+        if playback.wait_started(timeout=config.acquire_deadline.total_seconds()):
+            return True, playback
+
+        playback.stop()
+
+        if isinstance(playback.error, LookupError):
+            print(f"Info: Freesound returned no results for {config.sound_themes}")
+        elif playback.error is not None:
+            print(f"Warning: {Warning(playback.error)}\nPlaying a local sound...")
+        else:
+            print("Info: Freesound is taking too long, playing a local sound")
+
+        return True, None
+
     def get_sound(self) -> str:
         config = use_context().config
 
         if config.api_enabled:
-            sound = self.get_freesound()
-            if sound != None:
-                return sound
-            print(f"Info: Freesound returned no results for {config.sound_themes}")
+            prefetched = self.get_prefetched_sound()
+            if prefetched != None:
+                return prefetched
+
+            try:
+                usage = utils.get_download_usage()
+            except Exception as error:
+                print(f"Warning: {Warning(error)}\nPlaying a local sound...")
+                return self.get_local_file(config.wav_directory)
+
+            prefetcher = self._prefetcher
+            if utils.is_api_offline():
+                print("Info: Freesound is unavailable, playing a local sound")
+            elif prefetcher is not None and prefetcher.is_fetching:
+                # Fetching it again here would download a second sound at once
+                print("Info: A Freesound sound is on its way, playing a local sound")
+            elif usage.exhausted:
+                print(
+                    f"Info: Today's download budget of {usage.budget} bytes is used up, "
+                    + "playing a local sound"
+                )
+            else:
+                responded, sound = self.get_freesound_before_deadline()
+                if sound != None:
+                    return sound
+                if responded:
+                    print(
+                        f"Info: Freesound returned no results for {config.sound_themes}"
+                    )
 
         return self.get_local_file(config.wav_directory)
 
     def play_sound(self) -> None:
-        sound_path = self.get_sound()
+        streamed, play_object = self.get_streamed_sound()
 
-        wave_obj = sa.WaveObject.from_wave_file(sound_path)
+        if play_object is None:
+            if streamed:
+                sound_path = self.get_local_file(use_context().config.wav_directory)
+            else:
+                sound_path = self.get_sound()
+
+            wave_obj = self._prepared.pop(sound_path, None)
+            if wave_obj is None:
+                wave_obj = sa.WaveObject.from_wave_file(sound_path)
+
+            play_object = wave_obj.play()
 
-        play_object = wave_obj.play()
         self._play_objects.append(play_object)
 
         play_object.wait_done()
         self.stop_sound(specific=play_object)
 
-    def stop_sound(self, specific: sa.PlayObject | None = None) -> bool:
+    def stop_sound(
+        self, specific: sa.PlayObject | utils.StreamingPlayback | None = None
+    ) -> bool:
         if self.is_playing:
 
             if specific != None:
@@ -1 +1 @@
-from move_alarm.contexts.use_context import use_context
+from move_alarm.contexts.use_context import use_context, init_context, context_scope
@@ -1,20 +1,60 @@
-import os
+import contextvars, os, threading
+from collections.abc import Iterator
+from contextlib import contextmanager
 from move_alarm import utils
 import move_alarm.datatypes as datatype
 
 cache: datatype.Contexts | None = None
+cache_lock = threading.RLock()
 
+# Set inside context_scope, so one process can serve several users or configs
+scoped_context: contextvars.ContextVar[datatype.Contexts | None] = (
+    contextvars.ContextVar("move_alarm_context", default=None)
+)
 
-def use_context() -> datatype.Contexts:
+
+def default_config_path() -> str:
+    return os.path.join(os.path.dirname(__file__)[:-8], "config.ini")
+
+
+def init_context(
+    auth: datatype.OauthObject | None = None, config: datatype.Config | None = None
+) -> datatype.Contexts:
     global cache
 
-    if cache != None:
+    with cache_lock:
+        if config is None:
+            config = utils.Configuration(default_config_path())
+
+        if auth is None:
+            port = config.login_callback_port
+            auth = utils.HandleAuthorisation(callback_port=port if port > 0 else None)
+
+        cache = datatype.Contexts(auth, config)
+
         return cache
 
-    config_path = os.path.join(os.path.dirname(__file__)[:-8], "config.ini")
 
-    cache = datatype.Contexts(
-        utils.HandleAuthorisation(), utils.Configuration(config_path)
-    )
+def use_context() -> datatype.Contexts:
+    context = scoped_context.get()
+
+    if context is None:
+        context = cache
+
+    if context is None:
+        # Only the first caller builds it, so the login prompt appears once
+        with cache_lock:
+            context = cache if cache is not None else init_context()
+
+    context.config.reload_if_changed()
+    return context
+
+
+@contextmanager
+def context_scope(context: datatype.Contexts) -> Iterator[datatype.Contexts]:
+    token = scoped_context.set(context)
 
-    return cache
+    try:
+        yield context
+    finally:
+        scoped_context.reset(token)
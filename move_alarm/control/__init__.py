@@ -0,0 +1,15 @@
+from move_alarm.control.protocol import (
+    control_address,
+    log_path,
+    lock_path,
+    ALREADY_RUNNING_EXIT_CODE,
+    encode_message,
+    read_message,
+    make_response,
+)
+from move_alarm.control.client import (
+    send_command,
+    is_daemon_running,
+    spawn_daemon,
+    wait_for_daemon,
+)
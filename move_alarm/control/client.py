@@ -0,0 +1,104 @@
+import json, socket, subprocess, sys, time
+import move_alarm.datatypes as datatype
+from move_alarm.control.protocol import (
+    control_address,
+    encode_message,
+    read_message,
+    log_path,
+    ALREADY_RUNNING_EXIT_CODE,
+)
+
+
+def connect(
+    address: datatype.ControlAddress, timeout: float
+) -> tuple[socket.socket, str | None]:
+    if not address.use_tcp:
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        client.settimeout(timeout)
+        try:
+            client.connect(address.path)
+        except BaseException:
+            client.close()
+            raise
+        return client, None
+
+    with open(address.path) as file:
+        details = json.load(file)
+
+    client = socket.create_connection(
+        ("127.0.0.1", int(details["port"])), timeout=timeout
+    )
+    return client, str(details["token"])
+
+
+def send_command(
+    command: str,
+    args: list[str] | None = None,
+    address: datatype.ControlAddress | None = None,
+    timeout: float = 5.0,
+) -> datatype.ControlResponseDict:
+    address = address if address is not None else control_address()
+
+    try:
+        client, token = connect(address, timeout)
+    except (FileNotFoundError, ConnectionRefusedError) as error:
+        raise datatype.DaemonNotRunningError(
+            f"MoveAlarm isn't running at {address.path}"
+        ) from error
+
+    request = datatype.ControlRequestDict(
+        command=command, args=args if args is not None else []
+    )
+    if token is not None:
+        request["token"] = token
+
+    with client, client.makefile("rb") as stream:
+        client.sendall(encode_message(request))
+        response = read_message(stream)
+
+    return datatype.ControlResponseDict(
+        ok=bool(response.get("ok")),
+        message=str(response.get("message", "")),
+        data=response.get("data") or {},
+    )
+
+
+def is_daemon_running(address: datatype.ControlAddress | None = None) -> bool:
+    try:
+        return send_command("ping", address=address, timeout=1.0)["ok"]
+    except (datatype.DaemonNotRunningError, OSError, ValueError):
+        return False
+
+
+def spawn_daemon(
+    address: datatype.ControlAddress | None = None,
+) -> subprocess.Popen[bytes]:
+    address = address if address is not None else control_address()
+
+    with open(log_path(address), "ab") as log:
+        return subprocess.Popen(
+            [sys.executable, "-m", "move_alarm.app", "daemon"],
+            stdin=subprocess.DEVNULL,
+            stdout=log,
+            stderr=log,
+            start_new_session=True,
+        )
+
+
+def wait_for_daemon(
+    address: datatype.ControlAddress | None = None,
+    timeout: float = 10.0,
+    process: subprocess.Popen[bytes] | None = None,
+) -> bool:
+    deadline = time.monotonic() + timeout
+
+    while time.monotonic() < deadline:
+        if is_daemon_running(address):
+            return True
+        # Losing a race to another launch is fine, that one answers instead
+        exit_code = None if process is None else process.poll()
+        if exit_code is not None and exit_code != ALREADY_RUNNING_EXIT_CODE:
+            return False
+        time.sleep(0.05)
+
+    return False
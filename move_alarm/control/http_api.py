@@ -0,0 +1,154 @@
+import ipaddress, json, re, socket, threading
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+from move_alarm.components.service import AlarmService
+import move_alarm.datatypes as datatype
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+MAX_BODY_SIZE = 64 * 1024
+
+ROUTE = re.compile(r"/users/([^/]+)/(alarm|alarm/snooze|config)")
+
+
+class ServiceRequestHandler(BaseHTTPRequestHandler):
+    server: "ServiceHTTPServer"
+    # Keep-alive, so a client sends many requests over one connection, which
+    # without Nagle off waits on a delayed ACK between headers and body
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def send_json(self, status: HTTPStatus, body: Any) -> None:
+        data = json.dumps(body).encode("utf-8")
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        if self.close_connection:
+            self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_error_json(self, status: HTTPStatus, message: str) -> None:
+        self.send_json(status, {"error": message})
+
+    def read_json(self) -> Any:
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+        except ValueError:
+            length = -1
+
+        if length < 0 or length > MAX_BODY_SIZE:
+            # The body is left unread, so the next request can't be found in it
+            self.close_connection = True
+            raise ValueError(
+                f"A Content-Length of at most {MAX_BODY_SIZE} bytes required"
+            )
+        if length == 0:
+            return {}
+
+        try:
+            return json.loads(self.rfile.read(length))
+        except json.JSONDecodeError as error:
+            raise ValueError(f"Invalid JSON: {error}") from None
+
+    def route(self, method: str) -> None:
+        service = self.server.service
+        path = self.path.split("?", 1)[0].rstrip("/")
+
+        if path == "/health":
+            if method != "GET":
+                self.send_error_json(HTTPStatus.METHOD_NOT_ALLOWED, "Use GET")
+                return
+            self.send_json(
+                HTTPStatus.OK,
+                {"users": service.user_count, "scheduled": len(service.scheduler)},
+            )
+            return
+
+        match = ROUTE.fullmatch(path)
+        if match is None:
+            self.send_error_json(HTTPStatus.NOT_FOUND, f"No route for {path}")
+            return
+
+        user, resource = match.groups()
+        handlers = {
+            ("alarm", "GET"): lambda: service.status(user),
+            ("alarm", "PUT"): lambda: service.set_alarm(user),
+            ("alarm", "DELETE"): lambda: {"removed": service.remove_alarm(user)},
+            ("alarm/snooze", "POST"): lambda: service.snooze_alarm(user),
+            ("config", "GET"): lambda: service.get_config(user),
+            ("config", "PATCH"): lambda: service.update_config(user, self.read_json()),
+        }
+
+        handler = handlers.get((resource, method))
+        if handler is None:
+            self.send_error_json(HTTPStatus.METHOD_NOT_ALLOWED, f"{method} {path}")
+            return
+
+        try:
+            body = handler()
+        except datatype.AlarmNotSetError as error:
+            self.send_error_json(HTTPStatus.CONFLICT, str(error))
+        except (ValueError, TypeError) as error:
+            self.send_error_json(HTTPStatus.BAD_REQUEST, str(error))
+        except Exception as error:
+            self.send_error_json(
+                HTTPStatus.INTERNAL_SERVER_ERROR, f"{type(error).__name__}: {error}"
+            )
+        else:
+            self.send_json(HTTPStatus.OK, body)
+
+    def do_GET(self) -> None:
+        self.route("GET")
+
+    def do_PUT(self) -> None:
+        self.route("PUT")
+
+    def do_POST(self) -> None:
+        self.route("POST")
+
+    def do_DELETE(self) -> None:
+        self.route("DELETE")
+
+    def do_PATCH(self) -> None:
+        self.route("PATCH")
+
+
+def is_loopback(host: str) -> bool:
+    try:
+        addresses = socket.getaddrinfo(host, None, socket.AF_INET)
+    except OSError:
+        return False
+
+    return all(ipaddress.ip_address(address[4][0]).is_loopback for address in addresses)
+
+
+class ServiceHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, service: AlarmService, host: str, port: int) -> None:
+        # Nobody is asked who they are, so only this machine may ask
+        if not is_loopback(host):
+            raise ValueError(
+                f"The service only listens on loopback addresses, not {host!r}"
+            )
+
+        self.service = service
+        super().__init__((host, port), ServiceRequestHandler)
+
+
+def start_http_api(
+    service: AlarmService, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT
+) -> tuple[ServiceHTTPServer, threading.Thread]:
+    server = ServiceHTTPServer(service, host, port)
+
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.name = "MoveHTTP"
+    thread.start()
+
+    return server, thread
@@ -0,0 +1,78 @@
+import getpass, io, json, os, socket, stat, tempfile
+from typing import Any
+import move_alarm.datatypes as datatype
+
+# One JSON object per line each way, anything longer is not from a client
+MAX_MESSAGE_SIZE = 64 * 1024
+HAS_UNIX_SOCKETS = hasattr(socket, "AF_UNIX")
+# A daemon exits with this when another instance holds the lock
+ALREADY_RUNNING_EXIT_CODE = 3
+
+
+def runtime_directory() -> str:
+    if os.environ.get("XDG_RUNTIME_DIR"):
+        return os.environ["XDG_RUNTIME_DIR"]
+
+    # The temp directory is shared, anyone could claim a name in it first
+    directory = os.path.join(tempfile.gettempdir(), f"move-alarm-{user_id()}")
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+
+    if hasattr(os, "getuid"):
+        status = os.lstat(directory)
+        if (
+            not stat.S_ISDIR(status.st_mode)
+            or status.st_uid != os.getuid()
+            or status.st_mode & 0o077
+        ):
+            raise PermissionError(
+                f"{directory} must be a directory that only you can access"
+            )
+
+    return directory
+
+
+def user_id() -> str:
+    return str(os.getuid()) if hasattr(os, "getuid") else getpass.getuser()
+
+
+def control_address() -> datatype.ControlAddress:
+    # Per user, so people sharing a machine each control their own alarm
+    name = os.path.join(runtime_directory(), f"move-alarm-{user_id()}")
+
+    if HAS_UNIX_SOCKETS:
+        return datatype.ControlAddress(name + ".sock")
+    return datatype.ControlAddress(name + ".port", use_tcp=True)
+
+
+def log_path(address: datatype.ControlAddress) -> str:
+    return os.path.splitext(address.path)[0] + ".log"
+
+
+def lock_path(address: datatype.ControlAddress) -> str:
+    return os.path.splitext(address.path)[0] + ".lock"
+
+
+def encode_message(message: Any) -> bytes:
+    return json.dumps(message, separators=(",", ":")).encode() + b"\n"
+
+
+def read_message(stream: io.BufferedIOBase) -> dict[str, Any]:
+    line = stream.readline(MAX_MESSAGE_SIZE + 1)
+
+    if len(line) > MAX_MESSAGE_SIZE or not line.endswith(b"\n"):
+        raise ValueError("Control message was too long or cut short")
+
+    message = json.loads(line)
+
+    if not isinstance(message, dict):
+        raise ValueError(f"Control message must be a JSON object: {message!r}")
+
+    return message
+
+
+def make_response(
+    ok: bool, message: str, data: dict[str, Any] | None = None
+) -> datatype.ControlResponseDict:
+    return datatype.ControlResponseDict(
+        ok=ok, message=message, data=data if data is not None else {}
+    )
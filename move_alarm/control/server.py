@@ -0,0 +1,139 @@
+import hmac, json, os, secrets, socket, socketserver, threading
+from collections.abc import Callable
+from move_alarm.utils.atomic_file import write_atomic
+from move_alarm.control.protocol import encode_message, read_message, make_response
+import move_alarm.datatypes as datatype
+
+Handler = Callable[[str, list[str]], datatype.ControlResponseDict]
+
+
+class ControlRequestHandler(socketserver.StreamRequestHandler):
+    server: "UnixControlServer | TCPControlServer"
+    # Seconds to wait for the request, a silent client can't hold a thread forever
+    timeout = 5.0
+
+    def handle(self) -> None:
+        try:
+            request = read_message(self.rfile)
+        except TimeoutError:
+            return
+        except ValueError as error:
+            self.wfile.write(encode_message(make_response(False, str(error))))
+            return
+
+        token = self.server.token
+        if token is not None and not hmac.compare_digest(
+            str(request.get("token", "")), token
+        ):
+            self.wfile.write(encode_message(make_response(False, "Not authorised")))
+            return
+
+        command = request.get("command")
+        args = request.get("args", [])
+        if not isinstance(command, str) or not isinstance(args, list):
+            response = make_response(False, "A command and a list of args required")
+        else:
+            response = self.server.dispatch(command, [str(arg) for arg in args])
+
+        self.wfile.write(encode_message(response))
+
+
+if hasattr(socketserver, "ThreadingUnixStreamServer"):
+
+    class UnixControlServer(socketserver.ThreadingUnixStreamServer):
+        daemon_threads = True
+        token: str | None = None
+        dispatch: Handler
+
+else:
+    UnixControlServer = None  # type: ignore[assignment, misc]
+
+
+class TCPControlServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    token: str | None = None
+    dispatch: Handler
+
+
+class ControlServer:
+
+    @property
+    def address(self) -> datatype.ControlAddress:
+        return self._address
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def __init__(self, handle: Handler, address: datatype.ControlAddress) -> None:
+        self._handle = handle
+        self._address = address
+        self._server: socketserver.BaseServer | None = None
+        self._thread: threading.Thread | None = None
+
+    def dispatch(self, command: str, args: list[str]) -> datatype.ControlResponseDict:
+        try:
+            return self._handle(command, args)
+        except Exception as error:
+            return make_response(False, f"{type(error).__name__}: {error}")
+
+    def bind(self) -> socketserver.BaseServer:
+        if not self.address.use_tcp:
+            remove_stale_socket(self.address.path)
+            server: socketserver.BaseServer = UnixControlServer(
+                self.address.path, ControlRequestHandler
+            )
+            # Only this user may send commands to their alarm
+            os.chmod(self.address.path, 0o600)
+        else:
+            tcp = TCPControlServer(("127.0.0.1", 0), ControlRequestHandler)
+            tcp.token = secrets.token_urlsafe(32)
+            details = {"port": tcp.server_address[1], "token": tcp.token}
+            write_atomic(self.address.path, json.dumps(details), permissions=0o600)
+            server = tcp
+
+        setattr(server, "dispatch", self.dispatch)
+        return server
+
+    def start(self) -> None:
+        if self.is_running:
+            return
+
+        self._server = self.bind()
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, kwargs={"poll_interval": 0.1}
+        )
+        self._thread.name = "MoveControl"
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._server is None:
+            return
+
+        self._server.shutdown()
+        self._server.server_close()
+        self._server = None
+
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+
+        if os.path.exists(self.address.path):
+            os.remove(self.address.path)
+
+
+def remove_stale_socket(path: str) -> None:
+    if not os.path.exists(path):
+        return
+
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except ConnectionRefusedError:
+        # Left behind by a daemon that didn't shut down cleanly
+        os.remove(path)
+        return
+    finally:
+        probe.close()
+
+    raise datatype.DaemonAlreadyRunningError(f"MoveAlarm is already running at {path}")
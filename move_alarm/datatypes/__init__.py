@@ -2,14 +2,36 @@ from move_alarm.datatypes.config import (
     Config,
     IniFormattedAlarm,
     IniFormattedSounds,
+    IniFormattedFilters,
     IniFormattedConfig,
+    ConfigCodec,
+    ConfigKey,
+    ConfigSetting,
 )
 from move_alarm.datatypes.sounds import (
     Sounds,
     SoundResult,
+    PreparedSound,
+    WavFormat,
+    SoundFilters,
+    SoundMetadataDict,
     SoundListResponse,
     SoundResultDict,
+    InvalidSoundError,
 )
-from move_alarm.datatypes.alarm import AlarmNotSetError
+from move_alarm.datatypes.alarm import AlarmNotSetError, AlarmStatusDict
 from move_alarm.datatypes.oauth import OauthObject
 from move_alarm.datatypes.contexts import Contexts
+from move_alarm.datatypes.circuit_breaker import CircuitOpenError
+from move_alarm.datatypes.bandwidth import (
+    BandwidthUsage,
+    BandwidthStateDict,
+    BandwidthBudgetError,
+)
+from move_alarm.datatypes.control import (
+    ControlAddress,
+    ControlRequestDict,
+    ControlResponseDict,
+    DaemonNotRunningError,
+    DaemonAlreadyRunningError,
+)
@@ -1,3 +1,15 @@
+from typing import TypedDict
+
+
 class AlarmNotSetError(ProcessLookupError):
     def __init__(self, message):
         super().__init__(message)
+
+
+class AlarmStatusDict(TypedDict):
+    user: str
+    set: bool
+    time: str | None
+    ringing: bool
+    sound: str | None
+    message: str
@@ -0,0 +1,31 @@
+from dataclasses import dataclass
+from typing import TypedDict
+
+
+class BandwidthStateDict(TypedDict):
+    day: str
+    used: int
+
+
+@dataclass
+class BandwidthUsage:
+    day: str
+    used: int
+    budget: int
+
+    @property
+    def remaining(self) -> int | None:
+        # A budget of 0 means downloads are not limited
+        if self.budget <= 0:
+            return None
+        return max(0, self.budget - self.used)
+
+    @property
+    def exhausted(self) -> bool:
+        return self.remaining == 0
+
+
+# Not a ConnectionError, a spent budget says nothing about Freesound being down
+class BandwidthBudgetError(RuntimeError):
+    def __init__(self, message):
+        super().__init__(message)
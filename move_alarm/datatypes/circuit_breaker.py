@@ -0,0 +1,3 @@
+class CircuitOpenError(ConnectionError):
+    def __init__(self, message):
+        super().__init__(message)
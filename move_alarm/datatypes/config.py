@@ -1,5 +1,8 @@
-from dataclasses import dataclass
+from collections.abc import Callable
+from typing import Any
+from dataclasses import dataclass, field
 from datetime import timedelta
+from move_alarm.datatypes.sounds import SoundFilters
 
 
 @dataclass
@@ -10,6 +13,23 @@ class Config:
     wav_directory: str
     api_enabled: bool
     sound_themes: list[str]
+    prefetch_count: int = 0
+    search_per_theme: bool = False
+    stream_playback: bool = False
+    daily_download_limit: int = 0
+    background_download_rate: int = 0
+    login_callback_port: int = 0
+    acquire_deadline: timedelta = timedelta(seconds=3)
+    sound_filters: SoundFilters = field(default_factory=SoundFilters)
+
+    def on_change(self, listener: Callable[[set[str]], None]) -> None:
+        pass
+
+    def remove_listener(self, listener: Callable[[set[str]], None]) -> None:
+        pass
+
+    def reload_if_changed(self) -> bool:
+        return False
 
 
 class IniFormattedAlarm(dict[str, int | str]):
@@ -18,12 +38,57 @@ class IniFormattedAlarm(dict[str, int | str]):
     message: str
 
 
-class IniFormattedSounds(dict[str, str | bool | list[str]]):
+class IniFormattedSounds(dict[str, str | bool | int | list[str]]):
     path: str
     freesound: bool
     themes: list[str]
+    prefetch: int
+    per_theme_search: bool
+    stream: bool
+    daily_limit: int
+    background_rate: int
+    callback_port: int
+    deadline: int
 
 
-class IniFormattedConfig(dict[str, IniFormattedAlarm | IniFormattedSounds]):
+class IniFormattedFilters(dict[str, int]):
+    samplerate: int
+    bitdepth: int
+    channels: int
+    filesize: int
+
+
+class IniFormattedConfig(
+    dict[str, IniFormattedAlarm | IniFormattedSounds | IniFormattedFilters]
+):
     Alarm: IniFormattedAlarm
     Sounds: IniFormattedSounds
+    Filters: IniFormattedFilters
+
+
+@dataclass(frozen=True)
+class ConfigCodec:
+    from_ini: Callable[[str], Any]
+    to_ini: Callable[[Any], str]
+    from_json: Callable[[Any], Any]
+    to_json: Callable[[Any], Any]
+
+
+@dataclass(frozen=True)
+class ConfigKey:
+    section: str
+    key: str
+    codec: ConfigCodec
+    required: bool = False
+    # Set when the key holds one field of a dataclass setting
+    member: str | None = None
+
+
+@dataclass(frozen=True)
+class ConfigSetting:
+    name: str
+    keys: tuple[ConfigKey, ...]
+    default: Callable[[], Any]
+    check: Callable[[Any], bool]
+    requirement: str
+    error: type[Exception] = TypeError
@@ -0,0 +1,31 @@
+from dataclasses import dataclass
+from typing import Any, TypedDict
+
+
+@dataclass
+class ControlAddress:
+    # The Unix socket, or with use_tcp the file holding the TCP port and token
+    path: str
+    use_tcp: bool = False
+
+
+class ControlRequestDict(TypedDict, total=False):
+    command: str
+    args: list[str]
+    token: str
+
+
+class ControlResponseDict(TypedDict):
+    ok: bool
+    message: str
+    data: dict[str, Any]
+
+
+class DaemonNotRunningError(ConnectionError):
+    def __init__(self, message):
+        super().__init__(message)
+
+
+class DaemonAlreadyRunningError(FileExistsError):
+    def __init__(self, message):
+        super().__init__(message)
@@ -1,3 +1,12 @@
 class OauthObject:
     def get_token(self) -> str | None:
         return None
+
+    def invalidate_token(self) -> None:
+        pass
+
+    def start_background_refresh(self) -> None:
+        pass
+
+    def stop_background_refresh(self) -> None:
+        pass
@@ -1,5 +1,5 @@
 from dataclasses import dataclass
-from typing import TypedDict
+from typing import Any, TypedDict
 
 
 class Sounds:
@@ -24,7 +24,65 @@ class SoundResult:
     license: str
 
 
-class SoundResultDict(TypedDict):
+@dataclass
+class PreparedSound:
+    path: str
+    wave_object: Any
+    result: SoundResult | None = None
+
+
+@dataclass
+class WavFormat:
+    channels: int
+    sample_width: int
+    sample_rate: int
+
+    @property
+    def block_align(self) -> int:
+        return self.channels * self.sample_width
+
+    @property
+    def bytes_per_second(self) -> int:
+        return self.block_align * self.sample_rate
+
+
+@dataclass
+class SoundFilters:
+    max_samplerate: int = 48000
+    max_bitdepth: int = 16
+    max_channels: int = 2
+    max_filesize: int = 20 * 1024 * 1024
+
+    def to_query(self) -> list[str]:
+        # A limit of 0 means that property is not filtered on
+        limits = {
+            "samplerate": self.max_samplerate,
+            "bitdepth": self.max_bitdepth,
+            "channels": self.max_channels,
+            "filesize": self.max_filesize,
+        }
+        return [f"{key}:[* TO {limit}]" for key, limit in limits.items() if limit > 0]
+
+    def allows(self, sound: "SoundMetadataDict") -> bool:
+        checks = [
+            (sound.get("samplerate"), self.max_samplerate),
+            (sound.get("bitdepth"), self.max_bitdepth),
+            (sound.get("channels"), self.max_channels),
+            (sound.get("filesize"), self.max_filesize),
+        ]
+        return all(
+            value is None or limit <= 0 or value <= limit for value, limit in checks
+        )
+
+
+class SoundMetadataDict(TypedDict, total=False):
+    samplerate: float
+    bitdepth: int
+    channels: int
+    filesize: int
+
+
+class SoundResultDict(SoundMetadataDict):
     id: int
     url: str
     name: str
@@ -38,3 +96,8 @@ class SoundListResponse(TypedDict):
     previous: str | None
     next: str | None
     results: list[SoundResultDict]
+
+
+class InvalidSoundError(ValueError):
+    def __init__(self, message):
+        super().__init__(message)
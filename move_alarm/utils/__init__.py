@@ -1,9 +1,42 @@
+import importlib
+from move_alarm.utils.file_lock import FileLock
+from move_alarm.utils.rate_limit import TokenBucket, request_with_backoff
+from move_alarm.utils.circuit_breaker import CircuitBreaker
+from move_alarm.utils.bandwidth import BandwidthBudget, download_budget, make_throttle
 from move_alarm.utils.oauth import HandleAuthorisation
 from move_alarm.utils.config import Configuration
 from move_alarm.utils.api_calls import (
     open_browser_to_api_auth,
     get_api_token,
     search_for_sounds,
+    search_for_sounds_by_theme,
     download_sound,
+    freesound_breaker,
+    token_breaker,
 )
-from move_alarm.utils.helpers import get_auth_token
+from move_alarm.utils.helpers import (
+    get_auth_token,
+    get_api_status,
+    is_api_offline,
+    get_download_budget,
+    get_download_usage,
+    is_download_budget_exhausted,
+)
+from move_alarm.utils.prefetch import SoundPrefetcher
+from move_alarm.utils.streaming import StreamingPlayback
+from move_alarm.utils.scheduler import AlarmScheduler
+from move_alarm.utils.sound_library import SoundLibrary
+from move_alarm.utils.sound_cache import FreesoundCache
+from move_alarm.utils.lazy_import import LazyModule, LazyAttribute, lazy_import
+
+
+def __getattr__(name: str):
+    # asyncio and http.server are only loaded by callers that need them
+    if name == "async_api_calls":
+        return importlib.import_module("move_alarm.utils.async_api_calls")
+    if name == "OAuthCallbackServer":
+        return importlib.import_module(
+            "move_alarm.utils.oauth_callback"
+        ).OAuthCallbackServer
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
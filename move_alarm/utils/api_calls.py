@@ -1,51 +1,503 @@
-import webbrowser, requests
+from __future__ import annotations
+import os, re, threading, time
+from collections.abc import Callable
+from urllib.parse import quote
+from typing import TYPE_CHECKING
+from move_alarm.utils.rate_limit import (
+    TokenBucket,
+    freesound_bucket,
+    token_bucket,
+    request_with_backoff,
+    back_off,
+)
+from move_alarm.utils.bandwidth import BandwidthBudget
+from move_alarm.utils.circuit_breaker import CircuitBreaker
+from move_alarm.utils.integrity import SoundVerifier
+from move_alarm.utils.lazy_import import lazy_import
 import move_alarm.datatypes as datatype
 
+# mypy needs the real module for annotations, at runtime it loads on first use
+if TYPE_CHECKING:
+    import requests
+else:
+    requests = lazy_import("requests")
+webbrowser = lazy_import("webbrowser")
+concurrent_futures = lazy_import("concurrent.futures")
 
-def open_browser_to_api_auth(client_id: str, state: str | None = "") -> None:
+FREESOUND_API_URL = "https://freesound.org/apiv2"
+TOKEN_URL = "https://devdolphin7.netlify.app/.netlify/functions/move-alarm"
+
+# (connect, read) seconds, so a stalled connection can never hang the alarm
+REQUEST_TIMEOUT = (3.05, 10.0)
+
+PARALLEL_DOWNLOAD_THRESHOLD = 50 * 1024 * 1024
+PARALLEL_DOWNLOAD_WORKERS = 4
+MIN_RANGE_SIZE = 256 * 1024
+MAX_RANGE_SIZE = 16 * 1024 * 1024
+TARGET_RANGE_SECONDS = 1.0
+# Idle connections kept for reuse by concurrent searches and downloads
+SESSION_POOL_SIZE = 64
+
+_session: requests.Session | None = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    global _session
+
+    with _session_lock:
+        if _session is None:
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=4, pool_maxsize=SESSION_POOL_SIZE
+            )
+            _session = requests.Session()
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+
+        return _session
+
+
+def open_browser_to_api_auth(
+    client_id: str, state: str | None = "", redirect_uri: str | None = None
+) -> None:
     url = (
-        "https://freesound.org/apiv2/oauth2/authorize/?"
+        f"{FREESOUND_API_URL}/oauth2/authorize/?"
         + f"client_id={client_id}&response_type=code&state={state}"
     )
+    if redirect_uri is not None:
+        url += f"&redirect_uri={quote(redirect_uri, safe='')}"
     webbrowser.open(url)
 
 
-def get_api_token(url: str) -> requests.Response:
-    return requests.get(url)
+def probe_url(url: str) -> bool:
+    response = requests.head(url, timeout=REQUEST_TIMEOUT)
+    return response.status_code < 500
 
 
-def search_for_sounds(
-    token: str, themes: list[str] = []
-) -> list[datatype.SoundResultDict]:
-    url: str = (
-        "https://freesound.org/apiv2/search/text/?"
-        + "filter=(duration:[30%20TO%20210]%20AND%20type:wav)"
+freesound_breaker = CircuitBreaker(
+    "Freesound", probe=lambda: probe_url(f"{FREESOUND_API_URL}/")
+)
+token_breaker = CircuitBreaker("Freesound login", probe=lambda: probe_url(TOKEN_URL))
+
+
+def get_api_token(url: str) -> requests.Response:
+    return request_with_backoff(
+        lambda: requests.get(url, timeout=REQUEST_TIMEOUT), token_bucket
     )
 
-    if len(themes) > 0:
-        url = url[:-1] + "%20AND%20description:("
 
-        url += "%20OR%20".join([theme for theme in themes]) + "))"
+def search_url(themes: list[str], filters: datatype.SoundFilters | None = None) -> str:
+    clauses = ["duration:[30 TO 210]", "type:wav"]
+
+    if filters is not None:
+        clauses += filters.to_query()
 
-    url += "&fields=id,url,name,description,download,license"
+    if len(themes) > 0:
+        clauses.append("description:(" + " OR ".join(themes) + ")")
+
+    return (
+        f"{FREESOUND_API_URL}/search/text/?"
+        + "filter=("
+        + " AND ".join(clauses).replace(" ", "%20")
+        + ")"
+        + "&fields=id,url,name,description,download,license,"
+        + "samplerate,bitdepth,channels,filesize"
+    )
 
-    response = requests.get(url, headers={"Authorization": f"Bearer {token}"})
 
+def read_search_results(
+    response: requests.Response,
+) -> list[datatype.SoundResultDict]:
     if response.status_code == 200:
         result: datatype.SoundListResponse = response.json()
         return result["results"]
 
+    if response.status_code < 500:
+        # Freesound is up but refused this search, e.g. an expired token
+        raise ConnectionRefusedError(response.text)
+
     raise ConnectionError(response.text)
 
 
-def download_sound(token: str, url: str, new_path: str) -> bool:
-    with requests.get(
-        url, headers={"Authorization": f"Bearer {token}"}, stream=True
-    ) as response:
+@freesound_breaker.protect
+def search_for_sounds(
+    token: str,
+    themes: list[str] = [],
+    session: requests.Session | None = None,
+    filters: datatype.SoundFilters | None = None,
+) -> list[datatype.SoundResultDict]:
+    url = search_url(themes, filters)
+
+    get = requests.get if session is None else session.get
+
+    response = request_with_backoff(
+        lambda: get(
+            url,
+            headers={"Authorization": f"Bearer {token}"},
+            timeout=REQUEST_TIMEOUT,
+        ),
+        freesound_bucket,
+    )
+
+    return read_search_results(response)
+
+
+def search_for_sounds_by_theme(
+    token: str, themes: list[str], filters: datatype.SoundFilters | None = None
+) -> list[datatype.SoundResultDict]:
+    if len(themes) < 2:
+        return search_for_sounds(token, themes=themes, filters=filters)
+
+    session = get_session()
+
+    with concurrent_futures.ThreadPoolExecutor(max_workers=len(themes)) as executor:
+        futures = [
+            executor.submit(search_for_sounds, token, [theme], session, filters)
+            for theme in themes
+        ]
+
+    theme_results: list[list[datatype.SoundResultDict]] = []
+    errors: list[BaseException] = []
+
+    for future in futures:
+        error = future.exception()
+        if error is None:
+            theme_results.append(future.result())
+        else:
+            errors.append(error)
+
+    if len(theme_results) == 0:
+        raise errors[0]
+
+    return merge_theme_results(theme_results)
+
+
+def merge_theme_results(
+    theme_results: list[list[datatype.SoundResultDict]],
+) -> list[datatype.SoundResultDict]:
+    # A sound several themes found counts once, for the first of them
+    seen: set[int] = set()
+    unique_results: list[list[datatype.SoundResultDict]] = []
+
+    for results in theme_results:
+        unique: list[datatype.SoundResultDict] = []
+        for result in results:
+            if int(result["id"]) not in seen:
+                seen.add(int(result["id"]))
+                unique.append(result)
+        if len(unique) > 0:
+            unique_results.append(unique)
+
+    if len(unique_results) == 0:
+        return []
+
+    # Every theme gets an equal share, so a random pick is as likely to be any
+    # theme's, however many results the broadest one had
+    share = min(len(results) for results in unique_results)
+
+    return [results[index] for index in range(0, share) for results in unique_results]
+
+
+@freesound_breaker.protect
+def download_sound(
+    token: str,
+    url: str,
+    new_path: str,
+    attempts: int = 3,
+    parallel_threshold: int = PARALLEL_DOWNLOAD_THRESHOLD,
+    on_chunk: Callable[[int, bytes], None] | None = None,
+    budget: BandwidthBudget | None = None,
+    throttle: TokenBucket | None = None,
+    session: requests.Session | None = None,
+) -> str:
+    # Only the verified, complete file is ever moved to new_path
+    temp_path = new_path + ".part"
+    verifier = SoundVerifier(url)
+
+    if budget is not None:
+        budget.check()
+
+    try:
+        for attempt in range(1, attempts + 1):
+            try:
+                complete = resume_download(
+                    token,
+                    url,
+                    temp_path,
+                    parallel_threshold,
+                    attempt,
+                    verifier,
+                    on_chunk,
+                    budget,
+                    throttle,
+                    session,
+                )
+                if complete:
+                    digest = verifier.finish()
+            except datatype.InvalidSoundError:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+            except (
+                requests.exceptions.ConnectionError,
+                requests.exceptions.Timeout,
+                requests.exceptions.ChunkedEncodingError,
+            ):
+                if attempt == attempts:
+                    raise
+                continue
+
+            if complete:
+                os.replace(temp_path, new_path)
+                return digest
+    finally:
+        # The part file is kept when the budget runs out, so it can resume later
+        if budget is not None:
+            budget.flush()
+
+    raise ConnectionError(f"Download incomplete after {attempts} attempts: {url}")
+
+
+def resume_download(
+    token: str,
+    url: str,
+    temp_path: str,
+    parallel_threshold: int = PARALLEL_DOWNLOAD_THRESHOLD,
+    attempt: int = 0,
+    verifier: SoundVerifier | None = None,
+    on_chunk: Callable[[int, bytes], None] | None = None,
+    budget: BandwidthBudget | None = None,
+    throttle: TokenBucket | None = None,
+    session: requests.Session | None = None,
+) -> bool:
+    received = os.path.getsize(temp_path) if os.path.exists(temp_path) else 0
+
+    if verifier is None:
+        verifier = SoundVerifier(url)
+
+    if verifier.size != received:
+        # A part file left by an earlier run, hash what is already on disk
+        verifier.reset()
+        if received > 0:
+            verifier.update_from_file(temp_path)
+
+    headers = {"Authorization": f"Bearer {token}"}
+    if received > 0:
+        headers["Range"] = f"bytes={received}-"
+
+    freesound_bucket.acquire()
+
+    get = requests.get if session is None else session.get
+
+    with get(url, headers=headers, stream=True, timeout=REQUEST_TIMEOUT) as response:
+        if response.status_code in (429, 503):
+            back_off(response, freesound_bucket, attempt)
+            return False
+
+        if response.status_code == 416:
+            # The partial file is no use to the server, start again
+            os.remove(temp_path)
+            return False
+
         response.raise_for_status()
 
-        with open(new_path, "wb") as f:
-            for chunk in response.iter_content(chunk_size=8192):
+        content_type = response.headers.get("Content-Type", "")
+        if content_type.startswith(("text/", "application/json")):
+            raise datatype.InvalidSoundError(
+                f"Expected a WAV file but the server sent {content_type}: {url}"
+            )
+
+        expected_size = get_expected_size(response, received)
+
+        if budget is not None and expected_size is not None:
+            # Refuse before any bytes are spent on a file that cannot finish
+            budget.check(
+                expected_size - (received if response.status_code == 206 else 0)
+            )
+
+        # Ranges arrive out of order, which a streaming listener cannot use,
+        # and parallel connections would get around the throttle
+        if (
+            response.status_code == 200
+            and on_chunk is None
+            and throttle is None
+            and expected_size is not None
+            and expected_size >= parallel_threshold
+            and response.headers.get("Accept-Ranges") == "bytes"
+        ):
+            download_url = response.url
+            response.close()
+            complete = download_sound_parallel(
+                token, download_url, temp_path, expected_size
+            )
+            if budget is not None:
+                budget.consume(expected_size)
+            # Ranges land out of order, so the hash needs the finished file
+            verifier.reset()
+            verifier.update_from_file(temp_path)
+            return complete
+
+        if response.status_code != 206:
+            received = 0
+            verifier.reset()
+
+        with open(temp_path, "ab" if received > 0 else "wb") as f:
+            for chunk in response.iter_content(chunk_size=65536):
+                if throttle is not None:
+                    throttle.acquire(len(chunk))
+                if budget is not None:
+                    budget.consume(len(chunk))
+
+                verifier.update(chunk)
                 f.write(chunk)
 
+                if on_chunk is not None:
+                    on_chunk(received, chunk)
+                received += len(chunk)
+
+    if expected_size is None:
+        return True
+
+    size = os.path.getsize(temp_path)
+
+    if size > expected_size:
+        os.remove(temp_path)
+        raise ValueError(
+            f"Downloaded {size} bytes but expected {expected_size}: {temp_path}"
+        )
+
+    return size == expected_size
+
+
+def get_expected_size(response: requests.Response, received: int) -> int | None:
+    if response.status_code == 206:
+        content_range = response.headers.get("Content-Range", "")
+        match = re.fullmatch(r"bytes (\d+)-\d+/(\d+|\*)", content_range)
+
+        if match is None or int(match.group(1)) != received:
+            raise ValueError(f"Unexpected Content-Range: {content_range}")
+
+        if match.group(2) != "*":
+            return int(match.group(2))
+
+    content_length = response.headers.get("Content-Length")
+    if content_length is None:
+        return None
+
+    return int(content_length) + (received if response.status_code == 206 else 0)
+
+
+def download_sound_parallel(
+    token: str,
+    url: str,
+    temp_path: str,
+    size: int,
+    workers: int = PARALLEL_DOWNLOAD_WORKERS,
+) -> bool:
+    with open(temp_path, "wb") as f:
+        f.truncate(size)
+
+    lock = threading.Lock()
+    next_offset = 0
+    range_size = max(MIN_RANGE_SIZE, min(MAX_RANGE_SIZE, size // (workers * 8)))
+
+    def claim_range(last_seconds: float | None) -> tuple[int, int] | None:
+        nonlocal next_offset, range_size
+
+        with lock:
+            if last_seconds is not None and last_seconds > 0:
+                # Aim for ranges that take about TARGET_RANGE_SECONDS to fetch
+                scaled = int(range_size * TARGET_RANGE_SECONDS / last_seconds)
+                range_size = max(MIN_RANGE_SIZE, min(MAX_RANGE_SIZE, scaled))
+
+            if next_offset >= size:
+                return None
+
+            start = next_offset
+            next_offset = min(start + range_size, size)
+
+            return start, next_offset - 1
+
+    def fetch_ranges() -> int:
+        written = 0
+        last_seconds: float | None = None
+        fd = os.open(temp_path, os.O_WRONLY | getattr(os, "O_BINARY", 0))
+
+        try:
+            while (byte_range := claim_range(last_seconds)) != None:
+                started = time.monotonic()
+                written += download_range(token, url, fd, *byte_range)
+                last_seconds = time.monotonic() - started
+        finally:
+            os.close(fd)
+
+        return written
+
+    try:
+        with concurrent_futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(fetch_ranges) for _ in range(0, workers)]
+            written = sum(future.result() for future in futures)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+    if written != size:
+        os.remove(temp_path)
+        raise ValueError(f"Downloaded {written} bytes but expected {size}: {temp_path}")
+
     return True
+
+
+def download_range(
+    token: str, url: str, fd: int, start: int, end: int, attempts: int = 3
+) -> int:
+    offset = start
+
+    for attempt in range(1, attempts + 1):
+        headers = {
+            "Authorization": f"Bearer {token}",
+            "Range": f"bytes={offset}-{end}",
+        }
+
+        try:
+            with get_session().get(
+                url, headers=headers, stream=True, timeout=REQUEST_TIMEOUT
+            ) as response:
+                response.raise_for_status()
+
+                if response.status_code != 206:
+                    raise ValueError(f"Server ignored the Range request: {url}")
+
+                for chunk in response.iter_content(chunk_size=1024 * 1024):
+                    offset += write_at(fd, chunk[: end + 1 - offset], offset)
+
+            if offset == end + 1:
+                break
+        except (
+            requests.exceptions.ConnectionError,
+            requests.exceptions.Timeout,
+            requests.exceptions.ChunkedEncodingError,
+        ):
+            if attempt == attempts:
+                raise
+
+    if offset != end + 1:
+        raise ConnectionError(f"Range {start}-{end} incomplete: {url}")
+
+    return end + 1 - start
+
+
+def write_at(fd: int, data: bytes, offset: int) -> int:
+    view = memoryview(data)
+
+    while len(view) > 0:
+        if hasattr(os, "pwrite"):
+            written = os.pwrite(fd, view, offset)
+        else:
+            os.lseek(fd, offset, os.SEEK_SET)
+            written = os.write(fd, view)
+
+        view = view[written:]
+        offset += written
+
+    return len(data)
@@ -0,0 +1,265 @@
+from __future__ import annotations
+import asyncio, os, weakref
+from collections.abc import Callable
+from typing import TYPE_CHECKING
+from move_alarm.utils import api_calls, async_http, helpers
+from move_alarm.utils.bandwidth import BandwidthBudget
+from move_alarm.utils.integrity import SoundVerifier
+from move_alarm.utils.lazy_import import lazy_import
+from move_alarm.utils.rate_limit import TokenBucket, back_off
+import move_alarm.datatypes as datatype
+
+if TYPE_CHECKING:
+    import requests
+else:
+    requests = lazy_import("requests")
+
+# Each transfer holds a socket on the event loop rather than a thread, only
+# the writes to disk are offloaded, so dozens can be in flight at once
+MAX_CONCURRENCY = 64
+
+_semaphores: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore] = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def set_max_concurrency(limit: int) -> None:
+    global MAX_CONCURRENCY
+
+    if isinstance(limit, bool) or not isinstance(limit, int):
+        raise TypeError("int required for the concurrency limit")
+    if limit < 1:
+        raise ValueError("The concurrency limit must be at least 1")
+
+    # Transfers already running finish, the next ones use the new limit
+    MAX_CONCURRENCY = limit
+    _semaphores.clear()
+
+
+def get_semaphore() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+
+    if loop not in _semaphores:
+        _semaphores[loop] = asyncio.Semaphore(MAX_CONCURRENCY)
+
+    return _semaphores[loop]
+
+
+async def acquire(bucket: TokenBucket, tokens: float = 1) -> None:
+    # Waits on the loop, TokenBucket.acquire would sleep the whole thread
+    while (wait := bucket.try_acquire(tokens)) > 0:
+        await asyncio.sleep(wait)
+
+
+async def request_with_backoff(
+    url: str, headers: dict[str, str], bucket: TokenBucket, attempts: int = 4
+) -> requests.Response:
+    for attempt in range(0, attempts):
+        await acquire(bucket)
+
+        async with get_semaphore():
+            streamed = await async_http.request("GET", url, headers)
+            try:
+                response = streamed.as_response(await streamed.read())
+            finally:
+                streamed.close()
+
+        if response.status_code not in (429, 503) or attempt == attempts - 1:
+            return response
+
+        # Blocks the bucket rather than sleeping, the next acquire waits it out
+        back_off(response, bucket, attempt)
+
+    return response
+
+
+async def get_api_token(url: str) -> requests.Response:
+    return await request_with_backoff(url, {}, api_calls.token_bucket)
+
+
+async def search_for_sounds(
+    token: str,
+    themes: list[str] = [],
+    filters: datatype.SoundFilters | None = None,
+) -> list[datatype.SoundResultDict]:
+    with api_calls.freesound_breaker:
+        response = await request_with_backoff(
+            api_calls.search_url(themes, filters),
+            {"Authorization": f"Bearer {token}"},
+            api_calls.freesound_bucket,
+        )
+
+        return api_calls.read_search_results(response)
+
+
+async def search_for_sounds_by_theme(
+    token: str, themes: list[str], filters: datatype.SoundFilters | None = None
+) -> list[datatype.SoundResultDict]:
+    if len(themes) < 2:
+        return await search_for_sounds(token, themes=themes, filters=filters)
+
+    outcomes = await asyncio.gather(
+        *[search_for_sounds(token, [theme], filters) for theme in themes],
+        return_exceptions=True,
+    )
+
+    theme_results = [outcome for outcome in outcomes if isinstance(outcome, list)]
+
+    if len(theme_results) == 0:
+        error = next(
+            outcome for outcome in outcomes if isinstance(outcome, BaseException)
+        )
+        raise error
+
+    return api_calls.merge_theme_results(theme_results)
+
+
+async def download_sound(
+    token: str,
+    url: str,
+    new_path: str,
+    attempts: int = 3,
+    on_chunk: Callable[[int, bytes], None] | None = None,
+    budget: BandwidthBudget | None = None,
+    throttle: TokenBucket | None = None,
+) -> str:
+    # Only the verified, complete file is ever moved to new_path
+    temp_path = new_path + ".part"
+    verifier = SoundVerifier(url)
+
+    with api_calls.freesound_breaker:
+        if budget is not None:
+            budget.check()
+
+        try:
+            for attempt in range(1, attempts + 1):
+                try:
+                    complete = await resume_download(
+                        token,
+                        url,
+                        temp_path,
+                        attempt,
+                        verifier,
+                        on_chunk,
+                        budget,
+                        throttle,
+                    )
+                    if complete:
+                        digest = verifier.finish()
+                except datatype.InvalidSoundError:
+                    if os.path.exists(temp_path):
+                        os.remove(temp_path)
+                    raise
+                except (ConnectionError, TimeoutError):
+                    if attempt == attempts:
+                        raise
+                    continue
+
+                if complete:
+                    os.replace(temp_path, new_path)
+                    return digest
+        finally:
+            # The part file is kept when the budget runs out, so it can resume later
+            if budget is not None:
+                budget.flush()
+
+        raise ConnectionError(f"Download incomplete after {attempts} attempts: {url}")
+
+
+async def resume_download(
+    token: str,
+    url: str,
+    temp_path: str,
+    attempt: int,
+    verifier: SoundVerifier,
+    on_chunk: Callable[[int, bytes], None] | None = None,
+    budget: BandwidthBudget | None = None,
+    throttle: TokenBucket | None = None,
+) -> bool:
+    received = os.path.getsize(temp_path) if os.path.exists(temp_path) else 0
+
+    if verifier.size != received:
+        # A part file left by an earlier run, hash what is already on disk
+        verifier.reset()
+        if received > 0:
+            await asyncio.to_thread(verifier.update_from_file, temp_path)
+
+    headers = {"Authorization": f"Bearer {token}"}
+    if received > 0:
+        headers["Range"] = f"bytes={received}-"
+
+    await acquire(api_calls.freesound_bucket)
+
+    async with get_semaphore():
+        response = await async_http.request("GET", url, headers)
+
+        try:
+            if response.status_code in (429, 503):
+                back_off(response.as_response(), api_calls.freesound_bucket, attempt)
+                return False
+
+            if response.status_code == 416:
+                # The partial file is no use to the server, start again
+                os.remove(temp_path)
+                return False
+
+            response.as_response().raise_for_status()
+
+            content_type = response.headers.get("Content-Type", "")
+            if content_type.startswith(("text/", "application/json")):
+                raise datatype.InvalidSoundError(
+                    f"Expected a WAV file but the server sent {content_type}: {url}"
+                )
+
+            expected_size = api_calls.get_expected_size(
+                response.as_response(), received
+            )
+
+            if budget is not None and expected_size is not None:
+                # Refuse before any bytes are spent on a file that cannot finish
+                budget.check(
+                    expected_size - (received if response.status_code == 206 else 0)
+                )
+
+            if response.status_code != 206:
+                received = 0
+                verifier.reset()
+
+            file = await asyncio.to_thread(
+                open, temp_path, "ab" if received > 0 else "wb"
+            )
+            try:
+                async for chunk in response.iter_content(chunk_size=65536):
+                    if throttle is not None:
+                        await acquire(throttle, len(chunk))
+                    if budget is not None:
+                        budget.consume(len(chunk))
+
+                    verifier.update(chunk)
+                    await asyncio.to_thread(file.write, chunk)
+
+                    if on_chunk is not None:
+                        on_chunk(received, chunk)
+                    received += len(chunk)
+            finally:
+                await asyncio.to_thread(file.close)
+        finally:
+            response.close()
+
+    if expected_size is None:
+        return True
+
+    size = os.path.getsize(temp_path)
+
+    if size > expected_size:
+        os.remove(temp_path)
+        raise ValueError(
+            f"Downloaded {size} bytes but expected {expected_size}: {temp_path}"
+        )
+
+    return size == expected_size
+
+
+async def get_auth_token() -> str:
+    # A refresh can wait on the token lock or the user, so it gets a thread
+    return await asyncio.to_thread(helpers.get_auth_token)
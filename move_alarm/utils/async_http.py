@@ -0,0 +1,250 @@
+from __future__ import annotations
+import asyncio, ssl
+from collections.abc import AsyncIterator, Awaitable
+from typing import TYPE_CHECKING, TypeVar
+from urllib.parse import urljoin, urlsplit
+from move_alarm.utils.lazy_import import lazy_import
+
+if TYPE_CHECKING:
+    import requests
+else:
+    requests = lazy_import("requests")
+
+T = TypeVar("T")
+
+# (connect, read) seconds, the same limits as the blocking calls
+REQUEST_TIMEOUT = (3.05, 10.0)
+MAX_REDIRECTS = 5
+MAX_HEADER_LINES = 100
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+
+_ssl_context: ssl.SSLContext | None = None
+
+
+def get_ssl_context() -> ssl.SSLContext:
+    global _ssl_context
+
+    if _ssl_context is None:
+        _ssl_context = ssl.create_default_context()
+
+    return _ssl_context
+
+
+async def within(awaitable: Awaitable[T], seconds: float, message: str) -> T:
+    try:
+        return await asyncio.wait_for(awaitable, seconds)
+    except asyncio.TimeoutError:
+        raise TimeoutError(message) from None
+
+
+class AsyncResponse:
+    # One response read straight off the socket, closing it closes the connection
+
+    def __init__(
+        self,
+        url: str,
+        status_code: int,
+        reason: str,
+        headers: requests.structures.CaseInsensitiveDict[str],
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        read_timeout: float,
+        has_body: bool = True,
+    ) -> None:
+        self.url = url
+        self.status_code = status_code
+        self.reason = reason
+        self.headers = headers
+        self.read_timeout = read_timeout
+        self._reader = reader
+        self._writer = writer
+        self._has_body = has_body
+
+    async def iter_content(self, chunk_size: int = 65536) -> AsyncIterator[bytes]:
+        if not self._has_body:
+            return
+
+        if "chunked" in self.headers.get("Transfer-Encoding", "").lower():
+            async for chunk in self._iter_chunked(chunk_size):
+                yield chunk
+            return
+
+        content_length = self.headers.get("Content-Length")
+        remaining = None if content_length is None else int(content_length)
+
+        while remaining is None or remaining > 0:
+            size = chunk_size if remaining is None else min(chunk_size, remaining)
+            chunk = await self._read(self._reader.read(size))
+
+            if len(chunk) == 0:
+                if remaining is None:
+                    return
+                raise ConnectionError(
+                    f"Connection closed with {remaining} bytes left: {self.url}"
+                )
+
+            if remaining is not None:
+                remaining -= len(chunk)
+            yield chunk
+
+    async def _iter_chunked(self, chunk_size: int) -> AsyncIterator[bytes]:
+        while True:
+            line = await self._read(self._reader.readline())
+            try:
+                size = int(line.split(b";")[0].strip(), 16)
+            except ValueError:
+                raise ConnectionError(f"Invalid chunk size {line!r}: {self.url}")
+
+            if size == 0:
+                # Skip any trailers up to the blank line that ends the body
+                while (await self._read(self._reader.readline())).strip() != b"":
+                    pass
+                return
+
+            while size > 0:
+                chunk = await self._read(
+                    self._reader.readexactly(min(chunk_size, size))
+                )
+                size -= len(chunk)
+                yield chunk
+
+            await self._read(self._reader.readexactly(2))
+
+    async def _read(self, read: Awaitable[T]) -> T:
+        try:
+            return await within(
+                read, self.read_timeout, f"No data for {self.read_timeout}s: {self.url}"
+            )
+        except asyncio.IncompleteReadError:
+            raise ConnectionError(f"Connection closed mid-response: {self.url}")
+
+    async def read(self) -> bytes:
+        return b"".join([chunk async for chunk in self.iter_content()])
+
+    def as_response(self, content: bytes = b"") -> requests.Response:
+        # What the blocking calls return, so both share the same response handling
+        response = requests.Response()
+        response.url = self.url
+        response.status_code = self.status_code
+        response.reason = self.reason
+        response.headers = self.headers
+        response.encoding = requests.utils.get_encoding_from_headers(self.headers)
+        response._content = content
+        return response
+
+    def close(self) -> None:
+        self._writer.close()
+
+
+async def request(
+    method: str,
+    url: str,
+    headers: dict[str, str] = {},
+    timeout: tuple[float, float] = REQUEST_TIMEOUT,
+    max_redirects: int = MAX_REDIRECTS,
+) -> AsyncResponse:
+    for _ in range(0, max_redirects + 1):
+        response = await send(method, url, headers, timeout)
+        location = response.headers.get("Location")
+
+        if response.status_code not in REDIRECT_CODES or location is None:
+            return response
+
+        response.close()
+        next_url = urljoin(url, location)
+
+        if urlsplit(next_url).netloc != urlsplit(url).netloc:
+            # Like requests, the token is never passed on to another host
+            headers = {
+                key: value
+                for key, value in headers.items()
+                if key.lower() != "authorization"
+            }
+        if response.status_code == 303:
+            method = "GET"
+
+        url = next_url
+
+    raise ConnectionError(f"More than {max_redirects} redirects: {url}")
+
+
+async def send(
+    method: str, url: str, headers: dict[str, str], timeout: tuple[float, float]
+) -> AsyncResponse:
+    parts = urlsplit(url)
+
+    if parts.scheme not in ("http", "https") or parts.hostname is None:
+        raise ValueError(f"Unsupported URL: {url}")
+
+    secure = parts.scheme == "https"
+    port = parts.port or (443 if secure else 80)
+    connect_timeout, read_timeout = timeout
+
+    try:
+        reader, writer = await within(
+            asyncio.open_connection(
+                parts.hostname, port, ssl=get_ssl_context() if secure else None
+            ),
+            connect_timeout,
+            f"Connecting to {parts.hostname} timed out",
+        )
+    except TimeoutError:
+        raise
+    except OSError as error:
+        # ConnectionRefusedError is kept for requests the service turned down
+        raise ConnectionError(f"Could not connect to {parts.hostname}: {error}")
+
+    target = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+    lines = [
+        f"{method} {target} HTTP/1.1",
+        f"Host: {parts.netloc}",
+        "User-Agent: move-alarm",
+        "Accept-Encoding: identity",
+        "Connection: close",
+    ] + [f"{key}: {value}" for key, value in headers.items()]
+
+    try:
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+        await within(writer.drain(), read_timeout, f"Sending to {url} timed out")
+
+        status_line = await within(
+            reader.readline(), read_timeout, f"No response for {read_timeout}s: {url}"
+        )
+        try:
+            _, status, reason = (status_line.decode("latin-1").rstrip() + " ").split(
+                " ", 2
+            )
+            status_code = int(status)
+        except ValueError:
+            raise ConnectionError(f"Invalid status line {status_line!r}: {url}")
+
+        response_headers: requests.structures.CaseInsensitiveDict[str] = (
+            requests.structures.CaseInsensitiveDict()
+        )
+        for _ in range(0, MAX_HEADER_LINES):
+            line = await within(
+                reader.readline(),
+                read_timeout,
+                f"No headers for {read_timeout}s: {url}",
+            )
+            if line.strip() == b"":
+                break
+
+            key, _, value = line.decode("latin-1").partition(":")
+            response_headers[key.strip()] = value.strip()
+        else:
+            raise ConnectionError(f"More than {MAX_HEADER_LINES} headers: {url}")
+    except BaseException:
+        writer.close()
+        raise
+
+    return AsyncResponse(
+        url,
+        status_code,
+        reason.strip(),
+        response_headers,
+        reader,
+        writer,
+        read_timeout,
+        has_body=method != "HEAD" and status_code not in (204, 304),
+    )
@@ -0,0 +1,32 @@
+import os
+
+
+def write_atomic(path: str, content: str, permissions: int = 0o644) -> None:
+    # Readers see the old file or the new one, never half of either
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, permissions)
+
+    try:
+        with os.fdopen(fd, "w") as file:
+            file.write(content)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    sync_directory(os.path.dirname(os.path.abspath(path)))
+
+
+def sync_directory(directory: str) -> None:
+    # Makes the rename itself durable, not just the file's contents
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+
+    fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
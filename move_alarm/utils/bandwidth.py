@@ -0,0 +1,132 @@
+import json, os, threading
+from datetime import date
+from move_alarm.utils.atomic_file import write_atomic
+from move_alarm.utils.file_lock import FileLock
+from move_alarm.utils.rate_limit import TokenBucket
+from move_alarm.utils.state_directory import state_directory
+import move_alarm.datatypes as datatype
+
+BANDWIDTH_PATH = os.path.join(state_directory(), "bandwidth")
+
+# Usage is written to disk in batches rather than on every chunk
+FLUSH_BYTES = 1024 * 1024
+
+
+class BandwidthBudget:
+
+    @property
+    def daily_bytes(self) -> int:
+        return self.__daily_bytes
+
+    @daily_bytes.setter
+    def daily_bytes(self, value: int) -> None:
+        if isinstance(value, int) and value >= 0:
+            self.__daily_bytes = value
+        else:
+            raise ValueError("A non-negative int required for daily_bytes")
+
+    def __init__(self, daily_bytes: int = 0, state_path: str | None = None) -> None:
+        self.daily_bytes = daily_bytes
+        self.state_path = state_path
+        self._file_lock = None if state_path is None else FileLock(state_path + ".lock")
+        self._lock = threading.Lock()
+        self._state = datatype.BandwidthStateDict(day=date.today().isoformat(), used=0)
+        self._pending = 0
+
+    def usage(self) -> datatype.BandwidthUsage:
+        with self._lock:
+            state = self._load()
+            return datatype.BandwidthUsage(
+                state["day"], state["used"] + self._pending, self.daily_bytes
+            )
+
+    def check(self, size: int = 0) -> None:
+        usage = self.usage()
+
+        if usage.remaining is None:
+            return
+
+        if usage.exhausted or size > usage.remaining:
+            raise datatype.BandwidthBudgetError(
+                f"Daily download budget cannot fit {size} more bytes "
+                + f"({usage.used} of {usage.budget} bytes used)"
+            )
+
+    def consume(self, size: int) -> None:
+        with self._lock:
+            self._pending += size
+
+            if self._pending >= FLUSH_BYTES:
+                self._flush()
+
+            # Other processes' usage is picked up on the next flush
+            used = self._state["used"] + self._pending
+
+        if self.daily_bytes > 0 and used > self.daily_bytes:
+            self.flush()
+            raise datatype.BandwidthBudgetError(
+                f"Daily download budget exceeded ({used} of {self.daily_bytes} bytes)"
+            )
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush()
+
+    def _flush(self) -> None:
+        if self._pending == 0:
+            return
+
+        if self._file_lock is None:
+            self._roll_over(self._state)
+            self._state["used"] += self._pending
+        else:
+            with self._file_lock:
+                self._state = self._read_state()
+                self._state["used"] += self._pending
+                self._write_state(self._state)
+
+        self._pending = 0
+
+    def _load(self) -> datatype.BandwidthStateDict:
+        if self._file_lock is not None:
+            self._state = self._read_state()
+        else:
+            self._roll_over(self._state)
+
+        return self._state
+
+    def _roll_over(
+        self, state: datatype.BandwidthStateDict
+    ) -> datatype.BandwidthStateDict:
+        today = date.today().isoformat()
+
+        if state["day"] != today:
+            state["day"] = today
+            state["used"] = 0
+
+        return state
+
+    def _read_state(self) -> datatype.BandwidthStateDict:
+        try:
+            with open(str(self.state_path)) as file:
+                state = json.load(file)
+            state = datatype.BandwidthStateDict(
+                day=str(state["day"]), used=int(state["used"])
+            )
+        except (OSError, ValueError, KeyError, TypeError):
+            state = datatype.BandwidthStateDict(day=date.today().isoformat(), used=0)
+
+        return self._roll_over(state)
+
+    def _write_state(self, state: datatype.BandwidthStateDict) -> None:
+        write_atomic(str(self.state_path), json.dumps(state))
+
+
+def make_throttle(bytes_per_second: int, chunk_size: int = 65536) -> TokenBucket:
+    # The bucket has to hold a whole chunk or acquire could never succeed
+    return TokenBucket(
+        float(bytes_per_second), float(max(bytes_per_second, chunk_size))
+    )
+
+
+download_budget = BandwidthBudget(0, BANDWIDTH_PATH)
@@ -0,0 +1,154 @@
+from __future__ import annotations
+import functools, threading, time
+from collections.abc import Callable
+from typing import Any, TypeVar
+from move_alarm.utils.lazy_import import lazy_import
+import move_alarm.datatypes as datatype
+
+requests = lazy_import("requests")
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+def is_outage(error: BaseException) -> bool:
+    if isinstance(error, requests.exceptions.HTTPError):
+        response = error.response
+        return response is None or response.status_code >= 500
+
+    if isinstance(
+        error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+    ):
+        return True
+
+    # 4xx responses are raised as ConnectionRefusedError, the service is still up
+    return isinstance(error, (ConnectionError, TimeoutError)) and not isinstance(
+        error, ConnectionRefusedError
+    )
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    @property
+    def is_open(self) -> bool:
+        return self.state == self.OPEN
+
+    @property
+    def failures(self) -> int:
+        return self._failures
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 3,
+        cooldown: float = 60.0,
+        probe: Callable[[], bool] | None = None,
+    ) -> None:
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.probe = probe
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: float | None = None
+        self._forced_open = False
+        self._probe_timer: threading.Timer | None = None
+
+    def __enter__(self) -> "CircuitBreaker":
+        if not self.allow_request():
+            raise datatype.CircuitOpenError(
+                f"{self.name} is unavailable, retrying after a {self.cooldown}s cool-down"
+            )
+        return self
+
+    def __exit__(self, error_type, error, traceback) -> None:
+        if error is None:
+            self.record_success()
+        elif is_outage(error):
+            self.record_failure()
+
+    def protect(self, func: F) -> F:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with self:
+                return func(*args, **kwargs)
+
+        return wrapper  # type: ignore
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            # Half open lets calls through, the next result closes or re-opens it
+            return self._current_state() != self.OPEN
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._forced_open:
+                return
+            self._failures = 0
+            self._opened_at = None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+
+            if self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                self._schedule_probe()
+
+    def force_open(self) -> None:
+        with self._lock:
+            self._forced_open = True
+            self._opened_at = time.monotonic()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._forced_open = False
+            self._failures = 0
+            self._opened_at = None
+
+            if self._probe_timer is not None:
+                self._probe_timer.cancel()
+                self._probe_timer = None
+
+    def _current_state(self) -> str:
+        if self._forced_open:
+            return self.OPEN
+        if self._opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self._opened_at < self.cooldown:
+            return self.OPEN
+        return self.HALF_OPEN
+
+    def _schedule_probe(self) -> None:
+        if self.probe is None or self._probe_timer is not None:
+            return
+
+        self._probe_timer = threading.Timer(self.cooldown, self._run_probe)
+        self._probe_timer.daemon = True
+        self._probe_timer.name = f"MoveProbe-{self.name}"
+        self._probe_timer.start()
+
+    def _run_probe(self) -> None:
+        with self._lock:
+            self._probe_timer = None
+            if self._current_state() == self.CLOSED or self.probe is None:
+                return
+
+        try:
+            healthy = self.probe()
+        except Exception:
+            healthy = False
+
+        if healthy:
+            self.record_success()
+        else:
+            with self._lock:
+                self._opened_at = time.monotonic()
+                self._schedule_probe()
@@ -1,8 +1,29 @@
-import configparser, datetime, os
+import atexit, copy, dataclasses, datetime, os, threading, time, weakref
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from typing import Any
+from move_alarm.utils.atomic_file import write_atomic
+from move_alarm.utils import config_schema
+from move_alarm.utils.config_schema import setting
 import move_alarm.datatypes as datatype
 
+# Weakly held, so a config someone dropped isn't kept alive for the exit flush
+_pending_saves: "weakref.WeakValueDictionary[int, Configuration]" = (
+    weakref.WeakValueDictionary()
+)
+
+
+@atexit.register
+def flush_pending_saves() -> None:
+    for configuration in list(_pending_saves.values()):
+        configuration.flush()
+
 
 class Configuration(datatype.Config):
+    # Seconds between checks of the file's mtime and size
+    reload_interval: float = 1.0
+    # Seconds an update waits for more updates before writing the file
+    save_delay: float = 0.5
 
     @property
     def config_path(self) -> str:
@@ -15,135 +36,206 @@ class Configuration(datatype.Config):
         else:
             raise TypeError("Configuration must be initialised with a string.")
 
+    wait_duration: datetime.timedelta = setting()
+    snooze_duration: datetime.timedelta = setting()
+    reminder_text: str = setting()
+    wav_directory: str = setting()
+    api_enabled: bool = setting()
+    sound_themes: list[str] = setting()
+    prefetch_count: int = setting()
+    search_per_theme: bool = setting()
+    stream_playback: bool = setting()
+    daily_download_limit: int = setting()
+    background_download_rate: int = setting()
+    login_callback_port: int = setting()
+    acquire_deadline: datetime.timedelta = setting()
+    sound_filters: datatype.SoundFilters = setting()
+
     @property
-    def wait_duration(self) -> datetime.timedelta:
-        return self.__wait_duration
+    def json_format(self) -> bool:
+        return config_schema.is_json_path(self.config_path)
 
-    @wait_duration.setter
-    def wait_duration(self, duration: datetime.timedelta) -> None:
-        if isinstance(duration, datetime.timedelta):
-            self.__wait_duration = duration
-        else:
-            raise TypeError("datetime.timedelta required for wait_duration")
+    def __init__(self, config_path: str) -> None:
+        self.config_path = config_path
+        self._values: dict[str, Any] = {}
+        self._listeners: list[Callable[[set[str]], None]] = []
+        self._file_stamp: tuple[int, int] | None = None
+        self._last_checked = 0.0
+        self._saved_text: str | None = None
+        self._save_lock = threading.RLock()
+        self._save_timer: threading.Timer | None = None
+        self._update_depth = 0
 
-    @property
-    def snooze_duration(self) -> datetime.timedelta:
-        return self.__snooze_duration
+        try:
+            self.load_config_file()
+        except Exception as error:
+            print(f"Warning: {Warning(error)}\nUsing default values...")
+            self.use_default_values()
+            self.set_config_file()
 
-    @snooze_duration.setter
-    def snooze_duration(self, duration: datetime.timedelta) -> None:
-        if isinstance(duration, datetime.timedelta):
-            self.__snooze_duration = duration
-        else:
-            raise TypeError("datetime.timedelta required for snooze_duration")
+    def on_change(self, listener: Callable[[set[str]], None]) -> None:
+        if listener not in self._listeners:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[set[str]], None]) -> None:
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def snapshot(self) -> dict[str, object]:
+        return {
+            field.name: copy.copy(getattr(self, field.name))
+            for field in dataclasses.fields(datatype.Config)
+        }
+
+    def notify(self, before: dict[str, object]) -> set[str]:
+        after = self.snapshot()
+        changed = {name for name in after if after[name] != before[name]}
+
+        if len(changed) > 0:
+            for listener in list(self._listeners):
+                listener(changed)
+
+        return changed
+
+    @contextmanager
+    def update(self, debounce: bool = True) -> Iterator["Configuration"]:
+        with self._save_lock:
+            self._update_depth += 1
+            before = self.snapshot()
+
+            try:
+                yield self
+            except BaseException:
+                # All or nothing, a failed update leaves every field as it was
+                for name, value in before.items():
+                    setattr(self, name, value)
+                raise
+            finally:
+                self._update_depth -= 1
+
+            if self._update_depth > 0:
+                return
+
+            if len(self.notify(before)) == 0:
+                return
+
+            if debounce:
+                self.schedule_save()
+                return
+
+            self.cancel_save()
+            self.set_config_file()
 
-    @property
-    def reminder_text(self) -> str:
-        return self.__reminder_text
+    def schedule_save(self) -> None:
+        with self._save_lock:
+            if self._save_timer is not None:
+                self._save_timer.cancel()
 
-    @reminder_text.setter
-    def reminder_text(self, message: str) -> None:
-        if isinstance(message, str):
-            self.__reminder_text = message
-        else:
-            raise TypeError("str required for reminder_text")
+            self._save_timer = threading.Timer(self.save_delay, self.flush)
+            self._save_timer.name = "MoveConfigSave"
+            self._save_timer.daemon = True
+            self._save_timer.start()
 
-    @property
-    def wav_directory(self) -> str:
-        return self.__wav_directory
+            _pending_saves[id(self)] = self
 
-    @wav_directory.setter
-    def wav_directory(self, dir: str) -> None:
-        if isinstance(dir, str) and os.path.exists(dir):
-            self.__wav_directory = dir
-        else:
-            raise ValueError(
-                "A string representing an existing directory required for wav_directory"
-            )
+    def cancel_save(self) -> None:
+        with self._save_lock:
+            if self._save_timer is not None:
+                self._save_timer.cancel()
+                self._save_timer = None
+
+            _pending_saves.pop(id(self), None)
 
     @property
-    def api_enabled(self) -> bool:
-        return self.__api_enabled
+    def has_pending_save(self) -> bool:
+        return self._save_timer is not None
 
-    @api_enabled.setter
-    def api_enabled(self, value: bool) -> None:
-        if isinstance(value, bool):
-            self.__api_enabled = value
-        else:
-            raise TypeError("bool required for api_enabled")
+    def flush(self) -> bool:
+        with self._save_lock:
+            if self._save_timer is None:
+                return False
 
-    @property
-    def sound_themes(self) -> list[str]:
-        return self.__sound_themes
+            try:
+                return self.set_config_file()
+            finally:
+                self.cancel_save()
 
-    @sound_themes.setter
-    def sound_themes(self, themes: list[str]) -> None:
-        if isinstance(themes, list):
-            self.__sound_themes = [theme for theme in themes if isinstance(theme, str)]
-        else:
-            raise TypeError("list[str] required for sound_themes")
+    def read_file_stamp(self) -> tuple[int, int] | None:
+        try:
+            stat = os.stat(self.config_path)
+        except OSError:
+            return None
 
-    def __init__(self, config_path: str) -> None:
-        self.config_path = config_path
+        return stat.st_mtime_ns, stat.st_size
+
+    def reload_if_changed(self, force: bool = False) -> bool:
+        now = time.monotonic()
+
+        if not force and now - self._last_checked < self.reload_interval:
+            return False
+
+        self._last_checked = now
+        stamp = self.read_file_stamp()
+
+        if stamp is None or stamp == self._file_stamp:
+            return False
+
+        before = self.snapshot()
 
         try:
             self.load_config_file()
         except Exception as error:
-            print(f"Warning: {Warning(error)}\nUsing default values...")
-            self.use_default_values()
-            self.set_config_file()
+            # Most likely caught mid-save, nothing is applied until it all checks out
+            print(f"Warning: {Warning(error)}\nKeeping the current settings...")
+            return False
+
+        self.notify(before)
+
+        return True
+
+    def apply(self, values: dict[str, Any]) -> None:
+        config_schema.validate(values)
+        self._values.update(values)
 
     def use_default_values(self) -> None:
-        self.wait_duration = datetime.timedelta(minutes=60)
-        self.snooze_duration = datetime.timedelta(minutes=5)
-        self.reminder_text = "Time to stretch!"
-        self.wav_directory = os.path.abspath(
-            os.path.join(os.path.dirname(__file__)[:-5], "assets")
-        )
-        self.api_enabled = False
-        self.sound_themes = ["funk"]
+        self.apply(config_schema.default_values())
 
     def define_data_to_save(self) -> datatype.IniFormattedConfig:
+        sections = config_schema.encode(self._values, json_format=False)
+
         return datatype.IniFormattedConfig(
-            Alarm=datatype.IniFormattedAlarm(
-                interval=int(self.wait_duration.total_seconds()),
-                snooze=int(self.snooze_duration.total_seconds()),
-                message=self.reminder_text,
-            ),
-            Sounds=datatype.IniFormattedSounds(
-                path=self.wav_directory,
-                freesound=self.api_enabled,
-                themes=self.sound_themes,
-            ),
+            Alarm=datatype.IniFormattedAlarm(sections["Alarm"]),
+            Sounds=datatype.IniFormattedSounds(sections["Sounds"]),
+            Filters=datatype.IniFormattedFilters(sections["Filters"]),
         )
 
     def set_config_file(self) -> bool:
-        data = self.define_data_to_save()
+        text = config_schema.serialise(self._values, self.json_format)
+
+        with self._save_lock:
+            unchanged = (
+                text == self._saved_text
+                and self._file_stamp != None
+                and self._file_stamp == self.read_file_stamp()
+            )
+            if unchanged:
+                return True
 
-        parser = configparser.ConfigParser()
-        parser.read_dict(data)
+            write_atomic(self.config_path, text)
 
-        with open(self.config_path, "w") as file:
-            parser.write(file)
+            self._saved_text = text
+            self._file_stamp = self.read_file_stamp()
 
         return True
 
     def load_config_file(self) -> bool:
-        if not os.path.exists(self.config_path):
-            raise FileNotFoundError(self.config_path)
+        with open(self.config_path) as file:
+            stat = os.fstat(file.fileno())
+            text = file.read()
 
-        config_parser = configparser.ConfigParser()
-        config_parser.read(self.config_path)
+        self.apply(config_schema.parse(text, self.json_format))
 
-        self.wait_duration = datetime.timedelta(
-            seconds=config_parser.getint("Alarm", "interval")
-        )
-        self.snooze_duration = datetime.timedelta(
-            seconds=config_parser.getint("Alarm", "snooze")
-        )
-        self.reminder_text = config_parser.get("Alarm", "message")
-        self.wav_directory = config_parser.get("Sounds", "path")
-        self.api_enabled = config_parser.getboolean("Sounds", "freesound")
-        self.sound_themes = list(config_parser.get("Sounds", "themes"))
+        self._saved_text = text
+        self._file_stamp = stat.st_mtime_ns, stat.st_size
 
         return True
@@ -0,0 +1,354 @@
+import ast, configparser, dataclasses, datetime, io, json, os
+from collections.abc import Callable
+from typing import Any, Generic, TypeVar
+import move_alarm.datatypes as datatype
+
+T = TypeVar("T")
+
+
+def read_int(value: Any) -> int:
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise ValueError(f"Not an integer: {value!r}")
+    return value
+
+
+def read_bool(value: Any) -> bool:
+    if not isinstance(value, bool):
+        raise ValueError(f"Not a boolean: {value!r}")
+    return value
+
+
+def read_str(value: Any) -> str:
+    if not isinstance(value, str):
+        raise ValueError(f"Not a string: {value!r}")
+    return value
+
+
+def read_themes(value: Any) -> list[str]:
+    if isinstance(value, list) and all(isinstance(theme, str) for theme in value):
+        return value
+    raise ValueError(f"Not a list of themes: {value!r}")
+
+
+def parse_bool(text: str) -> bool:
+    try:
+        return configparser.ConfigParser.BOOLEAN_STATES[text.lower()]
+    except KeyError:
+        raise ValueError(f"Not a boolean: {text}") from None
+
+
+def parse_themes(text: str) -> list[str]:
+    try:
+        return read_themes(json.loads(text))
+    except ValueError:
+        pass
+
+    try:
+        # Older versions saved the list with str(), e.g. ['funk', 'piano']
+        return read_themes(ast.literal_eval(text))
+    except (ValueError, SyntaxError):
+        pass
+
+    return [theme.strip() for theme in text.split(",") if theme.strip() != ""]
+
+
+def unchanged(value: Any) -> Any:
+    return value
+
+
+SECONDS = datatype.ConfigCodec(
+    from_ini=lambda text: datetime.timedelta(seconds=int(text)),
+    to_ini=lambda duration: str(int(duration.total_seconds())),
+    from_json=lambda value: datetime.timedelta(seconds=read_int(value)),
+    to_json=lambda duration: int(duration.total_seconds()),
+)
+MILLISECONDS = datatype.ConfigCodec(
+    from_ini=lambda text: datetime.timedelta(milliseconds=int(text)),
+    to_ini=lambda duration: str(round(duration.total_seconds() * 1000)),
+    from_json=lambda value: datetime.timedelta(milliseconds=read_int(value)),
+    to_json=lambda duration: round(duration.total_seconds() * 1000),
+)
+INTEGER = datatype.ConfigCodec(int, str, read_int, unchanged)
+BOOLEAN = datatype.ConfigCodec(parse_bool, str, read_bool, unchanged)
+TEXT = datatype.ConfigCodec(unchanged, unchanged, read_str, unchanged)
+THEMES = datatype.ConfigCodec(parse_themes, json.dumps, read_themes, list)
+
+
+def instance_of(kind: type) -> Callable[[Any], bool]:
+    return lambda value: isinstance(value, kind)
+
+
+def is_count(value: Any) -> bool:
+    # bool is an int subclass, but "prefetch = true" is a mistake, not a 1
+    return isinstance(value, int) and not isinstance(value, bool) and value >= 0
+
+
+def is_port(value: Any) -> bool:
+    return is_count(value) and value <= 65535
+
+
+def is_positive_duration(value: Any) -> bool:
+    return isinstance(value, datetime.timedelta) and value > datetime.timedelta(0)
+
+
+def is_sound_filters(value: Any) -> bool:
+    return isinstance(value, datatype.SoundFilters) and all(
+        is_count(getattr(value, field.name))
+        for field in dataclasses.fields(datatype.SoundFilters)
+    )
+
+
+def is_themes(value: Any) -> bool:
+    return isinstance(value, list) and all(isinstance(theme, str) for theme in value)
+
+
+def is_directory(value: Any) -> bool:
+    return isinstance(value, str) and os.path.exists(value)
+
+
+def default_wav_directory() -> str:
+    return os.path.abspath(os.path.join(os.path.dirname(__file__)[:-5], "assets"))
+
+
+def filter_keys() -> tuple[datatype.ConfigKey, ...]:
+    return tuple(
+        datatype.ConfigKey("Filters", key, INTEGER, member=f"max_{key}")
+        for key in ["samplerate", "bitdepth", "channels", "filesize"]
+    )
+
+
+SCHEMA: tuple[datatype.ConfigSetting, ...] = (
+    datatype.ConfigSetting(
+        "wait_duration",
+        (datatype.ConfigKey("Alarm", "interval", SECONDS, required=True),),
+        default=lambda: datetime.timedelta(minutes=60),
+        check=instance_of(datetime.timedelta),
+        requirement="datetime.timedelta required for wait_duration",
+    ),
+    datatype.ConfigSetting(
+        "snooze_duration",
+        (datatype.ConfigKey("Alarm", "snooze", SECONDS, required=True),),
+        default=lambda: datetime.timedelta(minutes=5),
+        check=instance_of(datetime.timedelta),
+        requirement="datetime.timedelta required for snooze_duration",
+    ),
+    datatype.ConfigSetting(
+        "reminder_text",
+        (datatype.ConfigKey("Alarm", "message", TEXT, required=True),),
+        default=lambda: "Time to stretch!",
+        check=instance_of(str),
+        requirement="str required for reminder_text",
+    ),
+    datatype.ConfigSetting(
+        "wav_directory",
+        (datatype.ConfigKey("Sounds", "path", TEXT, required=True),),
+        default=default_wav_directory,
+        check=is_directory,
+        requirement="A string representing an existing directory required for wav_directory",
+        error=ValueError,
+    ),
+    datatype.ConfigSetting(
+        "api_enabled",
+        (datatype.ConfigKey("Sounds", "freesound", BOOLEAN, required=True),),
+        default=lambda: False,
+        check=instance_of(bool),
+        requirement="bool required for api_enabled",
+    ),
+    datatype.ConfigSetting(
+        "sound_themes",
+        (datatype.ConfigKey("Sounds", "themes", THEMES, required=True),),
+        default=lambda: ["funk"],
+        check=is_themes,
+        requirement="list[str] required for sound_themes",
+    ),
+    datatype.ConfigSetting(
+        "prefetch_count",
+        (datatype.ConfigKey("Sounds", "prefetch", INTEGER),),
+        default=lambda: 3,
+        check=is_count,
+        requirement="A non-negative int required for prefetch_count",
+        error=ValueError,
+    ),
+    datatype.ConfigSetting(
+        "search_per_theme",
+        (datatype.ConfigKey("Sounds", "per_theme_search", BOOLEAN),),
+        default=lambda: False,
+        check=instance_of(bool),
+        requirement="bool required for search_per_theme",
+    ),
+    datatype.ConfigSetting(
+        "stream_playback",
+        (datatype.ConfigKey("Sounds", "stream", BOOLEAN),),
+        default=lambda: False,
+        check=instance_of(bool),
+        requirement="bool required for stream_playback",
+    ),
+    datatype.ConfigSetting(
+        "daily_download_limit",
+        (datatype.ConfigKey("Sounds", "daily_limit", INTEGER),),
+        default=lambda: 0,
+        check=is_count,
+        requirement="A non-negative int required for daily_download_limit",
+        error=ValueError,
+    ),
+    datatype.ConfigSetting(
+        "background_download_rate",
+        (datatype.ConfigKey("Sounds", "background_rate", INTEGER),),
+        default=lambda: 0,
+        check=is_count,
+        requirement="A non-negative int required for background_download_rate",
+        error=ValueError,
+    ),
+    datatype.ConfigSetting(
+        "login_callback_port",
+        # 0 means the Freesound code is pasted in rather than caught on 127.0.0.1
+        (datatype.ConfigKey("Sounds", "callback_port", INTEGER),),
+        default=lambda: 0,
+        check=is_port,
+        requirement="An int from 0 to 65535 required for login_callback_port",
+        error=ValueError,
+    ),
+    datatype.ConfigSetting(
+        "acquire_deadline",
+        # How long an alarm waits on a Freesound search and download
+        (datatype.ConfigKey("Sounds", "deadline", MILLISECONDS),),
+        default=lambda: datetime.timedelta(seconds=3),
+        check=is_positive_duration,
+        requirement="A positive datetime.timedelta required for acquire_deadline",
+        error=ValueError,
+    ),
+    datatype.ConfigSetting(
+        "sound_filters",
+        filter_keys(),
+        default=datatype.SoundFilters,
+        check=is_sound_filters,
+        # A limit of 0 turns that filter off
+        requirement="datatype.SoundFilters of non-negative int limits required "
+        + "for sound_filters",
+        error=ValueError,
+    ),
+)
+
+SETTINGS: dict[str, datatype.ConfigSetting] = {
+    setting.name: setting for setting in SCHEMA
+}
+
+
+def is_json_path(path: str) -> bool:
+    return path.lower().endswith(".json")
+
+
+def check_value(setting: datatype.ConfigSetting, value: Any) -> None:
+    if not setting.check(value):
+        raise setting.error(setting.requirement)
+
+
+def validate(values: dict[str, Any]) -> None:
+    for setting in SCHEMA:
+        check_value(setting, values[setting.name])
+
+
+def default_values() -> dict[str, Any]:
+    return {setting.name: setting.default() for setting in SCHEMA}
+
+
+def decode(sections: dict[str, dict[str, Any]], json_format: bool) -> dict[str, Any]:
+    values: dict[str, Any] = {}
+
+    for setting in SCHEMA:
+        value = setting.default()
+
+        for key in setting.keys:
+            if key.key in sections.get(key.section, {}):
+                raw = sections[key.section][key.key]
+                codec = key.codec
+                decoded = codec.from_json(raw) if json_format else codec.from_ini(raw)
+            elif not key.required:
+                continue
+            elif key.section not in sections:
+                raise configparser.NoSectionError(key.section)
+            else:
+                raise configparser.NoOptionError(key.key, key.section)
+
+            if key.member is None:
+                value = decoded
+            else:
+                value = dataclasses.replace(value, **{key.member: decoded})
+
+        values[setting.name] = value
+
+    return values
+
+
+def encode(values: dict[str, Any], json_format: bool) -> dict[str, dict[str, Any]]:
+    sections: dict[str, dict[str, Any]] = {}
+
+    for setting in SCHEMA:
+        for key in setting.keys:
+            value = values[setting.name]
+            if key.member is not None:
+                value = getattr(value, key.member)
+
+            codec = key.codec
+            encoded = codec.to_json(value) if json_format else codec.to_ini(value)
+            sections.setdefault(key.section, {})[key.key] = encoded
+
+    return sections
+
+
+def parse(text: str, json_format: bool) -> dict[str, Any]:
+    if json_format:
+        sections = json.loads(text)
+        if not isinstance(sections, dict) or not all(
+            isinstance(section, dict) for section in sections.values()
+        ):
+            raise ValueError("A JSON object of sections required")
+        return decode(sections, json_format=True)
+
+    parser = configparser.ConfigParser(interpolation=None)
+    parser.read_string(text)
+
+    return decode(
+        {name: dict(parser.items(name)) for name in parser.sections()},
+        json_format=False,
+    )
+
+
+def serialise(values: dict[str, Any], json_format: bool) -> str:
+    sections = encode(values, json_format)
+
+    if json_format:
+        return json.dumps(sections, indent=2) + "\n"
+
+    parser = configparser.ConfigParser(interpolation=None)
+    parser.read_dict(sections)
+
+    text = io.StringIO()
+    parser.write(text)
+
+    return text.getvalue()
+
+
+class SettingProperty(Generic[T]):
+    # Checks a single assignment, loads are checked as a whole by validate()
+    def __set_name__(self, owner: type, name: str) -> None:
+        self.setting = SETTINGS[name]
+
+    def __get__(self, instance: Any, owner: type | None = None) -> T:
+        if instance is None:
+            return self  # type: ignore[return-value]
+
+        try:
+            return instance._values[self.setting.name]
+        except KeyError:
+            raise AttributeError(self.setting.name) from None
+
+    def __set__(self, instance: Any, value: T) -> None:
+        check_value(self.setting, value)
+        instance._values[self.setting.name] = value
+
+
+def setting() -> Any:
+    # Typed as the value it holds, like dataclasses.field(), so a class of these
+    # still type-checks as the datatype.Config it stands in for
+    return SettingProperty()
@@ -0,0 +1,93 @@
+import os, threading, time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None  # type: ignore
+    import msvcrt
+
+
+class FileLock:
+
+    @property
+    def is_locked(self) -> bool:
+        return self._fd is not None
+
+    def __init__(self, path: str, timeout: float | None = None) -> None:
+        self.path = path
+        self.timeout = timeout
+        self._fd: int | None = None
+        self._thread_lock = threading.Lock()
+
+    def acquire(self, blocking: bool = True) -> bool:
+        if blocking:
+            acquired = self._thread_lock.acquire(
+                timeout=-1 if self.timeout is None else self.timeout
+            )
+        else:
+            acquired = self._thread_lock.acquire(blocking=False)
+
+        if not acquired:
+            return False
+
+        try:
+            fd = self._open_fd()
+        except BaseException:
+            self._thread_lock.release()
+            raise
+
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+
+        while True:
+            try:
+                self._lock_fd(fd, blocking and deadline is None)
+                self._fd = fd
+                return True
+            except OSError:
+                if not blocking or (
+                    deadline is not None and time.monotonic() >= deadline
+                ):
+                    os.close(fd)
+                    self._thread_lock.release()
+                    return False
+                time.sleep(0.01)
+
+    def release(self) -> None:
+        if self._fd is None:
+            return
+
+        fd, self._fd = self._fd, None
+        try:
+            self._unlock_fd(fd)
+        finally:
+            os.close(fd)
+            self._thread_lock.release()
+
+    def __enter__(self) -> "FileLock":
+        if not self.acquire():
+            raise TimeoutError(f"Could not lock {self.path} within {self.timeout}s")
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.release()
+
+    def _open_fd(self) -> int:
+        try:
+            return os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        except FileNotFoundError:
+            # e.g. the state directory, left unmade until something is saved in it
+            os.makedirs(os.path.dirname(self.path), mode=0o700, exist_ok=True)
+            return os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+
+    def _lock_fd(self, fd: int, blocking: bool) -> None:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        else:
+            msvcrt.locking(fd, msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+
+    def _unlock_fd(self, fd: int) -> None:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        else:
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
@@ -1,11 +1,38 @@
-from move_alarm.contexts import use_context
+# Not the function itself, utils is imported while contexts is still loading
+from move_alarm import contexts, utils
+import move_alarm.datatypes as datatype
 
 
 def get_auth_token():
-    auth = use_context().auth
+    auth = contexts.use_context().auth
     token = auth.get_token()
 
     if token is None:
         raise ValueError("Unexpected error: Unable to get an access token")
 
     return token
+
+
+def get_api_status() -> dict[str, str]:
+    return {
+        "freesound": utils.freesound_breaker.state,
+        "token": utils.token_breaker.state,
+    }
+
+
+def is_api_offline() -> bool:
+    return utils.freesound_breaker.is_open or utils.token_breaker.is_open
+
+
+def get_download_budget() -> utils.BandwidthBudget:
+    budget = utils.download_budget
+    budget.daily_bytes = contexts.use_context().config.daily_download_limit
+    return budget
+
+
+def get_download_usage() -> datatype.BandwidthUsage:
+    return get_download_budget().usage()
+
+
+def is_download_budget_exhausted() -> bool:
+    return get_download_usage().exhausted
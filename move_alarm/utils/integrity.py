@@ -0,0 +1,96 @@
+import hashlib, struct
+import move_alarm.datatypes as datatype
+
+# The fmt chunk has to turn up within this many bytes or the file is rejected
+MAX_HEADER_SIZE = 64 * 1024
+PCM_FORMATS = (1, 0xFFFE)
+
+
+class SoundVerifier:
+    @property
+    def digest(self) -> str:
+        return self._hash.hexdigest()
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    @property
+    def header_valid(self) -> bool:
+        return self._header_valid
+
+    def __init__(self, name: str = "sound") -> None:
+        self._name = name
+        self.reset()
+
+    def reset(self) -> None:
+        self._hash = hashlib.sha256()
+        self._size = 0
+        self._header = bytearray()
+        self._header_valid = False
+
+    def update(self, chunk: bytes) -> None:
+        self._hash.update(chunk)
+        self._size += len(chunk)
+
+        if not self._header_valid:
+            self._header += chunk[: MAX_HEADER_SIZE - len(self._header)]
+            self.check_header()
+
+    def update_from_file(self, path: str, block_size: int = 1024 * 1024) -> None:
+        with open(path, "rb") as f:
+            while len(block := f.read(block_size)) > 0:
+                self.update(block)
+
+    def finish(self) -> str:
+        if not self._header_valid:
+            raise datatype.InvalidSoundError(
+                f"{self._name} ended before a complete WAV header ({self._size} bytes)"
+            )
+
+        return self.digest
+
+    def check_header(self) -> None:
+        header = bytes(self._header)
+
+        if len(header) >= 4 and header[0:4] != b"RIFF":
+            raise datatype.InvalidSoundError(
+                f"{self._name} is not a WAV file, it starts with {header[0:16]!r}"
+            )
+
+        if len(header) >= 12 and header[8:12] != b"WAVE":
+            raise datatype.InvalidSoundError(f"{self._name} is a RIFF but not a WAVE")
+
+        offset = 12
+
+        while offset + 8 <= len(header):
+            chunk_id = header[offset : offset + 4]
+            (chunk_size,) = struct.unpack("<I", header[offset + 4 : offset + 8])
+
+            if chunk_id == b"fmt ":
+                if offset + 10 > len(header):
+                    break
+
+                (audio_format,) = struct.unpack("<H", header[offset + 8 : offset + 10])
+                if audio_format not in PCM_FORMATS:
+                    raise datatype.InvalidSoundError(
+                        f"{self._name} is not PCM audio (format {audio_format})"
+                    )
+
+                self._header_valid = True
+                self._header = bytearray()
+                return
+
+            # RIFF chunks are padded to an even number of bytes
+            offset += 8 + chunk_size + (chunk_size % 2)
+
+        if len(header) >= MAX_HEADER_SIZE:
+            raise datatype.InvalidSoundError(
+                f"{self._name} has no fmt chunk in its first {MAX_HEADER_SIZE} bytes"
+            )
+
+
+def verify_file(path: str) -> str:
+    verifier = SoundVerifier(path)
+    verifier.update_from_file(path)
+    return verifier.finish()
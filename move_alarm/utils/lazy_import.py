@@ -0,0 +1,68 @@
+import importlib, threading, types
+from collections.abc import Callable
+from typing import Any, Generic, TypeVar
+
+T = TypeVar("T")
+
+
+class LazyModule:
+    # Stands in for a module and imports it on first attribute access, so
+    # commands that never touch audio or HTTP don't pay for loading them
+
+    def __init__(self, name: str) -> None:
+        object.__setattr__(self, "_name", name)
+        object.__setattr__(self, "_module", None)
+
+    def load(self) -> types.ModuleType:
+        module = self._module
+
+        if module is None:
+            # The import system's own lock makes concurrent first use safe
+            module = importlib.import_module(self._name)
+            object.__setattr__(self, "_module", module)
+
+        return module
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._module is not None
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(self.load(), attr)
+
+    def __setattr__(self, attr: str, value: Any) -> None:
+        setattr(self.load(), attr, value)
+
+    def __delattr__(self, attr: str) -> None:
+        delattr(self.load(), attr)
+
+    def __dir__(self) -> list[str]:
+        return dir(self.load())
+
+    def __repr__(self) -> str:
+        state = "loaded" if self.is_loaded else "not loaded"
+        return f"<lazy module '{self._name}' ({state})>"
+
+
+def lazy_import(name: str) -> Any:
+    return LazyModule(name)
+
+
+class LazyAttribute(Generic[T]):
+    # A class attribute built by its first reader and then shared, like a
+    # plain class attribute but without the cost at class-definition time
+
+    def __init__(self, factory: Callable[[], T]) -> None:
+        self._factory = factory
+        self._value: T | None = None
+        self._built = False
+        self._lock = threading.Lock()
+
+    def __get__(self, instance: Any, owner: type | None = None) -> T:
+        if not self._built:
+            with self._lock:
+                if not self._built:
+                    self._value = self._factory()
+                    self._built = True
+
+        return self._value  # type: ignore[return-value]
@@ -1,11 +1,23 @@
-import os, random, re, dotenv
+import os, random, re
 import threading, time
 from datetime import datetime
 from move_alarm import utils
+from move_alarm.utils.token_store import TokenStore
+from move_alarm.utils.lazy_import import lazy_import
 import move_alarm.datatypes as datatype
 
+dotenv = lazy_import("dotenv")
+
 
 class HandleAuthorisation(datatype.OauthObject):
+    # Seconds before expiry that a cached access token is treated as stale
+    refresh_margin: float = 60.0
+    # Seconds between background attempts after a failed refresh
+    background_retry: float = 60.0
+    # Fewest seconds between background refreshes, even for short-lived tokens
+    background_minimum: float = 30.0
+    # Seconds to wait for the browser to redirect back to the callback server
+    callback_timeout: float = 120.0
 
     @property
     def client_id(self) -> str:
@@ -34,8 +46,18 @@ class HandleAuthorisation(datatype.OauthObject):
                 )
         self.__oauth_code = code
 
-    def __init__(self, client_id: str = "Load from .env file") -> None:
+    @property
+    def token_expires_in(self) -> float:
+        return max(0.0, self._expires_at - time.time())
+
+    def __init__(
+        self, client_id: str = "Load from .env file", callback_port: int | None = None
+    ) -> None:
+        # With a port, the login redirect is caught on 127.0.0.1 instead of pasted
+        self.callback_port = callback_port
+
         self.__env_path: str = os.path.join(os.path.dirname(__file__)[:-5], ".env")
+        self._store = TokenStore(self.__env_path)
 
         if client_id != "Load from .env file":
             self.client_id = client_id
@@ -43,11 +65,19 @@ class HandleAuthorisation(datatype.OauthObject):
             try:
                 self.load_dotenv_file()
             except FileNotFoundError:
+                self.check_user_can_answer()
                 self.client_id = input("Please enter the client_id: ")
 
         self._state: str | None = None
         self.oauth_code = None
         self.oauth_token: str | None = None
+        self._access_token: str | None = None
+        self._expires_at: float = 0.0
+        self._refresh_condition = threading.Condition()
+        self._refreshing = False
+        self._refresh_generation = 0
+        self._refresh_error: BaseException | None = None
+        self._refresh_timer: threading.Timer | None = None
 
     def is_dotenv_file_recent(self) -> bool:
         modded_unix = os.path.getmtime(self.__env_path)
@@ -106,12 +136,7 @@ class HandleAuthorisation(datatype.OauthObject):
     def set_dotenv_file(self, client_token: str) -> bool:
         state = self.generate_state()
 
-        with open(self.__env_path, "w") as file:
-            file.write(
-                f"CLIENT_ID={self.client_id}\n"
-                + f"CLIENT_STATE={state}\n"
-                + f"REFRESH_TOKEN={client_token}"
-            )
+        self._store.write_env(self.client_id, state, client_token)
         return True
 
     def load_dotenv_file(self) -> str:
@@ -126,8 +151,42 @@ class HandleAuthorisation(datatype.OauthObject):
         return output
 
     def get_user_permission(self) -> bool:
+        if self.callback_port != None:
+            return self.get_user_permission_by_callback()
+
+        self.check_user_can_answer()
+
+        self.open_browser()
+        time.sleep(1)
+
+        self.oauth_code = input("Please enter your authorisation code: ")
+
+        return True
+
+    def check_user_can_answer(self) -> None:
+        if threading.current_thread() is not threading.main_thread():
+            # A prompt on a background thread would hang with nobody to answer it
+            raise PermissionError(
+                "Please log in to Freesound from the terminal before using it"
+            )
+
+    def get_user_permission_by_callback(self) -> bool:
+        if self._state is None:
+            self._state = self.generate_state()
+
+        with utils.OAuthCallbackServer(
+            self._state, int(self.callback_port or 0), self.callback_timeout
+        ) as server:
+            self.open_browser(server.redirect_uri)
+            self.oauth_code = server.wait_for_code()
+
+        return True
+
+    def open_browser(self, redirect_uri: str | None = None) -> None:
         browser_thread = threading.Thread(
-            target=lambda: utils.open_browser_to_api_auth(self.client_id, self._state)
+            target=lambda: utils.open_browser_to_api_auth(
+                self.client_id, self._state, redirect_uri
+            )
         )
         browser_thread.start()
 
@@ -136,45 +195,183 @@ class HandleAuthorisation(datatype.OauthObject):
             raise TimeoutError(
                 "Opening default browser timed out, user permissions could not be granted"
             )
-        time.sleep(1)
-
-        self.oauth_code = input("Please enter your authorisation code: ")
-
-        return True
 
     def request_oauth_token(self) -> str | None:
-        url = (
-            "https://devdolphin7.netlify.app/.netlify/functions/move-alarm?"
-            + f"client_id={self.client_id}"
-        )
+        url = f"{utils.api_calls.TOKEN_URL}?client_id={self.client_id}"
         if self.oauth_code != None:
             url += f"&code={self.oauth_code}"
         else:
             url += f"&token={self.oauth_token}"
 
-        token_response = utils.get_api_token(url)
+        with utils.token_breaker:
+            token_response = utils.get_api_token(url)
+
+            match token_response.status_code:
+                case 200:
+                    token = token_response.json()
+                    self.oauth_token = token["access_token"]
+                    self.cache_token(token["access_token"], token.get("expires_in", 0))
+
+                    self.set_dotenv_file(token["refresh_token"])
+                    return self.oauth_token
+                case 401 | 429:
+                    raise ConnectionRefusedError(token_response.text)
+                case _:
+                    raise ConnectionError(token_response.text)
+
+    def cache_token(self, access_token: str, expires_in: float) -> None:
+        self._access_token = access_token
+        self._expires_at = time.time() + float(expires_in)
+
+    def has_valid_token(self) -> bool:
+        return (
+            self._access_token != None
+            and time.time() < self._expires_at - self.refresh_margin
+        )
 
-        match token_response.status_code:
-            case 200:
-                token = token_response.json()
-                self.oauth_token = token["access_token"]
+    def invalidate_token(self) -> None:
+        with self._store.lock:
+            shared = self._store.read_access_token()
+            if shared is not None and shared[0] == self._access_token:
+                self._store.clear_access_token()
 
-                self.set_dotenv_file(token["refresh_token"])
-                return self.oauth_token
-            case 401 | 429:
-                raise ConnectionRefusedError(token_response.text)
-            case _:
-                raise ConnectionError(token_response.text)
+        self._access_token = None
+        self._expires_at = 0.0
 
     def get_token(self) -> str | None:
+        if self.has_valid_token():
+            return self._access_token
+
+        return self.refresh_single_flight()
+
+    def refresh_single_flight(self, force: bool = False) -> str | None:
+        with self._refresh_condition:
+            if self._refreshing:
+                # Another thread is already refreshing, share its result
+                generation = self._refresh_generation
+                self._refresh_condition.wait_for(
+                    lambda: self._refresh_generation != generation
+                )
+                if self._refresh_error is not None:
+                    raise self._refresh_error
+                return self._access_token
+
+            if not force and self.has_valid_token():
+                return self._access_token
+
+            self._refreshing = True
+
+        error: BaseException | None = None
         try:
-            self.is_dotenv_file_recent()
-        except FileNotFoundError:
-            if self.get_user_permission():
-                self.set_dotenv_file("None")
-            else:
-                return None
+            return self.refresh_token()
+        except BaseException as refresh_error:
+            error = refresh_error
+            raise
+        finally:
+            with self._refresh_condition:
+                self._refreshing = False
+                self._refresh_error = error
+                self._refresh_generation += 1
+                self._refresh_condition.notify_all()
+
+    def refresh_token(self) -> str | None:
+        # Processes queue on the lock, then pick up the token the first one saved
+        with self._store.lock:
+            if self.adopt_shared_token():
+                return self._access_token
+
+            try:
+                self.is_dotenv_file_recent()
+                return self.request_shared_token()
+            except FileNotFoundError:
+                pass
 
+        # Not under the lock, other processes shouldn't wait on someone logging in
+        if not self.get_user_permission():
+            return None
+
+        with self._store.lock:
+            if self.adopt_shared_token():
+                return self._access_token
+
+            self.set_dotenv_file("None")
+            return self.request_shared_token()
+
+    def request_shared_token(self) -> str | None:
         self.load_dotenv_file()
 
-        return self.request_oauth_token()
+        token = self.request_oauth_token()
+
+        if self._access_token != None:
+            self._store.write_access_token(self._access_token, self._expires_at)
+
+        return token
+
+    def adopt_shared_token(self) -> bool:
+        shared = self._store.read_access_token()
+
+        if shared is None:
+            return False
+
+        access_token, expires_at = shared
+
+        if (
+            expires_at <= self._expires_at
+            or expires_at - self.refresh_margin <= time.time()
+        ):
+            return False
+
+        self._access_token = access_token
+        self._expires_at = expires_at
+        return True
+
+    @property
+    def is_refreshing_in_background(self) -> bool:
+        return self._refresh_timer is not None
+
+    def start_background_refresh(self) -> None:
+        with self._refresh_condition:
+            if self._refresh_timer is not None:
+                return
+
+        self.schedule_background_refresh(self.next_refresh_delay())
+
+    def stop_background_refresh(self) -> None:
+        with self._refresh_condition:
+            timer = self._refresh_timer
+            self._refresh_timer = None
+
+        if timer is not None:
+            timer.cancel()
+
+    def next_refresh_delay(self) -> float:
+        # Renew a margin ahead of get_token, so callers never see it stale
+        return max(0.0, self.token_expires_in - 2 * self.refresh_margin)
+
+    def schedule_background_refresh(self, delay: float) -> None:
+        timer = threading.Timer(delay, self.background_refresh)
+        timer.name = "MoveTokenRefresh"
+        timer.daemon = True
+
+        with self._refresh_condition:
+            self._refresh_timer = timer
+
+        timer.start()
+
+    def background_refresh(self) -> None:
+        try:
+            if not os.path.exists(self.__env_path):
+                # Logging in needs the user, which a background thread cannot ask
+                raise FileNotFoundError("Log in once before refreshing in background")
+
+            self.refresh_single_flight(force=True)
+            delay = max(self.background_minimum, self.next_refresh_delay())
+        except Exception as error:
+            print(f"Warning: {Warning(error)}\nRetrying the token refresh later...")
+            delay = self.background_retry
+
+        with self._refresh_condition:
+            if self._refresh_timer is None:
+                return
+
+        self.schedule_background_refresh(delay)
@@ -0,0 +1,117 @@
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlparse
+
+CALLBACK_PATH = "/callback"
+
+RESPONSE_PAGE = (
+    "<!DOCTYPE html><html><head><title>MoveAlarm</title></head>"
+    + "<body><p>{message}</p></body></html>"
+)
+
+
+class OAuthCallbackServer:
+
+    @property
+    def redirect_uri(self) -> str:
+        return f"http://127.0.0.1:{self.port}{CALLBACK_PATH}"
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    def __init__(self, state: str, port: int = 0, timeout: float = 120.0) -> None:
+        self.state = state
+        self.timeout = timeout
+        self._done = threading.Event()
+        self._code: str | None = None
+        self._error: Exception | None = None
+        self._thread: threading.Thread | None = None
+
+        # Loopback only, nothing else on the network can reach the listener
+        self._server = HTTPServer(("127.0.0.1", port), self.make_handler())
+
+    def make_handler(self) -> type[BaseHTTPRequestHandler]:
+        callback_server = self
+
+        class CallbackHandler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                url = urlparse(self.path)
+
+                if url.path != CALLBACK_PATH:
+                    self.respond(404, "Not found")
+                    return
+
+                message = callback_server.receive(parse_qs(url.query))
+                self.respond(200 if callback_server._code else 400, message)
+
+            def respond(self, status: int, message: str) -> None:
+                body = RESPONSE_PAGE.format(message=message).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args) -> None:
+                pass
+
+        return CallbackHandler
+
+    def receive(self, query: dict[str, list[str]]) -> str:
+        if self._done.is_set():
+            return "MoveAlarm has already finished logging in."
+
+        state = query.get("state", [""])[0]
+        code = query.get("code", [""])[0]
+        error = query.get("error", [""])[0]
+
+        if state != self.state:
+            # Probably a stale or forged redirect, keep waiting for the real one
+            return "This login link has expired, please try again from MoveAlarm."
+
+        if error != "":
+            self._error = ConnectionRefusedError(f"Freesound login failed: {error}")
+        elif code == "":
+            self._error = ValueError("Freesound did not send an authorisation code")
+        else:
+            self._code = code
+
+        self._done.set()
+
+        if self._code is None:
+            return "MoveAlarm could not log in to Freesound."
+        return "MoveAlarm is logged in to Freesound, you can close this tab."
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._server.serve_forever, kwargs={"poll_interval": 0.1}
+            )
+            self._thread.name = "MoveOAuthCallback"
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread.join()
+            self._thread = None
+
+        self._server.server_close()
+
+    def wait_for_code(self, timeout: float | None = None) -> str:
+        if not self._done.wait(self.timeout if timeout is None else timeout):
+            raise TimeoutError("Timed out waiting for the Freesound login redirect")
+
+        if self._error is not None:
+            raise self._error
+
+        return str(self._code)
+
+    def __enter__(self) -> "OAuthCallbackServer":
+        self.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.stop()
@@ -0,0 +1,119 @@
+import contextvars, queue, threading
+from collections.abc import Callable
+import move_alarm.datatypes as datatype
+
+
+class SoundPrefetcher:
+
+    @property
+    def size(self) -> int:
+        return self.__size
+
+    @size.setter
+    def size(self, size: int) -> None:
+        if isinstance(size, int) and size >= 0:
+            self.__size = size
+            self._wake.set()
+        else:
+            raise ValueError("A non-negative int required for size")
+
+    @property
+    def ready(self) -> int:
+        return self._queue.qsize()
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def is_fetching(self) -> bool:
+        return self.is_running and self._fetching.is_set()
+
+    @property
+    def last_error(self) -> Exception | None:
+        return self._last_error
+
+    def __init__(
+        self,
+        fetch: Callable[[], datatype.PreparedSound | None],
+        size: int = 3,
+        retry_interval: float = 30.0,
+    ) -> None:
+        self._fetch = fetch
+        self._queue: queue.Queue[datatype.PreparedSound] = queue.Queue()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._fetching = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._last_error: Exception | None = None
+        self.retry_interval = retry_interval
+        self.size = size
+
+    def start(self) -> None:
+        if self.is_running:
+            return
+
+        self._stopped.clear()
+        self._fetching.set()
+        self._thread = threading.Thread(
+            target=contextvars.copy_context().run,
+            args=(self.thread_prefetch,),
+            daemon=True,
+        )
+        self._thread.name = "MovePrefetch"
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._wake.set()
+
+    def refill(self) -> None:
+        if self._queue.qsize() < self.size:
+            self._fetching.set()
+        self._wake.set()
+
+    def get(self) -> datatype.PreparedSound | None:
+        try:
+            prepared = self._queue.get_nowait()
+        except queue.Empty:
+            prepared = None
+
+        self.refill()
+        return prepared
+
+    def clear(self) -> int:
+        cleared = 0
+        while True:
+            try:
+                self._queue.get_nowait()
+                cleared += 1
+            except queue.Empty:
+                break
+
+        self.refill()
+        return cleared
+
+    def thread_prefetch(self) -> None:
+        while not self._stopped.is_set():
+            if self._queue.qsize() >= self.size:
+                self._fetching.clear()
+                self._wake.wait()
+                self._wake.clear()
+                continue
+
+            self._fetching.set()
+            try:
+                prepared = self._fetch()
+                self._last_error = None
+            except Exception as error:
+                self._last_error = error
+                prepared = None
+
+            if prepared is None:
+                # Nothing fetched (e.g. offline), try again later or when woken
+                self._fetching.clear()
+                self._wake.wait(timeout=self.retry_interval)
+                self._wake.clear()
+                continue
+
+            self._queue.put(prepared)
@@ -0,0 +1,165 @@
+from __future__ import annotations
+import json, os, random, threading, time
+from collections.abc import Callable
+from datetime import datetime
+from typing import TYPE_CHECKING
+from move_alarm.utils.atomic_file import write_atomic
+from move_alarm.utils.file_lock import FileLock
+from move_alarm.utils.lazy_import import lazy_import
+from move_alarm.utils.state_directory import state_directory
+
+if TYPE_CHECKING:
+    import requests
+else:
+    requests = lazy_import("requests")
+email_utils = lazy_import("email.utils")
+
+RATE_LIMIT_PATH = os.path.join(state_directory(), "ratelimit")
+TOKEN_RATE_LIMIT_PATH = RATE_LIMIT_PATH + "-login"
+
+
+class TokenBucket:
+
+    def __init__(
+        self, rate: float, capacity: float, state_path: str | None = None
+    ) -> None:
+        if rate <= 0 or capacity <= 0:
+            raise ValueError("rate and capacity must be greater than 0")
+
+        self.rate = rate
+        self.capacity = capacity
+        self.state_path = state_path
+        self._file_lock = None if state_path is None else FileLock(state_path + ".lock")
+        self._lock = threading.Lock()
+        self._state = {"tokens": capacity, "updated": time.time(), "blocked_until": 0.0}
+
+    def try_acquire(self, tokens: float = 1) -> float:
+        with self._lock:
+            if self._file_lock is None:
+                return self._take(self._state, tokens)
+
+            with self._file_lock:
+                state = self._read_state()
+                wait = self._take(state, tokens)
+                self._write_state(state)
+                return wait
+
+    def acquire(self, tokens: float = 1) -> float:
+        waited = 0.0
+
+        while (wait := self.try_acquire(tokens)) > 0:
+            time.sleep(wait)
+            waited += wait
+
+        return waited
+
+    def block_for(self, seconds: float) -> None:
+        with self._lock:
+            if self._file_lock is None:
+                self._block(self._state, seconds)
+                return
+
+            with self._file_lock:
+                state = self._read_state()
+                self._block(state, seconds)
+                self._write_state(state)
+
+    def _take(self, state: dict[str, float], tokens: float) -> float:
+        now = time.time()
+
+        if state["blocked_until"] > now:
+            return state["blocked_until"] - now
+
+        elapsed = max(0.0, now - state["updated"])
+        state["tokens"] = min(self.capacity, state["tokens"] + elapsed * self.rate)
+        state["updated"] = now
+
+        if state["tokens"] >= tokens:
+            state["tokens"] -= tokens
+            return 0.0
+
+        return (tokens - state["tokens"]) / self.rate
+
+    def _block(self, state: dict[str, float], seconds: float) -> None:
+        state["blocked_until"] = max(state["blocked_until"], time.time() + seconds)
+
+    def _read_state(self) -> dict[str, float]:
+        try:
+            with open(str(self.state_path)) as file:
+                state = json.load(file)
+            return {key: float(state[key]) for key in self._state}
+        except (OSError, ValueError, KeyError, TypeError):
+            return dict(self._state)
+
+    def _write_state(self, state: dict[str, float]) -> None:
+        write_atomic(str(self.state_path), json.dumps(state))
+
+
+def get_retry_after(response: requests.Response) -> float | None:
+    value = response.headers.get("Retry-After")
+
+    if value is None:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        retry_at: datetime = email_utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+def request_with_backoff(
+    send: Callable[[], requests.Response],
+    bucket: TokenBucket | None = None,
+    attempts: int = 4,
+    base_delay: float = 0.5,
+    max_delay: float = 30.0,
+) -> requests.Response:
+    for attempt in range(0, attempts):
+        if bucket is not None:
+            bucket.acquire()
+
+        response = send()
+
+        if response.status_code not in (429, 503) or attempt == attempts - 1:
+            return response
+
+        back_off(response, bucket, attempt, base_delay, max_delay)
+
+    return response
+
+
+def back_off(
+    response: requests.Response,
+    bucket: TokenBucket | None = None,
+    attempt: int = 0,
+    base_delay: float = 0.5,
+    max_delay: float = 30.0,
+) -> float:
+    delay = get_retry_after(response)
+    if delay is None:
+        # Full jitter keeps many instances from retrying in lockstep
+        delay = random.uniform(0, min(max_delay, base_delay * 2**attempt))
+    else:
+        # Blocking the shared bucket stalls every process, so no header gets long
+        delay = min(max_delay, delay)
+
+    if bucket is not None:
+        # Every process sharing the bucket waits, not just this caller
+        bucket.block_for(delay)
+    else:
+        time.sleep(delay)
+
+    return delay
+
+
+# Freesound allows 60 requests per minute per API key
+freesound_bucket = TokenBucket(1.0, 60.0, RATE_LIMIT_PATH)
+# The login function is a separate service, a token refresh never waits on searches
+token_bucket = TokenBucket(1.0, 10.0, TOKEN_RATE_LIMIT_PATH)
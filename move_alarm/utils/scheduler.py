@@ -0,0 +1,128 @@
+import heapq, itertools, threading, time
+from collections.abc import Callable
+
+
+class AlarmScheduler:
+    # One thread and one heap for every alarm, instead of a thread per alarm
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __init__(self, on_due: Callable[[str], None]) -> None:
+        self._on_due = on_due
+        self._heap: list[tuple[float, int, str]] = []
+        # The live (due, sequence) per key, heap entries that don't match are
+        # left over from a cancel or reschedule and are skipped when reached
+        self._entries: dict[str, tuple[float, int]] = {}
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._thread: threading.Thread | None = None
+        self._stopped = False
+
+    def schedule(self, key: str, delay: float) -> float:
+        with self._condition:
+            due = time.monotonic() + max(0.0, delay)
+            entry = (due, next(self._sequence))
+
+            self._entries[key] = entry
+            heapq.heappush(self._heap, (*entry, key))
+            self.compact()
+
+            if self._heap[0][1] == entry[1]:
+                self._condition.notify()
+
+            return self.to_wall_time(due)
+
+    def postpone(self, key: str, delay: float) -> float | None:
+        with self._condition:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            remaining = entry[0] - time.monotonic()
+            return self.schedule(key, remaining + delay)
+
+    def cancel(self, key: str) -> bool:
+        with self._condition:
+            return self._entries.pop(key, None) is not None
+
+    def due_at(self, key: str) -> float | None:
+        with self._condition:
+            entry = self._entries.get(key)
+            return None if entry is None else self.to_wall_time(entry[0])
+
+    def to_wall_time(self, due: float) -> float:
+        return time.time() + (due - time.monotonic())
+
+    def compact(self) -> None:
+        # Keeps memory in line with the number of live alarms, however many
+        # times they are snoozed or removed
+        if len(self._heap) <= 2 * len(self._entries) + 64:
+            return
+
+        self._heap = [(due, seq, key) for key, (due, seq) in self._entries.items()]
+        heapq.heapify(self._heap)
+
+    def pop_due(self) -> list[str]:
+        due_keys: list[str] = []
+        now = time.monotonic()
+
+        while len(self._heap) > 0 and self._heap[0][0] <= now:
+            due, seq, key = heapq.heappop(self._heap)
+            if self._entries.get(key) == (due, seq):
+                del self._entries[key]
+                due_keys.append(key)
+
+        return due_keys
+
+    def next_wait(self) -> float | None:
+        while len(self._heap) > 0:
+            due, seq, key = self._heap[0]
+            if self._entries.get(key) == (due, seq):
+                return max(0.0, due - time.monotonic())
+            heapq.heappop(self._heap)
+
+        return None
+
+    def thread_scheduler(self) -> None:
+        while True:
+            with self._condition:
+                while not self._stopped:
+                    due_keys = self.pop_due()
+                    if len(due_keys) > 0:
+                        break
+                    self._condition.wait(timeout=self.next_wait())
+
+                if self._stopped:
+                    return
+
+            # Outside the lock, so a callback can schedule the next alarm
+            for key in due_keys:
+                try:
+                    self._on_due(key)
+                except Exception as error:
+                    print(f"Warning: {Warning(error)}\nAlarm {key} could not ring")
+
+    def start(self) -> None:
+        if self.is_running:
+            return
+
+        with self._condition:
+            self._stopped = False
+
+        self._thread = threading.Thread(target=self.thread_scheduler, daemon=True)
+        self._thread.name = "MoveScheduler"
+        self._thread.start()
+
+    def stop(self) -> None:
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+            self._thread = None
@@ -0,0 +1,159 @@
+import os, random, threading
+from collections import OrderedDict
+from collections.abc import Callable
+from typing import TYPE_CHECKING
+from move_alarm.utils import api_calls
+from move_alarm.utils.bandwidth import BandwidthBudget
+from move_alarm.utils.lazy_import import lazy_import
+import move_alarm.datatypes as datatype
+
+if TYPE_CHECKING:
+    import concurrent.futures as concurrent_futures
+else:
+    concurrent_futures = lazy_import("concurrent.futures")
+
+# The themes and filters of a search, users asking for the same share sounds
+Query = tuple[tuple[str, ...], tuple[str, ...]]
+
+
+class FreesoundCache:
+    # One download folder and one HTTP pool for every user, a sound is fetched
+    # once however many users' searches find it, and never while an alarm rings
+
+    def __init__(
+        self,
+        directory: str,
+        get_token: Callable[[], str | None],
+        budget: BandwidthBudget | None = None,
+        sounds_per_query: int = 8,
+        max_queries: int = 256,
+        workers: int = 2,
+    ) -> None:
+        self.directory = directory
+        self.budget = budget
+        self.sounds_per_query = sounds_per_query
+        self.max_queries = max_queries
+        self.workers = workers
+        self._get_token = get_token
+        self._sounds: OrderedDict[Query, list[str]] = OrderedDict()
+        self._pending: set[Query] = set()
+        self._downloading: set[str] = set()
+        self._lock = threading.Lock()
+        self._executor: concurrent_futures.ThreadPoolExecutor | None = None
+
+        os.makedirs(directory, exist_ok=True)
+
+    def __len__(self) -> int:
+        return len(self._sounds)
+
+    def query(self, themes: list[str], filters: datatype.SoundFilters) -> Query:
+        return tuple(sorted(themes)), tuple(filters.to_query())
+
+    def path_for(self, sound: datatype.SoundResultDict) -> str:
+        return os.path.join(self.directory, f"{int(sound['id'])}.wav")
+
+    def pick(self, themes: list[str], filters: datatype.SoundFilters) -> str | None:
+        query = self.query(themes, filters)
+
+        with self._lock:
+            paths = [
+                path for path in self._sounds.get(query, []) if os.path.exists(path)
+            ]
+            if query in self._sounds:
+                self._sounds[query] = paths
+                self._sounds.move_to_end(query)
+
+        # Each ring adds another sound, until the query has its share
+        self.refill(themes, filters)
+
+        return random.choice(paths) if len(paths) > 0 else None
+
+    def refill(self, themes: list[str], filters: datatype.SoundFilters) -> None:
+        query = self.query(themes, filters)
+
+        if api_calls.freesound_breaker.is_open:
+            return
+
+        with self._lock:
+            if (
+                query in self._pending
+                or len(self._sounds.get(query, [])) >= self.sounds_per_query
+            ):
+                return
+
+            self._pending.add(query)
+
+            if self._executor is None:
+                self._executor = concurrent_futures.ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="MoveFreesound"
+                )
+            self._executor.submit(self.fetch, query, list(themes), filters)
+
+    def fetch(
+        self, query: Query, themes: list[str], filters: datatype.SoundFilters
+    ) -> str | None:
+        try:
+            return self.download(query, themes, filters)
+        except Exception as error:
+            print(f"Warning: {Warning(error)}\nPlaying local sounds until it works...")
+            return None
+        finally:
+            with self._lock:
+                self._pending.discard(query)
+
+    def download(
+        self, query: Query, themes: list[str], filters: datatype.SoundFilters
+    ) -> str | None:
+        token = self._get_token()
+        if token is None:
+            raise ValueError("Unexpected error: Unable to get an access token")
+
+        session = api_calls.get_session()
+        results = api_calls.search_for_sounds(
+            token, themes=themes, session=session, filters=filters
+        )
+
+        with self._lock:
+            cached = set(self._sounds.get(query, []))
+            candidates = [
+                result
+                for result in results
+                if filters.allows(result)
+                and self.path_for(result) not in cached
+                and self.path_for(result) not in self._downloading
+            ]
+            if len(candidates) == 0:
+                return None
+
+            sound = random.choice(candidates)
+            path = self.path_for(sound)
+            self._downloading.add(path)
+
+        try:
+            # Another user's search may already have fetched it
+            if not os.path.exists(path):
+                api_calls.download_sound(
+                    token,
+                    str(sound["download"]),
+                    path,
+                    budget=self.budget,
+                    session=session,
+                )
+        finally:
+            with self._lock:
+                self._downloading.discard(path)
+
+        with self._lock:
+            self._sounds.setdefault(query, []).append(path)
+            self._sounds.move_to_end(query)
+            while len(self._sounds) > self.max_queries:
+                self._sounds.popitem(last=False)
+
+        return path
+
+    def stop(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,48 @@
+import os, random, threading
+from collections import OrderedDict
+
+
+class SoundLibrary:
+    # Directory listings shared by every user, many users share a directory
+    # so each one is read once and re-read only when it changes
+
+    def __init__(self, max_directories: int = 256) -> None:
+        self.max_directories = max_directories
+        self._listings: OrderedDict[str, tuple[int, tuple[str, ...]]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._listings)
+
+    def sounds(self, directory: str) -> tuple[str, ...]:
+        stamp = os.stat(directory).st_mtime_ns
+
+        with self._lock:
+            cached = self._listings.get(directory)
+            if cached is not None and cached[0] == stamp:
+                self._listings.move_to_end(directory)
+                return cached[1]
+
+        files = tuple(
+            sorted(
+                os.path.join(directory, file)
+                for file in os.listdir(directory)
+                if file[-4:] == ".wav" and os.path.isfile(os.path.join(directory, file))
+            )
+        )
+
+        with self._lock:
+            self._listings[directory] = (stamp, files)
+            self._listings.move_to_end(directory)
+            while len(self._listings) > self.max_directories:
+                self._listings.popitem(last=False)
+
+        return files
+
+    def pick(self, directory: str) -> str | None:
+        files = self.sounds(directory)
+
+        if len(files) == 0:
+            return None
+
+        return random.choice(files)
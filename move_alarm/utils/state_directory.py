@@ -0,0 +1,18 @@
+import os, sys
+
+
+def state_directory() -> str:
+    # Per user and outside the package, which may be read-only or shared.
+    # Only the path, the directory is made by whatever first locks a file in it
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser(
+            os.path.join("~", "AppData", "Local")
+        )
+    elif sys.platform == "darwin":
+        base = os.path.expanduser(os.path.join("~", "Library", "Application Support"))
+    else:
+        base = os.environ.get("XDG_STATE_HOME") or os.path.expanduser(
+            os.path.join("~", ".local", "state")
+        )
+
+    return os.path.join(base, "move-alarm")
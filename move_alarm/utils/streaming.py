@@ -0,0 +1,252 @@
+from __future__ import annotations
+import struct, threading, time
+from typing import TYPE_CHECKING
+from move_alarm.utils.integrity import MAX_HEADER_SIZE, PCM_FORMATS
+from move_alarm.utils.lazy_import import lazy_import
+import move_alarm.datatypes as datatype
+
+if TYPE_CHECKING:
+    import simpleaudio as sa  # type: ignore
+else:
+    sa = lazy_import("simpleaudio")
+
+
+def parse_wav_header(
+    header: bytes,
+) -> tuple[datatype.WavFormat, int, int | None] | None:
+    if len(header) < 12:
+        return None
+
+    if header[0:4] != b"RIFF" or header[8:12] != b"WAVE":
+        raise datatype.InvalidSoundError(f"Not a WAV file: {header[0:16]!r}")
+
+    wav_format: datatype.WavFormat | None = None
+    offset = 12
+
+    while offset + 8 <= len(header):
+        chunk_id = header[offset : offset + 4]
+        (chunk_size,) = struct.unpack("<I", header[offset + 4 : offset + 8])
+
+        if chunk_id == b"fmt ":
+            if offset + 24 > len(header):
+                return None
+
+            audio_format, channels, sample_rate = struct.unpack(
+                "<HHI", header[offset + 8 : offset + 16]
+            )
+            (bits,) = struct.unpack("<H", header[offset + 22 : offset + 24])
+
+            if audio_format not in PCM_FORMATS:
+                raise datatype.InvalidSoundError(
+                    f"Not PCM audio (format {audio_format})"
+                )
+
+            wav_format = datatype.WavFormat(channels, bits // 8, sample_rate)
+
+        elif chunk_id == b"data":
+            if wav_format is None:
+                raise datatype.InvalidSoundError("WAV data chunk before its fmt chunk")
+
+            # Streamed WAVs may not know their length, their data runs to the end
+            data_size = None if chunk_size in (0, 0xFFFFFFFF) else chunk_size
+            return wav_format, offset + 8, data_size
+
+        offset += 8 + chunk_size + (chunk_size % 2)
+
+    if len(header) >= MAX_HEADER_SIZE:
+        raise datatype.InvalidSoundError(
+            f"No data chunk in the first {MAX_HEADER_SIZE} bytes"
+        )
+
+    return None
+
+
+class StreamingPlayback:
+    # Seconds of audio to buffer before the first note plays
+    initial_buffer: float = 0.25
+    # Seconds before the queued audio runs out that the next segment is queued,
+    # waiting on wait_done instead leaves a gap as it polls and the device reopens
+    queue_ahead: float = 0.05
+
+    @property
+    def wav_format(self) -> datatype.WavFormat | None:
+        return self._format
+
+    @property
+    def error(self) -> BaseException | None:
+        return self._error
+
+    @property
+    def received(self) -> int:
+        return self._received
+
+    def __init__(self, initial_buffer: float | None = None) -> None:
+        if initial_buffer is not None:
+            self.initial_buffer = initial_buffer
+
+        self._condition = threading.Condition()
+        self._header = bytearray()
+        self._pcm = bytearray()
+        self._format: datatype.WavFormat | None = None
+        self._data_remaining: int | None = None
+        self._received = 0
+        self._finished = False
+        self._stopped = False
+        self._started = False
+        self._error: BaseException | None = None
+        self._play_objects: list[sa.PlayObject] = []
+        self._thread: threading.Thread | None = None
+
+    def feed(self, offset: int, chunk: bytes) -> None:
+        with self._condition:
+            if self._finished or offset + len(chunk) <= self._received:
+                return
+
+            # A restarted download sends bytes we already have again
+            chunk = chunk[max(0, self._received - offset) :]
+            self._received += len(chunk)
+
+            if self._format is None:
+                self._header += chunk
+                try:
+                    parsed = parse_wav_header(bytes(self._header))
+                except datatype.InvalidSoundError as error:
+                    self._fail(error)
+                    return
+
+                if parsed is None:
+                    return
+
+                self._format, data_offset, self._data_remaining = parsed
+                chunk = bytes(self._header[data_offset:])
+                self._header = bytearray()
+
+            if self._data_remaining is not None:
+                chunk = chunk[: self._data_remaining]
+                self._data_remaining -= len(chunk)
+
+            self._pcm += chunk
+
+            if len(self._pcm) >= self.initial_bytes() or self._data_remaining == 0:
+                self.start_playing()
+
+            self._condition.notify_all()
+
+    def finish(self) -> None:
+        with self._condition:
+            if self._format is None and self._error is None:
+                self._fail(
+                    datatype.InvalidSoundError("Stream ended before the WAV header")
+                )
+                return
+
+            self._finished = True
+            self.start_playing()
+            self._condition.notify_all()
+
+    def fail(self, error: BaseException) -> None:
+        with self._condition:
+            self._fail(error)
+
+    def _fail(self, error: BaseException) -> None:
+        self._error = error
+        self._finished = True
+        self._condition.notify_all()
+
+    def initial_bytes(self) -> int:
+        if self._format is None:
+            return 0
+
+        size = int(self._format.bytes_per_second * self.initial_buffer)
+        return max(self._format.block_align, size - size % self._format.block_align)
+
+    def start_playing(self) -> None:
+        if self._thread is None and not self._stopped:
+            self._thread = threading.Thread(target=self.play_segments, daemon=True)
+            self._thread.name = "MoveStream"
+            self._thread.start()
+
+    def wait_started(self, timeout: float | None = None) -> bool:
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self._started or self._finished, timeout=timeout
+            )
+            return self._thread is not None
+
+    def play_segments(self) -> None:
+        # When the audio queued so far runs out, by the monotonic clock
+        ends_at: float | None = None
+
+        while True:
+            with self._condition:
+                if ends_at is not None:
+                    self._condition.wait_for(
+                        lambda: self._stopped,
+                        timeout=max(0.0, ends_at - self.queue_ahead - time.monotonic()),
+                    )
+
+                self._condition.wait_for(
+                    lambda: self._stopped
+                    or self._finished
+                    or len(self._pcm) >= self.initial_bytes()
+                )
+
+                if self._stopped or self._format is None:
+                    break
+
+                # Only whole frames, a split frame would swap the channels
+                end = len(self._pcm) - len(self._pcm) % self._format.block_align
+                if end == 0:
+                    break
+
+                # Everything buffered goes in one segment, so a download that
+                # keeps ahead of playback has as few joins as possible
+                segment = bytes(self._pcm[:end])
+                del self._pcm[:end]
+
+                play_object = sa.play_buffer(
+                    segment,
+                    self._format.channels,
+                    self._format.sample_width,
+                    self._format.sample_rate,
+                )
+                self._play_objects = [
+                    playing for playing in self._play_objects if playing.is_playing()
+                ] + [play_object]
+
+                now = time.monotonic()
+                ends_at = max(now, ends_at or now) + (
+                    len(segment) / self._format.bytes_per_second
+                )
+                self._started = True
+                self._condition.notify_all()
+
+        with self._condition:
+            play_objects = [] if self._stopped else list(self._play_objects)
+
+        for play_object in play_objects:
+            play_object.wait_done()
+
+        with self._condition:
+            self._play_objects = []
+            self._condition.notify_all()
+
+    def is_playing(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def wait_done(self) -> None:
+        with self._condition:
+            self._condition.wait_for(lambda: self._finished or self._thread is not None)
+
+        if self._thread is not None:
+            self._thread.join()
+
+    def stop(self) -> None:
+        with self._condition:
+            self._stopped = True
+            self._finished = True
+            play_objects = list(self._play_objects)
+            self._condition.notify_all()
+
+        for play_object in play_objects:
+            play_object.stop()
@@ -0,0 +1,40 @@
+import json, os
+from move_alarm.utils.atomic_file import write_atomic
+from move_alarm.utils.file_lock import FileLock
+
+
+class TokenStore:
+    # .env keeps its three keys, the shared access token lives beside it
+
+    def __init__(self, env_path: str) -> None:
+        self.env_path = env_path
+        self.token_path = env_path + ".token"
+        self.lock = FileLock(env_path + ".lock")
+
+    def write_env(self, client_id: str, state: str, refresh_token: str) -> None:
+        write_atomic(
+            self.env_path,
+            f"CLIENT_ID={client_id}\n"
+            + f"CLIENT_STATE={state}\n"
+            + f"REFRESH_TOKEN={refresh_token}",
+            permissions=0o600,
+        )
+
+    def read_access_token(self) -> tuple[str, float] | None:
+        try:
+            with open(self.token_path) as file:
+                shared = json.load(file)
+            return str(shared["access_token"]), float(shared["expires_at"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def write_access_token(self, access_token: str, expires_at: float) -> None:
+        write_atomic(
+            self.token_path,
+            json.dumps({"access_token": access_token, "expires_at": expires_at}),
+            permissions=0o600,
+        )
+
+    def clear_access_token(self) -> None:
+        if os.path.exists(self.token_path):
+            os.remove(self.token_path)